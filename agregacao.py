@@ -0,0 +1,200 @@
+import datetime
+
+import numpy as np
+
+# Constantes globais - atualizadas para a lógica de 2019 (Sem o 7011 e 7012)
+CODIGOS_IPREM = frozenset({"5001", "6013", "6017", "PREV", "RPPS"})
+CODIGOS_HSPM = frozenset({"5101", "6015", "HSPM"})
+
+# Até 2018 o 7012 compõe o IPREM e o 7011 o HSPM; a partir de 2019 viram FUNPREV e FUNFIN
+CODIGO_FUNFIN = "7011"
+CODIGO_FUNPREV = "7012"
+ANO_REFORMA = 2019
+
+# Colunas da matriz de totais (em centavos)
+COL_VENC, COL_DESC, COL_IPREM, COL_HSPM, COL_FUNFIN, COL_FUNPREV = range(6)
+
+# Quantidade de lotes parciais acumulados antes de fundir os totais
+LOTES_ANTES_DE_COMPACTAR = 32
+
+# A competência ocupa os 6 dígitos menos significativos da chave de grupo: AAAAMM
+_FATOR_CHAVE = 1_000_000
+
+def ultimo_dia_mes(ano, mes):
+    nxt = datetime.datetime(ano, mes, 28) + datetime.timedelta(days=4)
+    return nxt - datetime.timedelta(days=nxt.day)
+
+class AgregadorMensal:
+    """
+    Agregação mensal de todo o Detail em uma única passada colunar.
+
+    Os registros são agrupados por (Processo + RF, ano, mês) e os seis totais
+    (venc, desc, IPREM, HSPM, FUNFIN, FUNPREV) são somados de uma vez em centavos
+    inteiros. Os lotes podem ser adicionados aos poucos: cada lote é reduzido aos
+    seus totais por grupo antes de ser acumulado.
+    """
+    def __init__(self):
+        self._ids_chave = {}
+        self._erros = {}
+        self._grupos = []
+        self._totais = []
+
+    def _id_chave(self, chave):
+        id_chave = self._ids_chave.get(chave)
+        if id_chave is None:
+            id_chave = self._ids_chave[chave] = len(self._ids_chave)
+        return id_chave
+
+    def registrar_erro(self, chave, motivo):
+        self._id_chave(chave)
+        self._erros.setdefault(chave, motivo)
+
+    def adicionar(self, registros):
+        """Acumula um lote de registros Detail decodificados."""
+        chaves, posicoes = [], {}
+        inversos, competencias, codigos, venc, desc = [], [], [], [], []
+        for r in registros:
+            if not (r.ano.isdigit() and r.mes.isdigit()):
+                self.registrar_erro(r.chave, f"Competência inválida: '{r.ano}{r.mes}'")
+                continue
+            if r.dif_venc is None or r.dif_desc is None:
+                self.registrar_erro(r.chave, f"Valor inválido no código {r.codigo} ({r.mes}/{r.ano})")
+                continue
+            pos = posicoes.get(r.chave)
+            if pos is None:
+                pos = posicoes[r.chave] = len(chaves)
+                chaves.append(r.chave)
+            inversos.append(pos)
+            competencias.append(int(r.ano) * 100 + int(r.mes))
+            codigos.append(r.codigo)
+            venc.append(r.dif_venc)
+            desc.append(r.dif_desc)
+
+        if chaves:
+            self.adicionar_colunas(
+                chaves, np.array(inversos, dtype=np.int64), np.array(competencias, dtype=np.int64),
+                np.array(codigos, dtype="U4"), np.array(venc, dtype=np.int64), np.array(desc, dtype=np.int64)
+            )
+
+    def adicionar_colunas(self, chaves, inversos, competencias, codigos, venc, desc):
+        """
+        Reduz um lote já em formato colunar (arrays NumPy de mesmo tamanho).
+        chaves: lista de Processo + RF do lote; inversos: posição de cada linha em chaves.
+        """
+        ids_chave = np.array([self._id_chave(c) for c in chaves], dtype=np.int64)[inversos]
+        ano = competencias // 100
+        antes_reforma = ano < ANO_REFORMA
+
+        # Regras de classificação aplicadas como máscaras vetoriais
+        eh_funfin = codigos == CODIGO_FUNFIN
+        eh_funprev = codigos == CODIGO_FUNPREV
+        m_iprem = np.isin(codigos, list(CODIGOS_IPREM)) | (eh_funprev & antes_reforma)
+        m_hspm = np.isin(codigos, list(CODIGOS_HSPM)) | (eh_funfin & antes_reforma)
+        m_funfin = eh_funfin & ~antes_reforma
+        m_funprev = eh_funprev & ~antes_reforma
+
+        valores = np.column_stack((
+            venc, desc, desc * m_iprem, desc * m_hspm, desc * m_funfin, desc * m_funprev
+        ))
+        self._reduzir(ids_chave * _FATOR_CHAVE + competencias, valores)
+        if len(self._grupos) > LOTES_ANTES_DE_COMPACTAR:
+            self._compactar()
+
+    def _reduzir(self, grupos, valores):
+        ordem = np.argsort(grupos, kind="stable")
+        grupos = grupos[ordem]
+        inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+        self._grupos.append(grupos[inicios])
+        self._totais.append(np.add.reduceat(valores[ordem], inicios, axis=0))
+
+    def _compactar(self):
+        """Funde os totais parciais dos lotes: a memória fica proporcional ao número de grupos."""
+        if len(self._grupos) > 1:
+            grupos = np.concatenate(self._grupos)
+            totais = np.concatenate(self._totais)
+            self._grupos, self._totais = [], []
+            self._reduzir(grupos, totais)
+
+    def resultado(self):
+        """Encerra a agregação e retorna um ResultadoMensal."""
+        self._compactar()
+        if self._grupos:
+            grupos, totais = self._grupos[0], self._totais[0]
+        else:
+            grupos, totais = np.empty(0, dtype=np.int64), np.empty((0, 6), dtype=np.int64)
+
+        chaves = list(self._ids_chave)
+        erros = dict(self._erros)
+
+        # A data de cada competência é calculada uma única vez; meses inválidos invalidam o RF
+        datas = {}
+        competencias = grupos % _FATOR_CHAVE
+        for competencia in np.unique(competencias).tolist():
+            try:
+                datas[competencia] = ultimo_dia_mes(competencia // 100, competencia % 100)
+            except ValueError as e:
+                for id_chave in np.unique(grupos[competencias == competencia] // _FATOR_CHAVE).tolist():
+                    erros.setdefault(chaves[id_chave], str(e))
+        return ResultadoMensal(chaves, grupos, totais, datas, erros)
+
+class ResultadoMensal:
+    """
+    Totais mensais de todos os RFs em formato compacto (arrays ordenados por RF e competência).
+    As linhas de cada RF (rows_data) só são montadas quando solicitadas.
+    """
+    def __init__(self, chaves, grupos, totais, datas, erros):
+        self._ids_chave = {c: i for i, c in enumerate(chaves)}
+        self._grupos = grupos
+        self._totais = totais
+        self._datas = datas
+        # Processo + RF -> motivo pelo qual o RF não pode ser calculado
+        self.erros = erros
+
+    def _linha(self, grupo, tot):
+        t_venc = tot[COL_VENC] / 100.0
+        t_desc = tot[COL_DESC] / 100.0
+        v_iprem = tot[COL_IPREM] / 100.0
+        v_hspm = tot[COL_HSPM] / 100.0
+        return {
+            'dt': self._datas[grupo % _FATOR_CHAVE],
+            'q': (t_venc - t_desc) + v_iprem + v_hspm,
+            'iprem': v_iprem,
+            'hspm': v_hspm,
+            'funfin': tot[COL_FUNFIN] / 100.0,
+            'funprev': tot[COL_FUNPREV] / 100.0
+        }
+
+    def linhas(self, chave):
+        """Linhas mensais (rows_data) do Processo + RF em ordem de competência."""
+        id_chave = self._ids_chave.get(chave)
+        if id_chave is None or chave in self.erros:
+            return []
+        a, b = np.searchsorted(self._grupos, [id_chave * _FATOR_CHAVE, (id_chave + 1) * _FATOR_CHAVE])
+        return [self._linha(g, t) for g, t in zip(self._grupos[a:b].tolist(), self._totais[a:b].tolist())]
+
+    def tamanho(self):
+        """Tamanho aproximado (bytes) do resultado em memória."""
+        return self._grupos.nbytes + self._totais.nbytes + 200 * (len(self._ids_chave) + len(self.erros))
+
+    def colunas(self):
+        """
+        Totais de todos os RFs calculados em formato colunar, ordenados por RF e competência:
+        (chaves, posição da chave de cada linha, competências AAAAMM, totais em centavos).
+        """
+        ids = self._grupos // _FATOR_CHAVE
+        chaves = list(self._ids_chave)
+        calculados = np.array([c not in self.erros for c in chaves], dtype=bool)
+        validas = calculados[ids] if len(ids) else np.empty(0, dtype=bool)
+        return chaves, ids[validas], self._grupos[validas] % _FATOR_CHAVE, self._totais[validas]
+
+    def itens(self):
+        """Gera (Processo + RF, rows_data) para todos os RFs calculados."""
+        for chave in self._ids_chave:
+            if chave not in self.erros:
+                yield chave, self.linhas(chave)
+
+def agregar_mensal(registros):
+    """Agrega todo o Detail de uma vez e retorna o ResultadoMensal. Atalho para AgregadorMensal."""
+    agregador = AgregadorMensal()
+    agregador.adicionar(registros)
+    return agregador.resultado()
@@ -1,38 +1,36 @@
 import os
 import sys
 import datetime
-import tempfile
 import warnings
 import subprocess
 import base64
 from pathlib import Path
-import concurrent.futures
 import multiprocessing
-from collections import defaultdict
 
 import streamlit as st
 
-from access import gerar_mdb_access
-# IMPORTANTE: extrair_info_template foi removido daqui pois agora vive dentro do trabalhador
-from excel import processar_arquivo_isolado
+from pipeline import (
+    ROTINAS_DISPONIVEIS, FORMATOS_DISPONIVEIS, FORMATO_PARQUET, FORMATO_CONSOLIDADO, MOTORES_EXCEL, MOTOR_OPENPYXL, BANCOS, BANCO_ACCESS, resource_path, caminhos_templates, executar_lote, workers_padrao
+)
+from entradas import Entrada, descobrir_entradas
+from trabalhadores import PoolTrabalhadores
+from execucoes import EXECUTANDO, CANCELADA, FALHOU, GerenciadorExecucoes
 
 # Omissão de avisos não críticos gerados por reexecuções dinâmicas do Streamlit
 warnings.filterwarnings("ignore", message=".*missing ScriptRunContext.*")
 warnings.filterwarnings("ignore", message=".*Process.*finalized.*")
 
+# Intervalo (s) entre as atualizações do andamento na página
+INTERVALO_ANDAMENTO_TELA = 1.0
+
 # Força o método de inicialização 'spawn' no Windows para evitar travamentos de concorrência
 if sys.platform == "win32":
     multiprocessing.set_start_method("spawn", force=True)
 
 # --- Utilitários ---
-def resource_path(relative_path):
-    try:
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
-
+@st.cache_data(show_spinner=False)
 def get_base64_image(image_path):
+    """OTIMIZAÇÃO: lido e codificado uma única vez, e não a cada rerun do script."""
     caminho_completo = resource_path(image_path)
     if not os.path.exists(caminho_completo):
         return ""
@@ -92,7 +90,73 @@ def limpar_tudo():
     st.session_state.uploader_key += 1
     st.session_state.resultado_processamento = None
     st.session_state.dir_saida = ""
+    st.session_state.lote_origem = ""
     st.session_state.processando = False
+    st.session_state.zip_preparado = None
+    # Uma execução em andamento continua sendo acompanhada
+    if obter_gerenciador().em_andamento() is None:
+        st.query_params.clear()
+
+def descartar_download_zip():
+    st.session_state.zip_preparado = None
+
+def exibir_avisos(avisos):
+    for ok, mensagem in avisos:
+        if not ok: st.warning(f"⚠️ {mensagem}")
+        else: st.success(f"✅ {mensagem}")
+
+def exibir_perfil(perfil):
+    if perfil['etapas']:
+        st.table([{"Etapa": nome, "Segundos": f"{seg:.2f}"} for nome, seg in perfil['etapas'].items()])
+    if perfil['planilhas']:
+        st.markdown("**Planilhas (por RF, em segundos)**")
+        st.table([
+            {"Etapa": nome, "p50": est['p50'], "p95": est['p95'], "Máximo": est['max'], "Total": est['total']}
+            for nome, est in perfil['planilhas'].items()
+        ])
+    if perfil['trabalhadores']:
+        st.markdown("**Trabalhadores**")
+        st.table([
+            {"PID": pid, "RFs": est['rfs'], "p50": est['p50'], "p95": est['p95'], "Máximo": est['max'], "Total": est['total']}
+            for pid, est in perfil['trabalhadores'].items()
+        ])
+    for amostra in perfil['amostras']:
+        st.caption(f"🔬 {amostra['arquivo']} — {amostra['segundos']:.2f}s, pico {amostra['pico_memoria_kb']} KB")
+
+@st.fragment(run_every=INTERVALO_ANDAMENTO_TELA)
+def acompanhar_execucao(id_execucao):
+    """
+    Andamento da execução em segundo plano, redesenhado a cada INTERVALO_ANDAMENTO_TELA sem
+    rerun da página. Quando a execução termina, a página é redesenhada com o resumo.
+    """
+    execucao = obter_gerenciador().obter(id_execucao)
+    if execucao is None:
+        return
+    situacao = execucao.situacao()
+    if situacao['estado'] != EXECUTANDO:
+        st.rerun()
+    st.info(f"▶️ **Processamento iniciado às:** `{execucao.inicio.strftime('%H:%M:%S')}` "
+            f"({int(situacao['segundos'])}s)")
+    st.progress(situacao['percentual'])
+    st.info(situacao['mensagem'] or "📂 Iniciando...")
+    exibir_avisos(situacao['avisos'])
+    with st.expander("⏱️ Tempo das Etapas (parcial)", expanded=True):
+        exibir_perfil(situacao['perfil'])
+
+@st.cache_resource(show_spinner=False)
+def obter_gerenciador():
+    """Gerenciador único para todas as sessões: as execuções sobrevivem aos reruns e ao refresh da página."""
+    return GerenciadorExecucoes()
+
+@st.cache_resource(show_spinner=False)
+def obter_pool():
+    """
+    Pool de processos único para todas as sessões e reruns.
+    OTIMIZAÇÃO: criado na primeira renderização, já sobe os trabalhadores com o template carregado.
+    """
+    _, p_tpl_xls = caminhos_templates()
+    # Sobe aquecido só com o motor padrão: o outro é importado pelo trabalhador na primeira execução que o usar
+    return PoolTrabalhadores(workers_padrao(), p_tpl_xls, (MOTOR_OPENPYXL,))
 
 # --- Configuração Base de UI ---
 st.set_page_config(
@@ -102,10 +166,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+obter_pool()
+
 b64_access = get_base64_image(os.path.join("icons", "msaccess.jpg"))
-b64_file_open = get_base64_image(os.path.join("icons", "file_open.png"))
 
-custom_css = """
+@st.cache_data(show_spinner=False)
+def montar_css():
+    """CSS da página, com o ícone do upload embutido: montado uma única vez, e não a cada rerun."""
+    b64_file_open = get_base64_image(os.path.join("icons", "file_open.png"))
+
+    custom_css = """
 <style>
     #MainMenu {visibility: hidden;}
     footer {visibility: hidden;}
@@ -122,13 +192,15 @@ custom_css = """
     [data-testid="stFileUploadDropzone"] > div > div::after, [data-testid="stFileUploaderDropzone"] > div > div::after { content: "Limite de 500MB por arquivo • TXT" !important; color: #888 !important; font-size: 14px !important; display: block !important; }
 """
 
-if b64_file_open:
-    custom_css += f"""
+    if b64_file_open:
+        custom_css += f"""
     [data-testid="stFileUploadDropzone"] button p, [data-testid="stFileUploaderDropzone"] button p {{ display: none !important; }}
     [data-testid="stFileUploadDropzone"] button, [data-testid="stFileUploaderDropzone"] button {{ background-image: url("data:image/png;base64,{b64_file_open}") !important; background-size: 20px !important; background-position: center !important; background-repeat: no-repeat !important; color: transparent !important; width: 60px !important; margin: 0 auto !important; }}
     """
-custom_css += "</style>"
-st.markdown(custom_css, unsafe_allow_html=True)
+    custom_css += "</style>"
+    return custom_css
+
+st.markdown(montar_css(), unsafe_allow_html=True)
 
 # --- Gerenciamento de Estado da Sessão ---
 if "rotina_selecionada" not in st.session_state: st.session_state.rotina_selecionada = "SJ230133"
@@ -136,15 +208,59 @@ if "processando" not in st.session_state: st.session_state.processando = False
 if "resultado_processamento" not in st.session_state: st.session_state.resultado_processamento = None
 if "dir_saida" not in st.session_state: st.session_state.dir_saida = ""
 if "uploader_key" not in st.session_state: st.session_state.uploader_key = 0
+if "motor_excel" not in st.session_state: st.session_state.motor_excel = MOTOR_OPENPYXL
+if "banco" not in st.session_state: st.session_state.banco = BANCO_ACCESS
+if "exportar_parquet" not in st.session_state: st.session_state.exportar_parquet = False
+if "exportar_consolidado" not in st.session_state: st.session_state.exportar_consolidado = False
+if "amostra_perfil" not in st.session_state: st.session_state.amostra_perfil = 0
+if "saida_zip" not in st.session_state: st.session_state.saida_zip = False
+if "zip_preparado" not in st.session_state: st.session_state.zip_preparado = None
+if "modo_entrada" not in st.session_state: st.session_state.modo_entrada = "Arquivo Único"
+if "lote_origem" not in st.session_state: st.session_state.lote_origem = ""
 
 # --- Renderização Sidebar ---
 st.sidebar.markdown("## ⚙️ Configuração")
-rotinas_disponiveis = ["SJ230133", "SJ071984"]
+rotinas_disponiveis = ROTINAS_DISPONIVEIS
 st.session_state.rotina_selecionada = st.sidebar.selectbox(
     "Selecione a Rotina:",
     options=rotinas_disponiveis,
     index=rotinas_disponiveis.index(st.session_state.rotina_selecionada)
 )
+motores_excel = list(MOTORES_EXCEL)
+st.session_state.motor_excel = st.sidebar.selectbox(
+    "Motor das Planilhas:",
+    options=motores_excel,
+    index=motores_excel.index(st.session_state.motor_excel),
+    help="xml: escreve as planilhas direto no XML do template, sem o openpyxl (mais rápido)."
+)
+bancos = list(BANCOS)
+st.session_state.banco = st.sidebar.selectbox(
+    "Banco de Dados:",
+    options=bancos,
+    index=bancos.index(st.session_state.banco),
+    help="access requer o driver ODBC do Windows; sqlite e duckdb geram o banco em qualquer sistema."
+)
+st.session_state.exportar_parquet = st.sidebar.checkbox(
+    "Exportar Parquet",
+    value=st.session_state.exportar_parquet,
+    help="Grava também o Detail e as linhas mensais de cada RF em Parquet, para análise."
+)
+st.session_state.exportar_consolidado = st.sidebar.checkbox(
+    "Planilha Consolidada",
+    value=st.session_state.exportar_consolidado,
+    help="Grava também DDV_Consolidado.xlsx na saída: uma linha por RF e competência, com subtotais por processo."
+)
+st.session_state.saida_zip = st.sidebar.checkbox(
+    "Planilhas em um único ZIP",
+    value=st.session_state.saida_zip,
+    help="Grava as planilhas em ddv_planilhas.zip na saída, com a mesma estrutura de pastas, e libera o download pela página."
+)
+st.session_state.amostra_perfil = st.sidebar.number_input(
+    "RFs Perfilados (cProfile):",
+    min_value=0, max_value=100, step=1,
+    value=st.session_state.amostra_perfil,
+    help="Gera os RFs de uma amostra com cProfile e tracemalloc; os arquivos .prof ficam em ddv_perfis na saída."
+)
 
 # --- Renderização Principal ---
 if b64_access:
@@ -155,17 +271,44 @@ else:
 st.markdown('<div class="subtitle">Demonstrativo de Diferença de Vencimentos</div>', unsafe_allow_html=True)
 
 st.markdown("## 📁 Etapa 1: Seleção de Arquivos")
-col1, col2 = st.columns(2)
+st.radio(
+    "Entrada:", ["Arquivo Único", "Lote"], key="modo_entrada", horizontal=True,
+    help="Lote: vários pares Header/Detail de uma pasta (PROCESSO_F.txt / PROCESSO_V.txt) ou de uma lista "
+         "(header;detail[;indices[;rotina]] por linha), processados em uma única execução."
+)
+modo_lote = st.session_state.modo_entrada == "Lote"
+file_header = file_detail = None
+entradas_lote = []
+
+if modo_lote:
+    st.markdown("### Pasta ou Lista de Pares")
+    st.text_input("Caminho da pasta ou do arquivo de lista:", key="lote_origem")
+    if st.session_state.lote_origem:
+        try:
+            # Os pares sem índices próprios recebem o arquivo de índices selecionado abaixo
+            entradas_lote = descobrir_entradas(st.session_state.lote_origem, st.session_state.rotina_selecionada)
+            st.success(f"✅ {len(entradas_lote)} par(es) Header/Detail encontrados")
+            st.table([
+                {"Nome": e.nome, "Header": os.path.basename(e.fonte_header), "Detail": os.path.basename(e.fonte_detail),
+                 "Índices": os.path.basename(e.fonte_indices) if e.fonte_indices else "—", "Rotina": e.rotina}
+                for e in entradas_lote
+            ])
+        except (OSError, ValueError) as e:
+            st.error(f"❌ {str(e)}")
+else:
+    col1, col2 = st.columns(2)
 
-with col1:
-    st.markdown("### Arquivo Header (TXT)")
-    file_header = st.file_uploader("Selecione o arquivo Header:", key=f"header_file_{st.session_state.uploader_key}")
-    if file_header: st.success(f"✅ {file_header.name}")
+    with col1:
+        st.markdown("### Arquivo Header (TXT)")
+        file_header = st.file_uploader("Selecione o arquivo Header:", key=f"header_file_{st.session_state.uploader_key}")
+        if file_header: st.success(f"✅ {file_header.name}")
 
-with col2:
-    st.markdown("### Arquivo Detail (TXT)")
-    file_detail = st.file_uploader("Selecione o arquivo Detail:", key=f"detail_file_{st.session_state.uploader_key}")
-    if file_detail: st.success(f"✅ {file_detail.name}")
+    with col2:
+        st.markdown("### Arquivo Detail (TXT)")
+        file_detail = st.file_uploader("Selecione o arquivo Detail:", key=f"detail_file_{st.session_state.uploader_key}")
+        if file_detail: st.success(f"✅ {file_detail.name}")
+
+is_valid = bool(entradas_lote) if modo_lote else file_header is not None and file_detail is not None
 
 st.markdown("---")
 col3, col4 = st.columns(2)
@@ -177,8 +320,8 @@ with col3:
 
 with col4:
     st.markdown("### 📁 Diretório de Saída")
-    if file_header and file_detail:
-        nome_base = Path(file_header.name).stem
+    if is_valid:
+        nome_base = Path(st.session_state.lote_origem).stem if modo_lote else Path(file_header.name).stem
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         nome_saida = f"{nome_base}_{timestamp}"
         diretorio_base_desktop = str(Path.home() / "Desktop" / "DDV_Output" / nome_saida)
@@ -195,159 +338,91 @@ with col4:
                 st.button("📁 Procurar", key="btn_browse_dir", on_click=on_browse_click, use_container_width=True)
     else:
         st.markdown("<div style='font-size: 14px; margin-bottom: 4px;'>&nbsp;</div>", unsafe_allow_html=True)
-        st.warning("⚠️ Selecione os arquivos Header e Detail para definir o diretório de saída.")
+        st.warning("⚠️ Selecione os arquivos Header e Detail (ou o lote) para definir o diretório de saída.")
         st.session_state.dir_saida = str(Path.home() / "Desktop" / "DDV_Output")
 
 # --- Estrutura de Controles ---
 st.markdown("## ⚙️ Etapa 2: Processamento")
 
-is_valid = file_header is not None and file_detail is not None
-if not is_valid:
-    st.warning("⚠️ Você precisa selecionar ao menos os arquivos Header e Detail para continuar.")
+# OTIMIZAÇÃO: a execução roda em segundo plano (ver execucoes.py) e o id fica na URL: interações
+# com a página não a interrompem e um refresh do navegador volta a acompanhá-la
+execucao = obter_gerenciador().obter(st.query_params.get("execucao"))
+st.session_state.processando = execucao is not None and execucao.ativa()
+
+if not is_valid and not st.session_state.processando:
+    st.warning("⚠️ Você precisa selecionar ao menos os arquivos Header e Detail (ou um lote) para continuar.")
 
 col_btn1, col_btn2, col_btn3 = st.columns([2, 1, 1])
 
 with col_btn1:
-    btn_processar = st.button("🚀 PROCESSAR TUDO", type="primary", use_container_width=True, disabled=not is_valid)
+    btn_processar = st.button("🚀 PROCESSAR TUDO", type="primary", use_container_width=True,
+                              disabled=not is_valid or st.session_state.processando)
 with col_btn2:
-    btn_cancelar = st.button("🛑 CANCELAR", type="primary", use_container_width=True, disabled=not is_valid)
+    btn_cancelar = st.button("🛑 CANCELAR", type="primary", use_container_width=True,
+                             disabled=not st.session_state.processando)
 with col_btn3:
     btn_limpar = st.button("🧹 LIMPAR TUDO", type="secondary", use_container_width=True, on_click=limpar_tudo)
 
-if btn_cancelar:
-    st.warning("⚠️ Processamento cancelado pelo usuário.")
-    st.session_state.resultado_processamento = None
-    st.session_state.processando = False
+if btn_cancelar and execucao is not None:
+    execucao.cancelar()
+    st.warning("⚠️ Cancelamento solicitado. Os arquivos parciais serão removidos.")
 
 # --- Core de Processamento ---
 if btn_processar:
-    st.session_state.processando = True
     try:
-        tempo_inicio = datetime.datetime.now()
-        hora_inicio_str = tempo_inicio.strftime("%H:%M:%S")
-        
         diretorio_final = st.session_state.dir_saida
         os.makedirs(diretorio_final, exist_ok=True)
-        
-        st.info(f"▶️ **Processamento iniciado às:** `{hora_inicio_str}`")
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_header = os.path.join(temp_dir, "header.txt")
-            temp_detail = os.path.join(temp_dir, "detail.txt")
-            temp_indices = os.path.join(temp_dir, "indices.txt")
-            
-            with open(temp_header, "wb") as f: f.write(file_header.getbuffer())
-            with open(temp_detail, "wb") as f: f.write(file_detail.getbuffer())
-            if file_indices:
-                with open(temp_indices, "wb") as f: f.write(file_indices.getbuffer())
-            
-            status_container = st.container()
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            with status_container:
-                status_text.info("📂 Lendo e processando dados em memória...")
-                with open(temp_header, 'r', encoding='cp1252') as f:
-                    lines_h = [l for l in f if len(l) >= 180]
-                
-                idx_list = []
-                if file_indices:
-                    with open(temp_indices, 'r', encoding='cp1252') as f:
-                        for linha in f:
-                            if len(linha) >= 8:
-                                try:
-                                    dt = datetime.datetime.strptime(linha[:8], "%Y%m%d")
-                                    val = float(linha[8:].replace(',', '.'))
-                                    idx_list.append((dt, val))
-                                except (ValueError, IndexError):
-                                    pass
-                
-                dt_lim = idx_list[-1][0] if idx_list else datetime.datetime.now()
-                
-                lines_d_valid = []
-                map_d = defaultdict(list)
-                with open(temp_detail, 'r', encoding='cp1252') as f:
-                    for l in f:
-                        if len(l) >= 120:
-                            lines_d_valid.append(l)
-                            map_d[l[:12].strip() + l[12:21].strip()].append(l)
-                
-                status_text.info("🗄️ Gerando Banco de Dados (Access)...")
-                progress_bar.progress(10)
-                
-                p_tpl_mdb = resource_path(os.path.join("Templates", "MDB-Matriz.mdb"))
-                p_tpl_xls = resource_path(os.path.join("Templates", "XLS-Matriz.xlsx"))
-                
-                if not os.path.exists(p_tpl_mdb): raise FileNotFoundError(f"Template MDB ausente: {p_tpl_mdb}")
-                if not os.path.exists(p_tpl_xls): raise FileNotFoundError(f"Template XLS ausente: {p_tpl_xls}")
-                
-                ok_mdb, msg_mdb = gerar_mdb_access(lines_h, lines_d_valid, diretorio_final, st.session_state.rotina_selecionada, p_tpl_mdb)
-                
-                if not ok_mdb: st.warning(f"⚠️ {msg_mdb}")
-                else: st.success(f"✅ {msg_mdb}")
-                
-                status_text.info("📊 Processando planilhas Excel em paralelo...")
-                progress_bar.progress(30)
-                
-                # OTIMIZAÇÃO: tpl_info removido das tarefas para evitar gargalo de Pickling/Serialização
-                tasks = [
-                    (l, p_tpl_xls, diretorio_final, st.session_state.rotina_selecionada, 
-                     idx_list, map_d.get(l[:12].strip() + l[12:21].strip(), []), dt_lim)
-                    for l in lines_h
-                ]
-                
-                tot = len(tasks)
-                done = 0
-                errs = []
-                resultados = []
-                
-                # OTIMIZAÇÃO: ProcessPoolExecutor contorna o GIL para uso máximo de múltiplos núcleos da CPU
-                exe = concurrent.futures.ProcessPoolExecutor(max_workers=max(1, multiprocessing.cpu_count() - 1))
-                futs = {}
-                try:
-                    futs = {exe.submit(processar_arquivo_isolado, t): t for t in tasks}
-                    for f in concurrent.futures.as_completed(futs):
-                        try:
-                            res = f.result()
-                            done += 1
-                            if "ERRO" in res: errs.append(res)
-                            else: resultados.append(res)
-                            
-                            progress = 30 + (int((done / tot) * 60))
-                            progress_bar.progress(progress)
-                            status_text.info(f"📊 Planilhas Excel: {done}/{tot} ({int((done/tot)*100)}%) processadas")
-                        except Exception as e:
-                            errs.append(f"Falha na alocação do processo: {str(e)}")
-                            done += 1
-                finally:
-                    for f in futs: f.cancel()
-                    exe.shutdown(wait=False)
-                
-                tempo_fim = datetime.datetime.now()
-                hora_fim_str = tempo_fim.strftime("%H:%M:%S")
-                tempo_total = tempo_fim - tempo_inicio
-                tempo_str = str(tempo_total).split('.')[0]
-                
-                progress_bar.progress(100)
-                status_text.success("✅ Processamento concluído com sucesso!")
-                
-                st.session_state.resultado_processamento = {
-                    'hora_inicio': hora_inicio_str,
-                    'hora_fim': hora_fim_str,
-                    'tempo_total': tempo_str,
-                    'sucesso': tot - len(errs),
-                    'erros': len(errs),
-                    'detalhes_erros': errs[:10],
-                    'output_dir': diretorio_final
-                }
-                
+
+        # OTIMIZAÇÃO: os uploads são lidos direto dos buffers em memória, sem cópia para arquivos temporários
+        indices_comuns = file_indices.getbuffer() if file_indices else None
+        if modo_lote:
+            entradas = [Entrada(e.fonte_header, e.fonte_detail, e.fonte_indices or indices_comuns, e.rotina, e.nome)
+                        for e in entradas_lote]
+        else:
+            entradas = [Entrada(file_header.getbuffer(), file_detail.getbuffer(), indices_comuns,
+                                st.session_state.rotina_selecionada, Path(file_header.name).stem)]
+
+        p_tpl_mdb, p_tpl_xls = caminhos_templates()
+        execucao = obter_gerenciador().iniciar(
+            executar_lote, entradas, diretorio_final, p_tpl_mdb, p_tpl_xls,
+            motor_excel=st.session_state.motor_excel, banco=st.session_state.banco,
+            formatos=FORMATOS_DISPONIVEIS + ((FORMATO_PARQUET,) if st.session_state.exportar_parquet else ())
+                     + ((FORMATO_CONSOLIDADO,) if st.session_state.exportar_consolidado else ()),
+            pool=obter_pool(), amostra_perfil=st.session_state.amostra_perfil, saida_zip=st.session_state.saida_zip
+        )
+        st.query_params["execucao"] = execucao.id
+        st.session_state.processando = True
+        st.session_state.resultado_processamento = None
+        st.session_state.zip_preparado = None
     except Exception as e:
-        if type(e).__name__ in ('ScriptControlException', 'RerunException', 'StopException'):
-            raise e
         st.error(f"❌ Erro Crítico de Execução: {str(e)}")
         st.session_state.resultado_processamento = None
-    finally:
-        st.session_state.processando = False
+
+if execucao is not None:
+    if execucao.ativa():
+        acompanhar_execucao(execucao.id)
+    else:
+        situacao = execucao.situacao()
+        exibir_avisos(situacao['avisos'])
+        if situacao['estado'] == CANCELADA:
+            st.warning("⚠️ Processamento cancelado pelo usuário. Os arquivos parciais foram removidos.")
+        elif situacao['estado'] == FALHOU:
+            st.error(f"❌ Erro Crítico de Execução: {situacao['erro']}")
+        elif (st.session_state.resultado_processamento or {}).get('id') != execucao.id:
+            res = situacao['resultado']
+            st.session_state.resultado_processamento = {
+                'id': execucao.id,
+                'hora_inicio': res['hora_inicio'],
+                'hora_fim': res['hora_fim'],
+                'tempo_total': res['tempo_total'],
+                'sucesso': res['sucesso'],
+                'erros': res['erros'],
+                'detalhes_erros': res['detalhes_erros'][:10],
+                'entradas': res['entradas'],
+                'perfil': res['perfil'],
+                'arquivo_zip': res['arquivo_zip'],
+                'output_dir': res['output_dir']
+            }
 
 # --- Renderização de Resultados ---
 if st.session_state.resultado_processamento:
@@ -371,8 +446,32 @@ if st.session_state.resultado_processamento:
         if st.button("📁 Abrir Pasta", key="btn_browse_result", type="primary", use_container_width=True):
             abrir_explorador(res['output_dir'])
             st.success("✅ Acesso concedido via Windows Explorer.")
+    if res['arquivo_zip'] and os.path.exists(res['arquivo_zip']):
+        # O st.download_button lê o arquivo inteiro para a memória do servidor a cada renderização:
+        # o botão só é montado depois de um pedido explícito e é desfeito depois do download
+        tamanho_mb = os.path.getsize(res['arquivo_zip']) / (1024 * 1024)
+        if st.session_state.zip_preparado != res['arquivo_zip']:
+            if st.button(f"📦 Preparar Download do ZIP ({tamanho_mb:.1f} MB)", use_container_width=True):
+                st.session_state.zip_preparado = res['arquivo_zip']
+                st.rerun()
+        else:
+            with open(res['arquivo_zip'], "rb") as arquivo_zip:
+                st.download_button("⬇️ Baixar Planilhas (ZIP)", arquivo_zip.read(),
+                                   file_name=os.path.basename(res['arquivo_zip']), mime="application/zip",
+                                   on_click=descartar_download_zip, use_container_width=True)
     
+    if len(res['entradas']) > 1:
+        with st.expander("📦 Pares do Lote", expanded=True):
+            st.table([
+                {"Nome": e['nome'], "Rotina": e['rotina'], "RFs": e['rfs'], "Gerados": e['sucesso'],
+                 "Reaproveitados": e['reaproveitados'], "Erros": e['erros']}
+                for e in res['entradas']
+            ])
+
     st.markdown("---")
+    with st.expander("⏱️ Tempo das Etapas"):
+        exibir_perfil(res['perfil'])
+
     if res['erros'] > 0:
         with st.expander("🔍 Rastreamento de Erros"):
             for erro in res['detalhes_erros']: st.write(f"❌ {erro}")
@@ -0,0 +1,43 @@
+"""
+Saída das planilhas em um único arquivo ZIP.
+
+Em vez de criar uma pasta por processo e um .xlsx por RF, os trabalhadores devolvem o
+conteúdo de cada planilha e o processo principal grava tudo, à medida que os lotes
+terminam, em NOME_ZIP na saída, com a mesma estrutura de pastas (data/Processo_X - CD 1/).
+O ZIP é montado em um arquivo temporário e só recebe o nome final quando a execução termina.
+"""
+import os
+import time
+import zipfile
+
+NOME_ZIP = "ddv_planilhas.zip"
+
+class SaidaZip:
+    """ZIP das planilhas em gravação: as entradas são acrescentadas uma a uma, sem manter o conteúdo em memória."""
+    def __init__(self, output_folder, nome=NOME_ZIP):
+        self.caminho = os.path.join(output_folder, nome)
+        self._temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        # OTIMIZAÇÃO: o .xlsx já é um zip compactado; armazená-lo sem recompressão não ganha espaço e poupa CPU
+        self._zip = zipfile.ZipFile(self._temporario, "w", zipfile.ZIP_STORED, allowZip64=True)
+        self.quantidade = 0
+
+    def adicionar(self, relativo, conteudo):
+        """Grava a planilha no caminho relativo (ver excel.caminho_relativo)."""
+        info = zipfile.ZipInfo(relativo.replace(os.sep, "/"), time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self._zip.writestr(info, conteudo)
+        self.quantidade += 1
+
+    def concluir(self):
+        """Fecha o ZIP e dá a ele o nome final. Retorna o caminho."""
+        self._zip.close()
+        os.replace(self._temporario, self.caminho)
+        return self.caminho
+
+    def descartar(self):
+        """Execução interrompida: o ZIP parcial é removido."""
+        self._zip.close()
+        try:
+            os.remove(self._temporario)
+        except OSError:
+            pass
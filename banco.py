@@ -0,0 +1,279 @@
+"""
+Saída em banco de dados: as tabelas Header e Detail do MDB Matriz, gravadas no Access,
+em SQLite ou em DuckDB.
+
+Cada banco usa a sua carga em lote mais rápida e cria os índices somente depois da carga.
+As colunas seguem a ordem e os nomes declarados em layout.py: texto com a largura do
+campo no Mainframe e valores monetários em ponto flutuante, como no MDB Matriz.
+"""
+import os
+import csv
+import shutil
+import sqlite3
+import tempfile
+from itertools import islice
+
+from layout import LAYOUT_HEADER, LAYOUT_DETAIL, CENTAVOS
+from cancelamento import ExecucaoCancelada
+
+# Bancos disponíveis para a etapa de banco de dados
+BANCO_ACCESS = "access"
+BANCO_SQLITE = "sqlite"
+BANCO_DUCKDB = "duckdb"
+
+# Quantidade de linhas enviadas (e confirmadas) por lote: o Detail é consumido em fluxo, sem lista completa
+TAMANHO_LOTE = 10_000
+
+# Tabelas na ordem de carga: (nome, layout)
+TABELAS = (("Header", LAYOUT_HEADER), ("Detail", LAYOUT_DETAIL))
+
+# Índices criados após a carga: (nome, tabela, colunas). Processo + RF é a chave de consulta.
+INDICES = (
+    ("IX_Header_Processo_RF", "Header", ("Processo", "RF")),
+    ("IX_Detail_Processo_RF", "Detail", ("Processo", "RF", "Data_Ref_Ano", "Data_Ref_Mes")),
+)
+
+class BancoIndisponivel(Exception):
+    """O banco não pode ser gerado nesta máquina (ex.: driver ausente)."""
+
+def _converter_para_float(centavos):
+    """Converte o valor em centavos para float com tratamento de erro."""
+    try:
+        return float(centavos) / 100.0
+    except (ValueError, TypeError):
+        return 0.0
+
+def _em_lotes(iteravel, tamanho):
+    it = iter(iteravel)
+    while True:
+        lote = list(islice(it, tamanho))
+        if not lote:
+            return
+        yield lote
+
+def _sql_insert(tabela, layout):
+    colunas = ", ".join(c.coluna for c in layout.campos)
+    marcadores = ", ".join("?" for _ in layout.campos)
+    return f"INSERT INTO {tabela} ({colunas}) VALUES ({marcadores})"
+
+def _sql_create(tabela, layout):
+    colunas = ", ".join(
+        f"{c.coluna} DOUBLE" if c.tipo == CENTAVOS else f"{c.coluna} VARCHAR({c.fim - c.inicio})"
+        for c in layout.campos
+    )
+    return f"CREATE TABLE {tabela} ({colunas})"
+
+def _linha_banco(layout, registro):
+    """Valores do registro na ordem do layout, com os centavos convertidos para float."""
+    return tuple(
+        _converter_para_float(v) if c.tipo == CENTAVOS else v
+        for c, v in zip(layout.campos, layout.colunas(registro))
+    )
+
+class _Banco:
+    """Carga das tabelas Header/Detail. As subclasses definem a conexão e a carga de cada lote."""
+    nome = None
+    extensao = None
+
+    def __init__(self, caminho, template_path):
+        self.caminho = caminho
+        self.template_path = template_path
+        self.conn = None
+
+    def validar(self):
+        """Retorna a mensagem de erro se o banco não puder ser gerado, ou None."""
+        return None
+
+    def abrir(self):
+        raise NotImplementedError
+
+    def criar_tabelas(self):
+        cursor = self.conn.cursor()
+        for tabela, layout in TABELAS:
+            cursor.execute(_sql_create(tabela, layout))
+
+    def inserir_lote(self, tabela, layout, lote):
+        raise NotImplementedError
+
+    def concluir_tabela(self, tabela, layout):
+        """Chamado após o último lote da tabela."""
+
+    def carregar(self, tabela, layout, linhas, andamento=None, cancelamento=None):
+        inseridas = 0
+        for lote in _em_lotes(linhas, TAMANHO_LOTE):
+            if cancelamento is not None:
+                cancelamento.verificar()
+            self.inserir_lote(tabela, layout, lote)
+            inseridas += len(lote)
+            if andamento is not None:
+                andamento(inseridas)
+        self.concluir_tabela(tabela, layout)
+
+    def criar_indices(self):
+        cursor = self.conn.cursor()
+        for nome, tabela, colunas in INDICES:
+            cursor.execute(f"CREATE INDEX {nome} ON {tabela} ({', '.join(colunas)})")
+        self.conn.commit()
+
+    def fechar(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def descartar(self):
+        """Remove o arquivo parcial (após fechar a conexão)."""
+        try:
+            os.remove(self.caminho)
+        except OSError:
+            pass
+
+class BancoAccess(_Banco):
+    """MDB copiado do template: as tabelas já existem e a carga é feita por executemany."""
+    nome = "Access"
+    extensao = ".mdb"
+
+    def validar(self):
+        if not os.path.exists(self.template_path):
+            return f"Template MDB não encontrado: {self.template_path}"
+        return None
+
+    def abrir(self):
+        import pyodbc
+        shutil.copy(self.template_path, self.caminho)
+        drivers = [x for x in pyodbc.drivers() if 'Access' in x]
+        if not drivers:
+            raise BancoIndisponivel("Driver ODBC do Access não encontrado no Windows.")
+        self.conn = pyodbc.connect(fr'DRIVER={{{drivers[0]}}};DBQ={self.caminho};')
+
+    def criar_tabelas(self):
+        # As tabelas vêm do MDB Matriz
+        pass
+
+    def inserir_lote(self, tabela, layout, lote):
+        # O driver do Access não aceita arrays de parâmetros (fast_executemany): executemany
+        # simples, com uma transação por lote para não estourar o limite de bloqueios do Jet
+        self.conn.cursor().executemany(_sql_insert(tabela, layout), lote)
+        self.conn.commit()
+
+    def _indices_existentes(self, tabela):
+        colunas = {}
+        for r in self.conn.cursor().statistics(tabela):
+            if r.index_name:
+                colunas.setdefault(r.index_name, []).append(r.column_name)
+        return {tuple(c) for c in colunas.values()}
+
+    def criar_indices(self):
+        # Somente os índices que o MDB Matriz ainda não tem
+        cursor = self.conn.cursor()
+        for nome, tabela, colunas in INDICES:
+            if tuple(colunas) not in self._indices_existentes(tabela):
+                cursor.execute(f"CREATE INDEX {nome} ON {tabela} ({', '.join(colunas)})")
+        self.conn.commit()
+
+class BancoSqlite(_Banco):
+    """SQLite da biblioteca padrão: arquivo novo, sem journal, um commit por lote."""
+    nome = "SQLite"
+    extensao = ".sqlite"
+
+    def abrir(self):
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+        self.conn = sqlite3.connect(self.caminho)
+        # OTIMIZAÇÃO: o arquivo é gerado do zero; se a carga falhar ele é descartado de qualquer forma
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+    def inserir_lote(self, tabela, layout, lote):
+        self.conn.executemany(_sql_insert(tabela, layout), lote)
+        self.conn.commit()
+
+class BancoDuckdb(_Banco):
+    """DuckDB: os lotes são gravados em um CSV temporário e importados com um único COPY por tabela."""
+    nome = "DuckDB"
+    extensao = ".duckdb"
+
+    def __init__(self, caminho, template_path):
+        super().__init__(caminho, template_path)
+        self._csv = None
+
+    def abrir(self):
+        import duckdb
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+        self.conn = duckdb.connect(self.caminho)
+
+    def inserir_lote(self, tabela, layout, lote):
+        if self._csv is None:
+            fd, caminho = tempfile.mkstemp(prefix=f"ddv_{tabela}_", suffix=".csv")
+            arquivo = os.fdopen(fd, "w", encoding="utf-8", newline="")
+            self._csv = (caminho, arquivo, csv.writer(arquivo, quoting=csv.QUOTE_ALL))
+        self._csv[2].writerows(lote)
+
+    def concluir_tabela(self, tabela, layout):
+        if self._csv is None:
+            return
+        caminho, arquivo, _ = self._csv
+        self._csv = None
+        arquivo.close()
+        try:
+            # Texto vazio continua texto vazio, e não NULL
+            textos = ", ".join(c.coluna for c in layout.campos if c.tipo != CENTAVOS)
+            self.conn.execute(
+                f"COPY {tabela} FROM '{caminho.replace(chr(39), chr(39) * 2)}' (FORMAT CSV, HEADER FALSE, FORCE_NOT_NULL ({textos}))"
+            )
+        finally:
+            os.remove(caminho)
+
+    def fechar(self):
+        if self._csv is not None:
+            self._csv[1].close()
+            os.remove(self._csv[0])
+            self._csv = None
+        super().fechar()
+
+BANCOS = {
+    BANCO_ACCESS: BancoAccess,
+    BANCO_SQLITE: BancoSqlite,
+    BANCO_DUCKDB: BancoDuckdb,
+}
+
+def gerar_banco(banco, registros_header, registros_detail, output_folder, rotina, template_mdb_path,
+                andamento=None, cancelamento=None):
+    """
+    Grava as tabelas Header e Detail no banco escolhido (ver BANCOS). Retorna (ok, mensagem).
+    registros_detail pode ser qualquer iterável (ex.: ArquivoDetail.registros()).
+    andamento(linhas) recebe o total de linhas Detail já inseridas a cada lote.
+    cancelamento: Cancelamento consultado entre os lotes; o arquivo parcial é removido.
+    """
+    classe = BANCOS[banco]
+    if not registros_header:
+        # O nome do arquivo vem do primeiro registro Header
+        return False, f"{classe.nome}: nenhum registro Header para gravar."
+    nome_arq = f"{rotina}_{registros_header[0].processo.strip()}_{registros_header[0].rf.strip()}{classe.extensao}"
+    destino = classe(os.path.join(output_folder, nome_arq), template_mdb_path)
+
+    erro = destino.validar()
+    if erro:
+        return False, erro
+    cancelado = False
+    try:
+        destino.abrir()
+        destino.criar_tabelas()
+        # Colunas seguem a ordem declarada em layout.py
+        destino.carregar("Header", LAYOUT_HEADER, (tuple(LAYOUT_HEADER.colunas(r)) for r in registros_header))
+        destino.carregar("Detail", LAYOUT_DETAIL, (_linha_banco(LAYOUT_DETAIL, r) for r in registros_detail),
+                         andamento, cancelamento)
+        # OTIMIZAÇÃO: índices criados depois da carga, em uma única passada sobre os dados
+        destino.criar_indices()
+        return True, f"Sucesso! Gerado: {nome_arq}"
+    except BancoIndisponivel as e:
+        return False, str(e)
+    except ExecucaoCancelada:
+        cancelado = True
+        return False, f"{classe.nome}: geração cancelada."
+    except Exception as e:
+        return False, f"Erro {classe.nome}: {str(e)}"
+    finally:
+        destino.fechar()
+        if cancelado:
+            destino.descartar()
@@ -0,0 +1,354 @@
+"""
+Benchmark das etapas do DDV sobre dados sintéticos (ver sintetico.py).
+
+Para cada tamanho (quantidade de RFs) mede a leitura do Detail, a agregação mensal,
+a carga do banco e a geração das planilhas pelo pool de trabalhadores, com o pico de
+memória (RSS) do processo. O resultado pode ser gravado como linha de base e comparado
+nas execuções seguintes: etapas mais lentas que a tolerância, ou totais mensais
+diferentes para os mesmos dados, são apontadas como regressão.
+
+A partida também é medida: o tempo de importação dos módulos da interface em um interpretador
+novo, o de um trabalhador (importação do motor e carga do template) e o de subir o pool até
+todos os trabalhadores responderem. Módulos pesados carregados já na partida (ver
+MODULOS_SOB_DEMANDA) também são apontados como regressão.
+
+Uso:
+    python -m benchmark --pasta /tmp/bench --tamanhos 1000,10000 --gravar-base base.json
+    python -m benchmark --pasta /tmp/bench --tamanhos 1000,10000 --base base.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import datetime
+import platform
+import subprocess
+import concurrent.futures
+
+try:
+    import resource
+except ImportError:
+    # Windows: o pico de memória não é medido
+    resource = None
+
+from sintetico import caminhos_dados, gerar_dados
+from leitura import ler_header, ler_indices, abrir_detail
+from agregacao import AgregadorMensal
+from banco import BANCOS, BANCO_SQLITE, gerar_banco
+from despacho import (
+    MOTORES_EXCEL, MOTOR_OPENPYXL, publicar_contexto, remover_contexto, processar_lote, montar_lotes, verificar_trabalhador
+)
+from trabalhadores import PoolTrabalhadores
+from pipeline import ROTINAS_DISPONIVEIS, caminhos_templates, workers_padrao
+from medicao import Perfil
+
+# Código de saída quando alguma etapa regrediu em relação à linha de base
+SAIDA_REGRESSAO = 1
+
+TAMANHOS_PADRAO = "1000,10000,100000"
+
+# Alterar quando o formato do arquivo de resultados mudar
+VERSAO_RESULTADO = 1
+
+# Aumento de tempo tolerado em relação à linha de base (0.25 = 25% mais lento)
+TOLERANCIA_PADRAO = 0.25
+
+# Etapas abaixo deste tempo (s) não são comparadas: o ruído domina a medição
+TEMPO_MINIMO_COMPARACAO = 0.2
+
+# Parâmetros que determinam os dados sintéticos (e portanto os totais mensais)
+PARAMETROS_DADOS = ('meses', 'semente')
+
+# Medições da partida repetidas em interpretadores novos; vale a menor (a de menos ruído)
+REPETICOES_PARTIDA = 3
+
+# Módulos da interface (app.py, sem o Streamlit) e módulos que só devem ser importados na etapa que os usa
+MODULOS_INTERFACE = ("pipeline", "entradas", "trabalhadores", "execucoes", "cache_leitura")
+MODULOS_SOB_DEMANDA = ("openpyxl", "pyodbc", "pyarrow", "duckdb")
+
+_PASTA_DDV = os.path.dirname(os.path.abspath(__file__))
+
+_SCRIPT_INTERFACE = """
+import sys, json, time
+inicio = time.perf_counter()
+for modulo in sys.argv[1].split(","):
+    __import__(modulo)
+print(json.dumps({'segundos': time.perf_counter() - inicio,
+                  'carregados': [m for m in sys.argv[2].split(",") if m in sys.modules]}))
+"""
+
+_SCRIPT_TRABALHADOR = """
+import sys, json, time
+inicio = time.perf_counter()
+from despacho import aquecer_trabalhador
+aquecer_trabalhador((sys.argv[1],), sys.argv[2])
+print(json.dumps({'segundos': time.perf_counter() - inicio, 'carregados': []}))
+"""
+
+def pico_rss_mb():
+    """Pico de memória residente do processo e dos trabalhadores já encerrados, em MB (None no Windows)."""
+    if resource is None:
+        return None
+    # ru_maxrss está em KB no Linux e em bytes no macOS
+    unidade = 1024 * 1024 if sys.platform == "darwin" else 1024
+    pico = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(pico / unidade, 1)
+
+def _etapa(segundos, quantidade):
+    return {
+        'segundos': round(segundos, 4),
+        'quantidade': quantidade,
+        'por_segundo': round(quantidade / segundos, 1) if segundos > 0 else None,
+        'pico_rss_mb': pico_rss_mb(),
+    }
+
+def _resumo_mensal(mensal):
+    """Assinatura dos totais mensais: muda se a agregação produzir qualquer valor diferente."""
+    chaves, ids, competencias, totais = mensal.colunas()
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(chaves).encode("utf-8"))
+    for array in (ids, competencias, totais):
+        h.update(array.astype("<i8").tobytes())
+    h.update("\x1f".join(sorted(f"{c}={m}" for c, m in mensal.erros.items())).encode("utf-8"))
+    return h.hexdigest()
+
+def _gerar_planilhas(pool, motor, template_path, saida, rotina, indices, dt_limite, regs_h, mensal, linhas_por_rf):
+    validos = [h for h in regs_h if h.chave not in mensal.erros]
+    contexto = publicar_contexto(motor, template_path, saida, rotina, indices, dt_limite)
+    try:
+        exe = pool.executor()
+        lotes = montar_lotes(validos, [linhas_por_rf.get(h.chave, 0) for h in validos], pool.n_workers)
+        futuros = [exe.submit(processar_lote, contexto, [(h, mensal.linhas(h.chave)) for h in lote]) for lote in lotes]
+        perfil = Perfil()
+        respostas = []
+        for f in concurrent.futures.as_completed(futuros):
+            resultados, medicao = f.result()
+            respostas.extend(resultados)
+            perfil.adicionar_lote(medicao)
+    finally:
+        remover_contexto(contexto)
+    return sum("ERRO" not in r for r in respostas), len(respostas), perfil.resumo()['planilhas']
+
+def medir(pasta_dados, saida, args, pool):
+    """Executa as etapas sobre os arquivos de pasta_dados. Retorna o resultado de um tamanho."""
+    p_header, p_detail, p_indices = pasta_dados
+    rotina = ROTINAS_DISPONIVEIS[0]
+    etapas = {}
+
+    inicio = time.perf_counter()
+    regs_h = ler_header(p_header)
+    indices = ler_indices(p_indices)
+    with abrir_detail(p_detail) as detail:
+        detail.indexar()
+        total_linhas = detail.total_linhas
+    etapas['leitura'] = _etapa(time.perf_counter() - inicio, total_linhas)
+
+    # Como no pipeline, a agregação é alimentada pela mesma varredura que indexa o Detail
+    with abrir_detail(p_detail) as detail:
+        inicio = time.perf_counter()
+        agregador = AgregadorMensal()
+        detail.indexar(agregador)
+        mensal = agregador.resultado()
+        etapas['agregacao'] = _etapa(time.perf_counter() - inicio, total_linhas)
+        linhas_por_rf = detail.quantidades()
+
+        if args.banco:
+            inicio = time.perf_counter()
+            ok, msg = gerar_banco(args.banco, regs_h, detail.registros(), saida, rotina, args.template_mdb)
+            etapas['banco'] = _etapa(time.perf_counter() - inicio, total_linhas)
+            etapas['banco']['ok'] = ok
+            if not ok:
+                print(f"  banco: {msg}", file=sys.stderr)
+
+    if pool is not None:
+        # As planilhas são limitadas a uma amostra dos RFs: a vazão (planilhas/s) é o que se compara
+        amostra = regs_h[:args.max_planilhas] if args.max_planilhas else regs_h
+        dt_limite = indices[-1][0] if indices else datetime.datetime.now()
+        inicio = time.perf_counter()
+        gerados, processados, por_etapa = _gerar_planilhas(
+            pool, args.motor, args.template_xls, saida, rotina, indices, dt_limite, amostra, mensal, linhas_por_rf
+        )
+        etapas['excel'] = _etapa(time.perf_counter() - inicio, gerados)
+        etapas['excel']['erros'] = processados - gerados
+        # Tempo de cada etapa da planilha por RF (p50/p95/máximo), medido nos trabalhadores
+        etapas['excel']['planilha'] = por_etapa
+
+    return {'linhas_detail': total_linhas, 'resumo_mensal': _resumo_mensal(mensal), 'etapas': etapas}
+
+def _medir_interpretador(script, *argumentos):
+    """Executa script em um interpretador novo, REPETICOES_PARTIDA vezes. Retorna a medição mais rápida."""
+    medicoes = []
+    for _ in range(REPETICOES_PARTIDA):
+        saida = subprocess.run([sys.executable, "-c", script, *argumentos], cwd=_PASTA_DDV,
+                               capture_output=True, text=True, check=True).stdout
+        medicoes.append(json.loads(saida.splitlines()[-1]))
+    return min(medicoes, key=lambda m: m['segundos'])
+
+def medir_partida(args):
+    """
+    Tempo de partida: importação dos módulos da interface, partida de um trabalhador e
+    subida do pool. Retorna {'etapas': {...}, 'modulos_sob_demanda': [carregados na partida]}.
+    """
+    etapas = {}
+    interface = _medir_interpretador(_SCRIPT_INTERFACE, ",".join(MODULOS_INTERFACE), ",".join(MODULOS_SOB_DEMANDA))
+    etapas['importacao'] = _etapa(interface['segundos'], len(MODULOS_INTERFACE))
+    trabalhador = _medir_interpretador(_SCRIPT_TRABALHADOR, args.motor, args.template_xls)
+    etapas['trabalhador'] = _etapa(trabalhador['segundos'], 1)
+
+    # Do pedido do pool até todos os trabalhadores responderem, com o template carregado
+    n_workers = max(1, args.workers)
+    inicio = time.perf_counter()
+    pool = PoolTrabalhadores(n_workers, args.template_xls, motores=(args.motor,))
+    try:
+        exe = pool.executor()
+        for f in [exe.submit(verificar_trabalhador) for _ in range(n_workers)]:
+            f.result()
+        etapas['pool'] = _etapa(time.perf_counter() - inicio, n_workers)
+    finally:
+        pool.encerrar()
+    return {'etapas': etapas, 'modulos_sob_demanda': interface['carregados']}
+
+def mesmos_dados_sinteticos(atual, base):
+    return all(base.get('parametros', {}).get(p) == atual['parametros'][p] for p in PARAMETROS_DADOS)
+
+def comparar(atual, base, tolerancia):
+    """Lista as regressões de atual em relação à linha de base (mesmos tamanhos e etapas)."""
+    regressoes = []
+    # Os totais mensais só são comparáveis quando os dados sintéticos são os mesmos
+    mesmos_dados = mesmos_dados_sinteticos(atual, base)
+    for tamanho, res in atual['resultados'].items():
+        res_base = base.get('resultados', {}).get(tamanho)
+        if res_base is None:
+            continue
+        if mesmos_dados and res['resumo_mensal'] != res_base['resumo_mensal']:
+            regressoes.append(f"{tamanho} RFs: totais mensais diferentes da linha de base.")
+        regressoes.extend(_comparar_etapas(f"{tamanho} RFs", res['etapas'], res_base['etapas'], tolerancia))
+
+    partida, partida_base = atual.get('partida'), base.get('partida')
+    if partida is not None:
+        for modulo in partida['modulos_sob_demanda']:
+            regressoes.append(f"partida: {modulo} importado junto com a interface.")
+        if partida_base is not None:
+            regressoes.extend(_comparar_etapas("partida", partida['etapas'], partida_base['etapas'], tolerancia))
+    return regressoes
+
+def _comparar_etapas(rotulo, etapas, etapas_base, tolerancia):
+    regressoes = []
+    for nome, etapa in etapas.items():
+        etapa_base = etapas_base.get(nome)
+        if etapa_base is None or etapa_base['segundos'] < TEMPO_MINIMO_COMPARACAO:
+            continue
+        limite = etapa_base['segundos'] * (1 + tolerancia)
+        if etapa['segundos'] > limite:
+            regressoes.append(
+                f"{rotulo}, {nome}: {etapa['segundos']:.3f}s (linha de base {etapa_base['segundos']:.3f}s, "
+                f"+{(etapa['segundos'] / etapa_base['segundos'] - 1) * 100:.0f}%)"
+            )
+    return regressoes
+
+def _imprimir_etapas(etapas):
+    for nome, etapa in etapas.items():
+        pico = f"{etapa['pico_rss_mb']} MB" if etapa['pico_rss_mb'] is not None else "n/d"
+        print(f"  {nome:<10} {etapa['segundos']:>9.3f}s {etapa['quantidade']:>10} itens "
+              f"{etapa['por_segundo'] or 0:>12.1f}/s  pico RSS {pico}")
+
+def _imprimir(tamanho, res):
+    print(f"{tamanho} RFs ({res['linhas_detail']} linhas Detail)")
+    _imprimir_etapas(res['etapas'])
+
+def _imprimir_partida(partida):
+    print("Partida")
+    _imprimir_etapas(partida['etapas'])
+    if partida['modulos_sob_demanda']:
+        print(f"  importados na partida: {', '.join(partida['modulos_sob_demanda'])}")
+
+def criar_parser():
+    p_tpl_mdb, p_tpl_xls = caminhos_templates()
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark das etapas do DDV com dados sintéticos.")
+    parser.add_argument("--pasta", required=True,
+                        help="Pasta de trabalho: dados sintéticos (reaproveitados entre execuções) e saídas.")
+    parser.add_argument("--tamanhos", default=TAMANHOS_PADRAO, help=f"RFs de cada rodada (padrão: {TAMANHOS_PADRAO}).")
+    parser.add_argument("--meses", type=int, default=36, help="Competências por RF.")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--banco", choices=tuple(BANCOS), default=BANCO_SQLITE,
+                        help="Banco carregado na etapa de banco (padrão: sqlite).")
+    parser.add_argument("--sem-banco", action="store_true", help="Não mede a carga do banco.")
+    parser.add_argument("--sem-excel", action="store_true", help="Não mede a geração das planilhas.")
+    parser.add_argument("--sem-partida", action="store_true",
+                        help="Não mede a partida (importação da interface, trabalhador e subida do pool).")
+    parser.add_argument("--motor", choices=tuple(MOTORES_EXCEL), default=MOTOR_OPENPYXL)
+    parser.add_argument("--workers", type=int, default=workers_padrao())
+    parser.add_argument("--max-planilhas", type=int, default=2000,
+                        help="Planilhas geradas por tamanho (0: todas). Padrão: 2000.")
+    parser.add_argument("--template-mdb", default=p_tpl_mdb)
+    parser.add_argument("--template-xls", default=p_tpl_xls)
+    parser.add_argument("--base", default=None, help="Linha de base (JSON) para comparação.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                        help=f"Aumento de tempo tolerado sobre a linha de base (padrão: {TOLERANCIA_PADRAO}).")
+    parser.add_argument("--gravar-base", default=None, help="Grava o resultado como linha de base neste arquivo.")
+    return parser
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.sem_banco:
+        args.banco = None
+    tamanhos = [int(t) for t in args.tamanhos.split(",") if t.strip()]
+
+    resultado = {
+        'versao': VERSAO_RESULTADO,
+        'parametros': {'meses': args.meses, 'semente': args.semente, 'banco': args.banco, 'motor': args.motor,
+                       'max_planilhas': args.max_planilhas, 'sem_excel': args.sem_excel},
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(),
+                     'nucleos': os.cpu_count(), 'workers': args.workers},
+        'resultados': {},
+    }
+
+    if not args.sem_partida:
+        # Medida antes das rodadas: o pool das rodadas ainda não disputa a CPU
+        resultado['partida'] = medir_partida(args)
+        _imprimir_partida(resultado['partida'])
+
+    pool = None
+    if not args.sem_excel:
+        pool = PoolTrabalhadores(max(1, args.workers), args.template_xls, motores=(args.motor,))
+    try:
+        for tamanho in tamanhos:
+            # Os dados de cada tamanho são gerados uma única vez e reaproveitados pelas execuções seguintes
+            pasta_dados = os.path.join(args.pasta, f"dados_{tamanho}_{args.meses}_{args.semente}")
+            caminhos = caminhos_dados(pasta_dados)
+            if not all(os.path.isfile(c) for c in caminhos):
+                gerar_dados(pasta_dados, rfs=tamanho, meses=args.meses, semente=args.semente)
+            saida = os.path.join(args.pasta, f"saida_{tamanho}")
+            shutil.rmtree(saida, ignore_errors=True)
+            os.makedirs(saida)
+
+            res = medir(caminhos, saida, args, pool)
+            resultado['resultados'][str(tamanho)] = res
+            _imprimir(tamanho, res)
+    finally:
+        if pool is not None:
+            pool.encerrar()
+
+    if args.gravar_base:
+        with open(args.gravar_base, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Linha de base gravada: {args.gravar_base}")
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        if not mesmos_dados_sinteticos(resultado, base):
+            print("Aviso: dados sintéticos diferentes da linha de base; apenas os tempos são comparados.", file=sys.stderr)
+        regressoes = comparar(resultado, base, args.tolerancia)
+        for r in regressoes:
+            print(r, file=sys.stderr)
+        if regressoes:
+            return SAIDA_REGRESSAO
+        print("Sem regressões em relação à linha de base.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Cache das leituras das entradas, pelo hash do conteúdo.
+
+O Header decodificado, os índices e o índice do Detail (faixas de cada Processo + RF, junto
+com a agregação mensal) são guardados pelo hash BLAKE2 do conteúdo de cada arquivo: um rerun
+do Streamlit, um novo clique em PROCESSAR ou outra execução sobre o mesmo extrato do Mainframe
+reaproveitam a leitura sem decodificar, indexar e agregar de novo. O conteúdo do Detail em si
+não é guardado: ele continua sendo lido do arquivo mapeado ou do upload.
+
+O cache fica em memória e, opcionalmente, em uma pasta no disco; nos dois, as entradas usadas
+há mais tempo são descartadas quando o tamanho total passa do limite.
+"""
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+import threading
+
+# Alterar quando a leitura ou a agregação mudarem: invalida as entradas gravadas no disco
+VERSAO_CACHE = 1
+
+# Limites padrão (bytes) do cache em memória e do cache no disco
+LIMITE_MEMORIA = 512 * 1024 * 1024
+LIMITE_DISCO = 2 * 1024 * 1024 * 1024
+
+PASTA_CACHE = os.path.join(tempfile.gettempdir(), "ddv_leituras")
+
+# Tipos de entrada
+HEADER = "header"
+INDICES = "indices"
+DETAIL = "detail"
+
+_BLOCO_HASH = 1024 * 1024
+
+def hash_fonte(fonte):
+    """Hash do conteúdo de um caminho ou buffer (ex.: getbuffer() do upload); None sem fonte."""
+    if fonte is None:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(fonte, (str, os.PathLike)):
+        with open(fonte, "rb") as f:
+            for bloco in iter(lambda: f.read(_BLOCO_HASH), b""):
+                h.update(bloco)
+    else:
+        h.update(memoryview(fonte).cast("B"))
+    return h.hexdigest()
+
+def tamanho_header(regs_h):
+    """Tamanho aproximado (bytes) dos registros Header decodificados."""
+    return sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in regs_h)
+
+def tamanho_detail(indice, mensal):
+    """Tamanho aproximado (bytes) do índice do Detail e da agregação mensal."""
+    chaves, faixas, _ = indice
+    tamanho = sum(a.nbytes for a in faixas or ()) + 200 * len(chaves)
+    if mensal is not None:
+        tamanho += mensal.tamanho()
+    return tamanho
+
+class CacheLeitura:
+    """
+    Leituras em cache por (tipo, hash do conteúdo). Seguro para as leituras paralelas de um lote.
+    pasta: também grava as entradas no disco (reaproveitadas entre processos, ex.: linha de comando).
+    """
+    def __init__(self, limite_memoria=LIMITE_MEMORIA, pasta=None, limite_disco=LIMITE_DISCO):
+        self.limite_memoria = limite_memoria
+        self.pasta = pasta
+        self.limite_disco = limite_disco
+        self._entradas = {}
+        self._ocupado = 0
+        self._trava = threading.Lock()
+
+    def _arquivo(self, tipo, chave):
+        return os.path.join(self.pasta, f"{tipo}-{chave}.pkl")
+
+    def obter(self, tipo, chave):
+        """Valor guardado, ou None."""
+        if chave is None:
+            return None
+        with self._trava:
+            entrada = self._entradas.pop((tipo, chave), None)
+            if entrada is not None:
+                # Reinserida no fim: os dicionários preservam a ordem, a primeira é a usada há mais tempo
+                self._entradas[tipo, chave] = entrada
+                return entrada[0]
+        if self.pasta is None:
+            return None
+        try:
+            with open(self._arquivo(tipo, chave), "rb") as f:
+                versao, valor, tamanho = pickle.load(f)
+            os.utime(self._arquivo(tipo, chave))
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            return None
+        if versao != VERSAO_CACHE:
+            return None
+        self._guardar_memoria(tipo, chave, valor, tamanho)
+        return valor
+
+    def guardar(self, tipo, chave, valor, tamanho):
+        """Guarda o valor; tamanho (bytes, aproximado) conta para o limite."""
+        if chave is None:
+            return
+        self._guardar_memoria(tipo, chave, valor, tamanho)
+        if self.pasta is None:
+            return
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            destino = self._arquivo(tipo, chave)
+            # Gravado à parte e renomeado: execuções simultâneas nunca leem uma entrada pela metade
+            temporario = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporario, "wb") as f:
+                pickle.dump((VERSAO_CACHE, valor, tamanho), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, destino)
+            self._limpar_disco()
+        except OSError:
+            # O cache é auxiliar: uma falha ao gravá-lo não interrompe a execução
+            pass
+
+    def _guardar_memoria(self, tipo, chave, valor, tamanho):
+        if tamanho > self.limite_memoria:
+            return
+        with self._trava:
+            anterior = self._entradas.pop((tipo, chave), None)
+            if anterior is not None:
+                self._ocupado -= anterior[1]
+            while self._entradas and self._ocupado + tamanho > self.limite_memoria:
+                # Descarta a entrada usada há mais tempo
+                _, liberado = self._entradas.pop(next(iter(self._entradas)))
+                self._ocupado -= liberado
+            self._entradas[tipo, chave] = (valor, tamanho)
+            self._ocupado += tamanho
+
+    def _limpar_disco(self):
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if nome.endswith(".pkl"):
+                try:
+                    st = os.stat(os.path.join(self.pasta, nome))
+                except OSError:
+                    continue
+                arquivos.append((st.st_mtime, st.st_size, nome))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, nome in sorted(arquivos):
+            if total <= self.limite_disco:
+                break
+            try:
+                os.remove(os.path.join(self.pasta, nome))
+                total -= tamanho
+            except OSError:
+                pass
+
+    def limpar(self):
+        """Descarta as entradas em memória (as do disco continuam valendo)."""
+        with self._trava:
+            self._entradas.clear()
+            self._ocupado = 0
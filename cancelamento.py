@@ -0,0 +1,48 @@
+"""
+Cancelamento cooperativo de uma execução.
+
+O sinal é um arquivo no diretório temporário: a thread do banco, a exportação Parquet
+e os trabalhadores do pool (que sobrevivem entre execuções e não herdam objetos da
+execução) consultam o mesmo caminho entre um lote/RF e outro.
+"""
+import os
+import uuid
+import tempfile
+import threading
+
+class ExecucaoCancelada(Exception):
+    """A execução foi cancelada pelo usuário."""
+
+class Cancelamento:
+    """Sinal de cancelamento compartilhado entre o processo principal, as threads e os trabalhadores."""
+    def __init__(self):
+        self.caminho = os.path.join(tempfile.gettempdir(), f"ddv_cancelar_{uuid.uuid4().hex}.sinal")
+        self._evento = threading.Event()
+
+    def cancelar(self):
+        if self._evento.is_set():
+            return
+        self._evento.set()
+        try:
+            with open(self.caminho, "wb"):
+                pass
+        except OSError:
+            pass
+
+    def cancelado(self):
+        return self._evento.is_set()
+
+    def verificar(self):
+        """Levanta ExecucaoCancelada se o cancelamento foi solicitado."""
+        if self._evento.is_set():
+            raise ExecucaoCancelada("Execução cancelada pelo usuário.")
+
+    def descartar(self):
+        try:
+            os.remove(self.caminho)
+        except OSError:
+            pass
+
+def sinal_cancelado(caminho):
+    """Consulta feita pelos trabalhadores do pool, que só conhecem o caminho do sinal."""
+    return caminho is not None and os.path.exists(caminho)
@@ -0,0 +1,167 @@
+"""
+Exportação colunar (Parquet) do Detail e das linhas mensais de cada RF.
+
+Os dois conjuntos são gravados em pastas particionadas por processo e ano
+(Processo=.../Ano=...), no formato hive lido por pyarrow, DuckDB, Spark e pandas.
+Valores monetários são decimal(18, 2), montados direto dos centavos inteiros, e as
+competências são datas.
+"""
+import os
+import shutil
+
+import numpy as np
+
+from layout import LAYOUT_DETAIL, LAYOUT_HEADER, CENTAVOS
+from cancelamento import ExecucaoCancelada
+
+# Pasta criada no diretório de saída e subpastas de cada conjunto
+PASTA_PARQUET = "Parquet"
+CONJUNTO_DETAIL = "Detail"
+CONJUNTO_MENSAL = "Mensal"
+
+# Registros do Detail convertidos em colunas por vez
+LINHAS_POR_LOTE = 200_000
+
+# Precisão e escala dos valores monetários
+PRECISAO, ESCALA = 18, 2
+
+# Colunas de partição: o Processo (sem espaços) sai dos arquivos e vira pasta, junto com o ano
+COLUNA_PROCESSO = LAYOUT_DETAIL.por_nome["processo"].coluna
+COLUNA_ANO = "Ano"
+
+# Limite de partições por conjunto (processo x ano) aceito pelo pyarrow
+MAX_PARTICOES = 100_000
+
+def _decimais(pa, centavos, nulos=None):
+    """Array decimal(18, 2) a partir de centavos int64, sem passar por float ou Decimal."""
+    # OTIMIZAÇÃO: o decimal128 guarda o inteiro sem escala em 16 bytes little-endian;
+    # com escala 2 ele é o próprio valor em centavos (a parte alta é só a extensão do sinal)
+    dados = np.empty((len(centavos), 2), dtype=np.int64)
+    dados[:, 0] = centavos
+    dados[:, 1] = centavos >> 63
+    validade = None
+    if nulos is not None and nulos.any():
+        validade = pa.py_buffer(np.packbits(~nulos, bitorder="little"))
+    return pa.Array.from_buffers(pa.decimal128(PRECISAO, ESCALA), len(centavos), [validade, pa.py_buffer(dados)])
+
+def _datas(pa, competencias):
+    """Último dia de cada competência AAAAMM (date32); meses inválidos viram nulos."""
+    ano, mes = competencias // 100, competencias % 100
+    validas = (mes >= 1) & (mes <= 12)
+    meses = ((ano - 1970) * 12 + np.where(validas, mes, 1) - 1).astype("datetime64[M]")
+    dias = (meses + 1).astype("datetime64[D]") - 1
+    return pa.array(dias, type=pa.date32(), mask=~validas)
+
+def _particionamento(pa, ds):
+    return ds.partitioning(pa.schema([(COLUNA_PROCESSO, pa.string()), (COLUNA_ANO, pa.int16())]), flavor="hive")
+
+def _esquema_detail(pa):
+    campos = [
+        (c.coluna, pa.decimal128(PRECISAO, ESCALA) if c.tipo == CENTAVOS else pa.string())
+        for c in LAYOUT_DETAIL.campos
+    ]
+    return pa.schema(campos + [("Competencia", pa.date32()), (COLUNA_ANO, pa.int16())])
+
+def _lote_detail(pa, esquema, registros):
+    c = LAYOUT_DETAIL.por_nome
+    colunas = list(zip(*registros))
+    arrays = []
+    for i, campo in enumerate(LAYOUT_DETAIL.campos):
+        if campo.coluna == COLUNA_PROCESSO:
+            arrays.append(pa.array([p.strip() for p in colunas[i]], type=pa.string()))
+        elif campo.tipo == CENTAVOS:
+            nulos = np.fromiter((v is None for v in colunas[i]), dtype=bool, count=len(registros))
+            centavos = np.fromiter((v or 0 for v in colunas[i]), dtype=np.int64, count=len(registros))
+            arrays.append(_decimais(pa, centavos, nulos))
+        else:
+            arrays.append(pa.array(colunas[i], type=pa.string()))
+
+    # Competências fora do padrão numérico ficam sem data e na partição de ano nulo
+    anos = colunas[LAYOUT_DETAIL.campos.index(c["ano"])]
+    meses = colunas[LAYOUT_DETAIL.campos.index(c["mes"])]
+    competencias = np.fromiter(
+        (int(a) * 100 + int(m) if a.isdigit() and m.isdigit() else 0 for a, m in zip(anos, meses)),
+        dtype=np.int64, count=len(registros)
+    )
+    arrays.append(_datas(pa, competencias))
+    arrays.append(pa.array(competencias // 100, type=pa.int16(), mask=competencias == 0))
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema)
+
+def _lotes_detail(pa, esquema, registros, andamento, cancelamento):
+    lote, gravadas = [], 0
+    for r in registros:
+        lote.append(r)
+        if len(lote) >= LINHAS_POR_LOTE:
+            if cancelamento is not None:
+                cancelamento.verificar()
+            yield _lote_detail(pa, esquema, lote)
+            gravadas += len(lote)
+            lote = []
+            if andamento is not None:
+                andamento(gravadas)
+    if lote:
+        if cancelamento is not None:
+            cancelamento.verificar()
+        yield _lote_detail(pa, esquema, lote)
+        if andamento is not None:
+            andamento(gravadas + len(lote))
+
+def _tabela_mensal(pa, regs_h, mensal):
+    chaves, ids, competencias, totais = mensal.colunas()
+    por_chave = {h.chave: h for h in regs_h}
+    cabecalhos = [por_chave.get(chave) for chave in chaves]
+    processos = np.array([h.processo.strip() if h else None for h in cabecalhos], dtype=object)[ids]
+    rfs = np.array([h.rf.strip() if h else None for h in cabecalhos], dtype=object)[ids]
+
+    # Mesmas colunas de rows_data (processar_arquivo_isolado), somadas em centavos
+    venc, desc, iprem, hspm, funfin, funprev = (totais[:, i] for i in range(6))
+    return pa.table({
+        COLUNA_PROCESSO: pa.array(processos, type=pa.string()),
+        LAYOUT_HEADER.por_nome["rf"].coluna: pa.array(rfs, type=pa.string()),
+        "dt": _datas(pa, competencias),
+        "q": _decimais(pa, (venc - desc) + iprem + hspm),
+        "iprem": _decimais(pa, iprem),
+        "hspm": _decimais(pa, hspm),
+        "funfin": _decimais(pa, funfin),
+        "funprev": _decimais(pa, funprev),
+        COLUNA_ANO: pa.array(competencias // 100, type=pa.int16()),
+    })
+
+def _gravar(pa, ds, dados, destino, esquema=None):
+    # O conjunto é regravado por inteiro: partições de execuções anteriores não se misturam
+    if os.path.isdir(destino):
+        shutil.rmtree(destino)
+    ds.write_dataset(
+        dados, destino, schema=esquema, format="parquet", partitioning=_particionamento(pa, ds),
+        basename_template="parte-{i}.parquet", max_partitions=MAX_PARTICOES,
+        existing_data_behavior="overwrite_or_ignore"
+    )
+
+def exportar_parquet(regs_h, registros_detail, mensal, output_folder, andamento=None, cancelamento=None):
+    """
+    Grava os conjuntos Parquet Detail e Mensal em output_folder/Parquet. Retorna (ok, mensagem).
+    registros_detail: iterável de registros Detail (ex.: ArquivoDetail.registros()).
+    mensal: ResultadoMensal com as linhas mensais de cada RF.
+    andamento(linhas) recebe o total de linhas Detail já gravadas.
+    cancelamento: Cancelamento consultado entre os lotes; a pasta parcial é removida e
+    ExecucaoCancelada é propagada.
+    """
+    try:
+        # Importado apenas quando a exportação é solicitada: o pyarrow é opcional
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        return False, f"Erro Parquet: {str(e)}"
+
+    pasta = os.path.join(output_folder, PASTA_PARQUET)
+    try:
+        esquema = _esquema_detail(pa)
+        _gravar(pa, ds, _lotes_detail(pa, esquema, registros_detail, andamento, cancelamento),
+                os.path.join(pasta, CONJUNTO_DETAIL), esquema)
+        _gravar(pa, ds, _tabela_mensal(pa, regs_h, mensal), os.path.join(pasta, CONJUNTO_MENSAL))
+        return True, f"Sucesso! Gerado: {PASTA_PARQUET}"
+    except ExecucaoCancelada:
+        shutil.rmtree(pasta, ignore_errors=True)
+        raise
+    except Exception as e:
+        return False, f"Erro Parquet: {str(e)}"
@@ -22,8 +22,24 @@ pyinstaller --noconfirm --clean ^
     --windowed ^
     --name "DDV" ^
     --add-data "app.py;." ^
-    --add-data "access.py;." ^
+    --add-data "agregacao.py;." ^
+    --add-data "arquivo_zip.py;." ^
+    --add-data "banco.py;." ^
+    --add-data "cache_leitura.py;." ^
+    --add-data "cancelamento.py;." ^
+    --add-data "colunar.py;." ^
+    --add-data "consolidado.py;." ^
+    --add-data "despacho.py;." ^
+    --add-data "entradas.py;." ^
     --add-data "excel.py;." ^
+    --add-data "excel_xml.py;." ^
+    --add-data "execucoes.py;." ^
+    --add-data "layout.py;." ^
+    --add-data "leitura.py;." ^
+    --add-data "manifesto.py;." ^
+    --add-data "medicao.py;." ^
+    --add-data "pipeline.py;." ^
+    --add-data "trabalhadores.py;." ^
     --add-data "Templates;Templates/" ^
     --add-data "icons;icons/" ^
     --collect-all streamlit ^
@@ -32,6 +48,7 @@ pyinstaller --noconfirm --clean ^
     --hidden-import "tkinter.filedialog" ^
     --hidden-import "openpyxl" ^
     --hidden-import "pandas" ^
+    --hidden-import "numpy" ^
     --hidden-import "pyodbc" ^
     --exclude-module "matplotlib" ^
     --exclude-module "scipy" ^
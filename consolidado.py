@@ -0,0 +1,137 @@
+"""
+Planilha consolidada da execução: uma linha por RF e competência, com subtotais por processo.
+
+Montada direto das linhas mensais (rows_data) já calculadas para as planilhas dos RFs, sem
+reabrir os arquivos gerados, e gravada com o openpyxl em modo write_only: as linhas são
+escritas em sequência e a memória não cresce com o tamanho da execução.
+"""
+import os
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.styles import Font, PatternFill
+
+from cancelamento import ExecucaoCancelada
+
+NOME_CONSOLIDADO = "DDV_Consolidado.xlsx"
+
+# Colunas de valores: (título, chave em rows_data)
+COLUNAS_VALORES = (("Q", "q"), ("IPREM", "iprem"), ("HSPM", "hspm"), ("FUNFIN", "funfin"), ("FUNPREV", "funprev"))
+COLUNAS = ("Rotina", "Processo", "RF", "Autor", "Competência") + tuple(t for t, _ in COLUNAS_VALORES)
+
+# Linhas de dados por aba (o Excel aceita 1.048.576 por aba, contando o cabeçalho)
+LINHAS_POR_ABA = 1_000_000
+
+# RFs escritos entre uma verificação de cancelamento e outra
+RFS_POR_VERIFICACAO = 500
+
+FORMATO_VALOR = '#,##0.00'
+FORMATO_COMPETENCIA = 'mm/yyyy'
+
+_NEGRITO = Font(bold=True)
+_FUNDO_TITULO = PatternFill(fill_type="solid", fgColor="DDEBF7")
+_FUNDO_SUBTOTAL = PatternFill(fill_type="solid", fgColor="F2F2F2")
+
+class _Planilha:
+    """Abas do consolidado em modo write_only, abrindo uma nova ao atingir LINHAS_POR_ABA."""
+    def __init__(self, wb):
+        self._wb = wb
+        self._ws = None
+        self._linhas = LINHAS_POR_ABA
+        self._abas = 0
+
+    def _celula(self, valor, formato=None, negrito=False, fundo=None):
+        if not (formato or negrito or fundo is not None):
+            # Sem estilo, o valor vai direto para a linha, sem criar a célula
+            return valor
+        cell = WriteOnlyCell(self._ws, valor)
+        if formato:
+            cell.number_format = formato
+        if negrito:
+            cell.font = _NEGRITO
+        if fundo is not None:
+            cell.fill = fundo
+        return cell
+
+    def _nova_aba(self):
+        self._abas += 1
+        self._ws = self._wb.create_sheet("Consolidado" if self._abas == 1 else f"Consolidado ({self._abas})")
+        self._ws.freeze_panes = "A2"
+        for i, largura in enumerate((10, 14, 11, 40, 12) + (15,) * len(COLUNAS_VALORES)):
+            self._ws.column_dimensions[get_column_letter(i + 1)].width = largura
+        self._ws.append([self._celula(t, negrito=True, fundo=_FUNDO_TITULO) for t in COLUNAS])
+        self._linhas = 0
+
+    def linha(self, rotina, processo, rf, autor, competencia, centavos, total=False):
+        if self._linhas >= LINHAS_POR_ABA:
+            self._nova_aba()
+        fundo = _FUNDO_SUBTOTAL if total else None
+        self._ws.append(
+            [self._celula(v, negrito=total, fundo=fundo) for v in (rotina, processo, rf, autor)]
+            + [self._celula(competencia, FORMATO_COMPETENCIA, total, fundo)]
+            + [self._celula(c / 100.0, FORMATO_VALOR, total, fundo) for c in centavos]
+        )
+        self._linhas += 1
+
+def _centavos(d):
+    return [round(d[chave] * 100) for _, chave in COLUNAS_VALORES]
+
+def _somar(acumulado, centavos):
+    for i, c in enumerate(centavos):
+        acumulado[i] += c
+
+def gerar_consolidado(pares, output_folder, cancelamento=None):
+    """
+    Grava output_folder/NOME_CONSOLIDADO. Retorna (ok, mensagem).
+    pares: [(rotina, registros Header, ResultadoMensal)] de cada par Header/Detail da execução.
+    cancelamento: Cancelamento consultado entre os RFs; o arquivo parcial é removido e
+    ExecucaoCancelada é propagada.
+    """
+    destino = os.path.join(output_folder, NOME_CONSOLIDADO)
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        planilha = _Planilha(wb)
+        geral = [0] * len(COLUNAS_VALORES)
+        escritos = 0
+        for rotina, regs_h, mensal in pares:
+            # Um RF por chave, em ordem de processo e RF; os RFs com erro ficam de fora, como nas planilhas
+            unicos = {}
+            for h in regs_h:
+                unicos.setdefault(h.chave, h)
+            processo_atual, subtotal = None, None
+            for h in sorted(unicos.values(), key=lambda h: (h.processo.strip(), h.rf.strip())):
+                processo = h.processo.strip()
+                if processo != processo_atual:
+                    if subtotal is not None:
+                        planilha.linha(rotina, processo_atual, "", "Subtotal do processo", None, subtotal, total=True)
+                    processo_atual, subtotal = processo, [0] * len(COLUNAS_VALORES)
+
+                rf, autor = h.rf.strip(), h.autor.strip()
+                for d in mensal.linhas(h.chave):
+                    centavos = _centavos(d)
+                    planilha.linha(rotina, processo, rf, autor, d['dt'], centavos)
+                    _somar(subtotal, centavos)
+                    _somar(geral, centavos)
+
+                escritos += 1
+                if cancelamento is not None and escritos % RFS_POR_VERIFICACAO == 0:
+                    cancelamento.verificar()
+            if subtotal is not None:
+                planilha.linha(rotina, processo_atual, "", "Subtotal do processo", None, subtotal, total=True)
+
+        if escritos == 0:
+            return False, "Consolidado: nenhum RF para consolidar"
+        planilha.linha("", "", "", "TOTAL GERAL", None, geral, total=True)
+        # Gravado à parte e renomeado: o consolidado anterior só é substituído por um completo
+        wb.save(temporario)
+        os.replace(temporario, destino)
+        return True, f"Sucesso! Gerado: {NOME_CONSOLIDADO}"
+    except ExecucaoCancelada:
+        raise
+    except Exception as e:
+        return False, f"Erro Consolidado: {str(e)}"
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
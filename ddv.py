@@ -0,0 +1,176 @@
+"""
+Execução em lote do DDV sem a interface Streamlit.
+
+Uso:
+    python -m ddv --header PROC_F.txt --detail PROC_V.txt --indices indices.txt \\
+                  --rotina SJ230133 --saida /caminho/saida
+
+    python -m ddv --lote /caminho/pares --indices indices.txt --saida /caminho/saida
+"""
+import os
+import sys
+import argparse
+
+from pipeline import (
+    ROTINAS_DISPONIVEIS, FORMATOS_DISPONIVEIS, FORMATO_PARQUET, FORMATO_CONSOLIDADO, MOTORES_EXCEL, MOTOR_OPENPYXL, BANCOS, BANCO_ACCESS,
+    caminhos_templates, executar_lote, workers_padrao
+)
+from entradas import Entrada, descobrir_entradas
+from cache_leitura import PASTA_CACHE, CacheLeitura
+from cancelamento import ExecucaoCancelada
+from distribuido import PoolDistribuido, chave_fila, ler_endereco
+
+# Códigos de saída
+SAIDA_OK = 0
+SAIDA_COM_ERROS = 1
+SAIDA_ERRO_CRITICO = 3
+SAIDA_CANCELADA = 4
+
+FORMATO_TODOS = "todos"
+
+def criar_parser():
+    p_tpl_mdb, p_tpl_xls = caminhos_templates()
+    parser = argparse.ArgumentParser(
+        prog="ddv",
+        description="DDV - Demonstrativo de Diferença de Vencimentos (execução em lote).",
+        epilog="Códigos de saída: 0 sucesso, 1 arquivos com erro, 2 argumentos inválidos, 3 erro crítico, 4 cancelada."
+    )
+    parser.add_argument("--header", help="Arquivo Header (_F) em TXT.")
+    parser.add_argument("--detail", help="Arquivo Detail (_V) em TXT.")
+    parser.add_argument("--lote", metavar="ORIGEM",
+                        help="Pasta com pares PROCESSO_F/PROCESSO_V ou lista de pares (header;detail[;indices[;rotina]]), "
+                             "processados em uma única execução. Substitui --header e --detail.")
+    parser.add_argument("--indices", default=None,
+                        help="Arquivo de índices de correção (opcional; no lote, vale para os pares que não informam os seus).")
+    parser.add_argument("--rotina", choices=ROTINAS_DISPONIVEIS, default=ROTINAS_DISPONIVEIS[0])
+    parser.add_argument("--saida", required=True, help="Diretório de saída.")
+    parser.add_argument("--workers", type=int, default=workers_padrao(),
+                        help="Quantidade de processos para a geração das planilhas (padrão: núcleos - 1).")
+    parser.add_argument("--formato", choices=(FORMATO_TODOS,) + FORMATOS_DISPONIVEIS, default=FORMATO_TODOS,
+                        help="Saídas a gerar: banco de dados (mdb), planilhas (xlsx) ou ambas (todos).")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Exporta também o Detail e as linhas mensais em Parquet (requer pyarrow).")
+    parser.add_argument("--consolidado", action="store_true",
+                        help="Grava também DDV_Consolidado.xlsx: uma linha por RF e competência, com subtotais por processo.")
+    parser.add_argument("--banco", choices=tuple(BANCOS), default=BANCO_ACCESS,
+                        help="Banco da saída mdb: access (requer o driver ODBC do Windows), sqlite ou duckdb.")
+    parser.add_argument("--motor", choices=tuple(MOTORES_EXCEL), default=MOTOR_OPENPYXL,
+                        help="Motor das planilhas: openpyxl ou xml (escreve o XML do template direto no zip).")
+    parser.add_argument("--zip", action="store_true",
+                        help="Grava as planilhas em um único ZIP na saída (ddv_planilhas.zip), com a mesma estrutura de pastas.")
+    parser.add_argument("--distribuido", metavar="HOST:PORTA", default=None,
+                        help="Serve os lotes de RFs em uma fila neste endereço para trabalhadores em outras máquinas "
+                             "(python -m distribuido --endereco ...); --workers processos locais também a consomem "
+                             "(0: só remotos). A chave da fila vem de DDV_CHAVE_FILA.")
+    parser.add_argument("--refazer-tudo", action="store_true",
+                        help="Gera todas as planilhas, mesmo as que não mudaram desde a última execução na mesma saída.")
+    parser.add_argument("--cache-leitura", nargs="?", const=PASTA_CACHE, default=None, metavar="PASTA",
+                        help="Guarda no disco o Header, os índices e o Detail já indexados, pelo hash do conteúdo; "
+                             "uma nova execução sobre os mesmos arquivos pula a leitura (padrão da pasta: temporário/ddv_leituras).")
+    parser.add_argument("--perfil-amostra", type=int, default=0, metavar="N",
+                        help="Gera N RFs com cProfile e tracemalloc (arquivos .prof em ddv_perfis na saída).")
+    parser.add_argument("--template-mdb", default=p_tpl_mdb, help="Template MDB (padrão: Templates/MDB-Matriz.mdb).")
+    parser.add_argument("--template-xls", default=p_tpl_xls, help="Template XLS (padrão: Templates/XLS-MATRIZ.xlsx).")
+    parser.add_argument("-q", "--silencioso", action="store_true", help="Não exibe o andamento.")
+    return parser
+
+def _imprimir_perfil(perfil, arquivo):
+    etapas = " | ".join(f"{nome}: {seg:.2f}s" for nome, seg in perfil['etapas'].items())
+    print(f"Etapas: {etapas}", file=sys.stderr)
+    for nome, est in perfil['planilhas'].items():
+        print(f"  planilha/{nome}: p50 {est['p50']:.4f}s | p95 {est['p95']:.4f}s | máx {est['max']:.4f}s", file=sys.stderr)
+    for pid, est in perfil['trabalhadores'].items():
+        print(f"  trabalhador {pid}: {est['rfs']} RFs em {est['total']:.2f}s | p95 {est['p95']:.4f}s", file=sys.stderr)
+    if arquivo:
+        print(f"Perfil: {arquivo}", file=sys.stderr)
+
+def _entradas(args):
+    if args.lote:
+        entradas = descobrir_entradas(args.lote, args.rotina, args.indices)
+        for e in entradas:
+            if e.rotina not in ROTINAS_DISPONIVEIS:
+                raise ValueError(f"Rotina desconhecida em {e.nome}: {e.rotina}")
+        return entradas
+    for caminho in (args.header, args.detail, args.indices):
+        if caminho and not os.path.isfile(caminho):
+            raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
+    return [Entrada(args.header, args.detail, args.indices, args.rotina)]
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    if args.lote and (args.header or args.detail):
+        parser.error("--lote não pode ser usado junto com --header/--detail")
+    if not args.lote and not (args.header and args.detail):
+        parser.error("informe --header e --detail, ou --lote")
+    formatos = FORMATOS_DISPONIVEIS if args.formato == FORMATO_TODOS else (args.formato,)
+    if args.parquet:
+        formatos += (FORMATO_PARQUET,)
+    if args.consolidado:
+        formatos += (FORMATO_CONSOLIDADO,)
+
+    try:
+        entradas = _entradas(args)
+    except (OSError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        return SAIDA_ERRO_CRITICO
+
+    pool = None
+    if args.distribuido:
+        try:
+            pool = PoolDistribuido(ler_endereco(args.distribuido), chave_fila(), locais=max(0, args.workers))
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Fila distribuída indisponível: {str(e)}", file=sys.stderr)
+            return SAIDA_ERRO_CRITICO
+
+    ultimo = []
+
+    def progresso(percentual, mensagem):
+        # O andamento é reenviado enquanto a execução aguarda: só as mudanças são exibidas
+        if not args.silencioso and ultimo != [percentual, mensagem]:
+            ultimo[:] = [percentual, mensagem]
+            print(f"[{percentual:3d}%] {mensagem}", file=sys.stderr)
+
+    def aviso(ok, mensagem):
+        print(mensagem, file=sys.stderr if not ok else sys.stdout)
+
+    try:
+        res = executar_lote(
+            entradas, args.saida, args.template_mdb, args.template_xls,
+            max_workers=max(1, args.workers), formatos=formatos,
+            progresso=progresso, aviso=aviso, motor_excel=args.motor, banco=args.banco,
+            incremental=not args.refazer_tudo, amostra_perfil=max(0, args.perfil_amostra),
+            cache_leitura=CacheLeitura(pasta=args.cache_leitura) if args.cache_leitura else None,
+            saida_zip=args.zip, pool=pool
+        )
+    except (ExecucaoCancelada, KeyboardInterrupt):
+        print("Execução cancelada: os arquivos parciais foram removidos.", file=sys.stderr)
+        return SAIDA_CANCELADA
+    except Exception as e:
+        print(f"Erro Crítico de Execução: {str(e)}", file=sys.stderr)
+        return SAIDA_ERRO_CRITICO
+    finally:
+        if pool is not None:
+            pool.encerrar()
+
+    for erro in res['detalhes_erros']:
+        print(erro, file=sys.stderr)
+
+    if len(res['entradas']) > 1:
+        for e in res['entradas']:
+            print(f"  {e['nome']} ({e['rotina']}): {e['rfs']} RFs | gerados {e['sucesso']} "
+                  f"(reaproveitados: {e['reaproveitados']}) | erros {e['erros']}")
+    print(f"Início: {res['hora_inicio']} | Término: {res['hora_fim']} | Duração: {res['tempo_total']}")
+    print(f"Arquivos gerados: {res['sucesso']} (reaproveitados: {res['reaproveitados']}) | Erros: {res['erros']} | Saída: {res['output_dir']}")
+    if res['arquivo_zip']:
+        print(f"Planilhas: {res['arquivo_zip']}")
+    if not args.silencioso:
+        _imprimir_perfil(res['perfil'], res['arquivo_perfil'])
+
+    if res['erros'] or res['mdb_ok'] is False or any(
+            res['etapas'].get(etapa, {}).get('ok') is False for etapa in ('parquet', 'consolidado')):
+        return SAIDA_COM_ERROS
+    return SAIDA_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
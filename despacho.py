@@ -0,0 +1,166 @@
+"""
+Despacho das planilhas para o pool de processos.
+
+As constantes da execução (template, saída, rotina, índices) são publicadas em um arquivo por
+par Header/Detail, que cada trabalhador lê uma única vez por execução; as tarefas levam apenas
+o Header e as linhas mensais de um lote de RFs. Os lotes são montados dos RFs maiores para os
+menores.
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+import importlib
+
+from cancelamento import sinal_cancelado
+from medicao import MedicaoLote, caminho_amostra
+
+def _template_original(template_path, indices):
+    # O motor XML já monta o TOTINDICE uma única vez por trabalhador
+    return template_path, indices
+
+# Motores de geração das planilhas: (módulo, função da tarefa, initializer do trabalhador,
+# preparo do template no processo principal: (template, indices) -> (template, indices); None mantém os dois)
+# OTIMIZAÇÃO: o módulo do motor (e com ele o openpyxl) só é importado quando o motor é usado
+# (ver carregar_motor): a interface sobe sem ele e cada trabalhador importa apenas o seu motor
+MOTOR_OPENPYXL = "openpyxl"
+MOTOR_XML = "xml"
+MOTORES_EXCEL = {
+    MOTOR_OPENPYXL: ("excel", "processar_arquivo_isolado", "inicializar_trabalhador", "template_com_indices"),
+    MOTOR_XML: ("excel_xml", "processar_arquivo_xml", "inicializar_trabalhador_xml", None),
+}
+
+# Cada lote recebe no máximo restante / (trabalhadores * FATOR_LOTE) do peso ainda não enviado:
+# lotes grandes no início e cada vez menores no fim, para que nenhum trabalhador fique com a cauda
+FATOR_LOTE = 2
+# Quantidade máxima de RFs por lote: limita a latência do andamento na interface
+MAX_RFS_POR_LOTE = 256
+
+# Contextos no processo trabalhador, pelo caminho do arquivo: em um lote de vários pares
+# (ver pipeline.executar_lote) as tarefas de pares diferentes se intercalam na mesma fila
+CONTEXTOS_EM_CACHE = 16
+_CONTEXTOS = {}
+
+def carregar_motor(motor):
+    """Importa o módulo do motor. Retorna (função da tarefa, initializer, preparo do template)."""
+    modulo, processar, inicializar, preparar = MOTORES_EXCEL[motor]
+    m = importlib.import_module(modulo)
+    return getattr(m, processar), getattr(m, inicializar), getattr(m, preparar) if preparar else _template_original
+
+def aquecer_trabalhador(motores, template_path):
+    """Initializer do pool: importa os motores e carrega o template antes da primeira execução."""
+    for motor in motores:
+        carregar_motor(motor)[1](template_path)
+
+def verificar_trabalhador():
+    """Tarefa vazia usada para subir os trabalhadores e verificar se o pool responde."""
+    return os.getpid()
+
+def publicar_contexto(motor, template_path, output_folder, rotina, indices, dt_limite, sinal_cancelamento=None,
+                      amostra_perfil=frozenset(), em_memoria=False):
+    """
+    Grava as constantes da execução para os trabalhadores. Retorna o caminho do arquivo.
+    sinal_cancelamento: caminho do sinal de Cancelamento consultado entre um RF e outro.
+    amostra_perfil: chaves dos RFs executados com cProfile e tracemalloc (ver medicao.py).
+    em_memoria: as planilhas não são gravadas na saída; cada RF devolve (nome, conteúdo) para
+    o processo principal (saída em ZIP, ver arquivo_zip.py).
+    """
+    # OTIMIZAÇÃO: os índices, iguais para todos os RFs, são aplicados ao template uma única vez
+    # por execução (ou reaproveitados do cache em disco), e não em cada planilha
+    template_path, indices = carregar_motor(motor)[2](template_path, indices)
+    return _gravar_contexto((motor, template_path, output_folder, rotina, indices, dt_limite, sinal_cancelamento,
+                             amostra_perfil, em_memoria))
+
+def _gravar_contexto(valores, pasta=None):
+    fd, caminho = tempfile.mkstemp(prefix="ddv_contexto_", suffix=".pkl", dir=pasta)
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(valores, f, pickle.HIGHEST_PROTOCOL)
+    return caminho
+
+def empacotar_contexto(caminho):
+    """Contexto publicado e o seu template em um único pacote, para trabalhadores em outras máquinas (ver distribuido.py)."""
+    with open(caminho, "rb") as f:
+        valores = pickle.load(f)
+    with open(valores[1], "rb") as f:
+        template = f.read()
+    return pickle.dumps((valores, os.path.splitext(valores[1])[1], template), pickle.HIGHEST_PROTOCOL)
+
+def desempacotar_contexto(pacote, pasta):
+    """
+    Grava em pasta o template e o contexto de um pacote (ver empacotar_contexto). Retorna o
+    caminho do contexto. A saída, o sinal de cancelamento e a amostra de perfil são arquivos
+    da máquina do processo principal: aqui as planilhas voltam em memória, sem amostra.
+    """
+    (motor, _, _, rotina, indices, dt_limite, _, _, _), extensao, template = pickle.loads(pacote)
+    # O nome vem do conteúdo: o template (e o que o trabalhador já carregou dele) é reaproveitado entre contextos
+    template_path = os.path.join(pasta, hashlib.blake2b(template, digest_size=16).hexdigest() + extensao)
+    if not os.path.exists(template_path):
+        temporario = f"{template_path}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(template)
+        os.replace(temporario, template_path)
+    return _gravar_contexto((motor, template_path, None, rotina, indices, dt_limite, None, frozenset(), True), pasta)
+
+def remover_contexto(caminho):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+def _carregar_contexto(caminho):
+    contexto = _CONTEXTOS.get(caminho)
+    if contexto is None:
+        with open(caminho, "rb") as f:
+            (motor, template_path, output_folder, rotina, indices, dt_limite, sinal, amostra,
+             em_memoria) = pickle.load(f)
+        processar, inicializar, _ = carregar_motor(motor)
+        inicializar(template_path)
+        while len(_CONTEXTOS) >= CONTEXTOS_EM_CACHE:
+            # Descarta o contexto mais antigo (dicionários preservam a ordem de inserção)
+            del _CONTEXTOS[next(iter(_CONTEXTOS))]
+        contexto = _CONTEXTOS[caminho] = dict(
+            processar=processar, template_path=template_path,
+            output_folder=output_folder, rotina=rotina, indices=indices, dt_limite=dt_limite, sinal=sinal,
+            amostra=amostra, destino=None if em_memoria else output_folder
+        )
+    return contexto
+
+def processar_lote(caminho_contexto, lote):
+    """
+    Gera as planilhas de um lote [(reg_h, rows_data)]. Retorna (resultado de cada RF na ordem,
+    medições do lote; ver MedicaoLote.dados). Na saída em memória, o resultado de cada RF gerado
+    é (nome, conteúdo do .xlsx). Se a execução for cancelada, para entre um RF
+    e outro e retorna apenas os já gerados.
+    """
+    c = _carregar_contexto(caminho_contexto)
+    resultados = []
+    medicao = MedicaoLote()
+    for reg_h, rows_data in lote:
+        if sinal_cancelado(c['sinal']):
+            break
+        perfil = caminho_amostra(c['output_folder'], reg_h) if reg_h.chave in c['amostra'] else None
+        resultados.append(medicao.executar(c['processar'], (
+            reg_h, c['template_path'], c['destino'], c['rotina'], c['indices'], rows_data, c['dt_limite']
+        ), perfil))
+    return resultados, medicao.dados()
+
+def montar_lotes(itens, pesos, n_workers):
+    """
+    Agrupa os itens em lotes de tamanho adaptativo, dos mais pesados para os mais leves.
+    pesos: peso de cada item (ex.: linhas do Detail do RF). Retorna uma lista de listas.
+    """
+    ordem = sorted(range(len(itens)), key=lambda i: pesos[i], reverse=True)
+    restante = sum(max(p, 1) for p in pesos)
+    lotes, lote, peso_lote = [], [], 0
+    alvo = restante / (n_workers * FATOR_LOTE)
+    for i in ordem:
+        lote.append(itens[i])
+        peso_lote += max(pesos[i], 1)
+        if peso_lote >= alvo or len(lote) >= MAX_RFS_POR_LOTE:
+            lotes.append(lote)
+            restante -= peso_lote
+            lote, peso_lote = [], 0
+            alvo = restante / (n_workers * FATOR_LOTE)
+    if lote:
+        lotes.append(lote)
+    return lotes
@@ -0,0 +1,423 @@
+"""
+Geração das planilhas distribuída entre várias máquinas.
+
+O processo principal serve uma fila de tarefas (multiprocessing.managers, sem serviços
+externos) e o PoolDistribuido toma o lugar do PoolTrabalhadores: cada lote de RFs vira uma
+tarefa da fila, consumida por trabalhadores em outras máquinas
+
+    python -m distribuido --endereco SERVIDOR:PORTA
+
+e, opcionalmente, por processos locais. O contexto de cada par e o template seguem pela
+própria fila; as planilhas voltam em memória e são gravadas pelo processo principal, de
+modo que os trabalhadores não precisam enxergar a pasta de saída. Resultados e erros são
+recolhidos no processo principal; as tarefas de um trabalhador que deixa de dar sinal de vida
+voltam para a fila, até TENTATIVAS vezes.
+
+A fila é protegida pela chave de DDV_CHAVE_FILA, a mesma no servidor e nos trabalhadores:
+as tarefas são objetos pickle, e só quem conhece a chave pode enviá-las ou recebê-las.
+"""
+import os
+import sys
+import time
+import pickle
+import signal
+import socket
+import shutil
+import argparse
+import tempfile
+import itertools
+import threading
+import collections
+import multiprocessing
+import concurrent.futures
+from multiprocessing.managers import BaseManager
+
+from despacho import CONTEXTOS_EM_CACHE, processar_lote, empacotar_contexto, desempacotar_contexto
+from cancelamento import ExecucaoCancelada
+
+VARIAVEL_CHAVE = "DDV_CHAVE_FILA"
+
+# Intervalo (s) entre os sinais de vida de cada trabalhador
+INTERVALO_SINAL = 5
+
+# Trabalhador sem sinal de vida por este tempo (s) é dado como perdido e as suas tarefas voltam para a fila
+TEMPO_SEM_SINAL = 30
+
+# Vezes que uma tarefa volta para a fila antes de falhar (ex.: um lote que derruba todo trabalhador)
+TENTATIVAS = 3
+
+# Intervalo (s) entre as tentativas de conexão de um trabalhador sem servidor
+INTERVALO_CONEXAO = 5
+
+# Tempo máximo (s) de espera pelo término de cada trabalhador local interrompido
+TEMPO_ENCERRAMENTO = 5
+
+def chave_fila():
+    """Chave de autenticação da fila (variável de ambiente DDV_CHAVE_FILA)."""
+    chave = os.environ.get(VARIAVEL_CHAVE)
+    if not chave:
+        raise RuntimeError(f"Defina a chave da fila em {VARIAVEL_CHAVE} (a mesma no servidor e nos trabalhadores).")
+    return chave.encode("utf-8")
+
+def ler_endereco(texto):
+    """'host:porta' -> (host, porta)."""
+    host, _, porta = texto.rpartition(":")
+    if not porta.isdigit():
+        raise ValueError(f"Endereço inválido (esperado host:porta): {texto}")
+    return host, int(porta)
+
+class _Tarefa:
+    __slots__ = ("dados", "futuro", "tentativas", "trabalhador")
+
+    def __init__(self, dados, futuro):
+        self.dados = dados
+        self.futuro = futuro
+        self.tentativas = 0
+        self.trabalhador = None
+
+class _Fila:
+    """
+    Estado da fila, no processo principal. Os trabalhadores usam registrar_sinal, pegar,
+    concluir e pacote pelo gerenciador; o PoolDistribuido usa os demais métodos direto.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._ids = itertools.count()
+        self._pendentes = collections.deque()
+        self._tarefas = {}
+        self._sinais = {}
+        # Pacotes de contexto pelo caminho no processo principal (ver despacho.empacotar_contexto)
+        self._pacotes = collections.OrderedDict()
+
+    # --- Trabalhadores ---
+    def registrar_sinal(self, trabalhador):
+        with self._cond:
+            self._sinais[trabalhador] = time.monotonic()
+
+    def pegar(self, trabalhador, timeout):
+        """Próxima tarefa: (id, dados) ou None se a fila continuar vazia por timeout segundos."""
+        limite = time.monotonic() + timeout
+        with self._cond:
+            self._sinais[trabalhador] = time.monotonic()
+            while True:
+                while self._pendentes:
+                    id_tarefa = self._pendentes.popleft()
+                    tarefa = self._tarefas.get(id_tarefa)
+                    # Tarefa cancelada enquanto aguardava: descartada sem chegar ao trabalhador
+                    if tarefa is None or (tarefa.tentativas == 0 and not tarefa.futuro.set_running_or_notify_cancel()):
+                        self._tarefas.pop(id_tarefa, None)
+                        continue
+                    tarefa.trabalhador = trabalhador
+                    return id_tarefa, tarefa.dados
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._cond.wait(restante)
+
+    def concluir(self, trabalhador, id_tarefa, resposta):
+        """resposta: pickle de (True, resultado) ou (False, exceção)."""
+        with self._cond:
+            self._sinais[trabalhador] = time.monotonic()
+            tarefa = self._tarefas.get(id_tarefa)
+            # Resposta de uma tarefa já devolvida à fila (trabalhador dado como perdido) ou cancelada: ignorada
+            if tarefa is None or tarefa.trabalhador != trabalhador:
+                return
+            del self._tarefas[id_tarefa]
+        try:
+            ok, valor = pickle.loads(resposta)
+        except Exception as e:
+            ok, valor = False, RuntimeError(f"Resposta ilegível de {trabalhador}: {str(e)}")
+        if ok:
+            tarefa.futuro.set_result(valor)
+        else:
+            tarefa.futuro.set_exception(valor)
+
+    def pacote(self, caminho):
+        with self._cond:
+            return self._pacotes.get(caminho)
+
+    # --- Processo principal ---
+    def adicionar(self, dados):
+        futuro = concurrent.futures.Future()
+        with self._cond:
+            id_tarefa = next(self._ids)
+            self._tarefas[id_tarefa] = _Tarefa(dados, futuro)
+            self._pendentes.append(id_tarefa)
+            self._cond.notify()
+        return futuro
+
+    def publicar_pacote(self, caminho):
+        with self._cond:
+            if caminho in self._pacotes:
+                return
+        pacote = empacotar_contexto(caminho)
+        with self._cond:
+            self._pacotes[caminho] = pacote
+            while len(self._pacotes) > CONTEXTOS_EM_CACHE:
+                self._pacotes.popitem(last=False)
+
+    def trabalhadores_ativos(self):
+        limite = time.monotonic() - TEMPO_SEM_SINAL
+        with self._cond:
+            return sum(1 for instante in self._sinais.values() if instante >= limite)
+
+    def recuperar(self):
+        """Devolve à fila as tarefas dos trabalhadores sem sinal de vida; falha as que esgotaram as tentativas."""
+        limite = time.monotonic() - TEMPO_SEM_SINAL
+        falhas = []
+        with self._cond:
+            perdidos = {t for t, instante in self._sinais.items() if instante < limite}
+            if not perdidos:
+                return
+            for t in perdidos:
+                del self._sinais[t]
+            # As tarefas recuperadas vão para o início da fila: são as mais antigas da execução
+            for id_tarefa, tarefa in sorted(self._tarefas.items(), reverse=True):
+                if tarefa.trabalhador not in perdidos:
+                    continue
+                tarefa.trabalhador = None
+                tarefa.tentativas += 1
+                if tarefa.tentativas >= TENTATIVAS:
+                    del self._tarefas[id_tarefa]
+                    falhas.append(tarefa)
+                else:
+                    self._pendentes.appendleft(id_tarefa)
+            self._cond.notify_all()
+        for tarefa in falhas:
+            tarefa.futuro.set_exception(RuntimeError(
+                f"Lote abandonado por {TENTATIVAS} trabalhadores sem sinal de vida."))
+
+    def cancelar_tudo(self):
+        """Esvazia a fila: as tarefas pendentes são canceladas e as em andamento, dadas como canceladas."""
+        with self._cond:
+            tarefas = list(self._tarefas.values())
+            self._tarefas.clear()
+            self._pendentes.clear()
+        for tarefa in tarefas:
+            if not tarefa.futuro.cancel() and not tarefa.futuro.done():
+                tarefa.futuro.set_exception(ExecucaoCancelada())
+
+class _Cliente(BaseManager):
+    pass
+
+_Cliente.register("fila")
+
+class ExecutorDistribuido(concurrent.futures.Executor):
+    """Executor cujas tarefas vão para a fila: o mesmo submit do ProcessPoolExecutor usado em pipeline."""
+    def __init__(self, fila):
+        self._fila = fila
+
+    def submit(self, fn, /, *args, **kwargs):
+        if fn is processar_lote:
+            # O contexto do par segue pela fila junto com o template, uma única vez por contexto
+            self._fila.publicar_pacote(args[0])
+        return self._fila.adicionar(pickle.dumps((fn, args, kwargs), pickle.HIGHEST_PROTOCOL))
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if cancel_futures:
+            self._fila.cancelar_tudo()
+
+class PoolDistribuido:
+    """
+    Fila servida em endereco (host, porta) para os trabalhadores de outras máquinas, com a
+    mesma interface do PoolTrabalhadores. locais: trabalhadores nesta máquina (0: só remotos).
+    """
+    # As planilhas voltam em memória: os trabalhadores remotos não enxergam a saída
+    em_memoria = True
+
+    def __init__(self, endereco, chave, locais=0):
+        self._fila = _Fila()
+        self._chave = chave
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+
+        class _Servidor(BaseManager):
+            pass
+
+        _Servidor.register("fila", callable=lambda: self._fila,
+                           exposed=("registrar_sinal", "pegar", "concluir", "pacote"))
+        self._servidor = _Servidor(address=endereco, authkey=chave).get_server()
+        # O serve_forever do gerenciador não tem como parar de aceitar conexões: o laço é o de _atender
+        self._servidor.stop_event = threading.Event()
+        self.endereco = self._servidor.address
+        threading.Thread(target=self._atender, name="ddv-fila", daemon=True).start()
+
+        host, porta = self.endereco
+        # Os trabalhadores locais se conectam pela interface local mesmo com o servidor ouvindo em todas
+        self._endereco_local = ("127.0.0.1" if host in ("", "0.0.0.0") else host, porta)
+        self._contexto_mp = multiprocessing.get_context("spawn")
+        self._locais = [None] * locais
+        self._subir_locais()
+        self._executor = ExecutorDistribuido(self._fila)
+        threading.Thread(target=self._vigiar, name="ddv-fila-vigia", daemon=True).start()
+
+    @property
+    def n_workers(self):
+        """Trabalhadores com sinal de vida (ao menos os locais): define o tamanho dos lotes."""
+        return max(1, len(self._locais), self._fila.trabalhadores_ativos())
+
+    def _atender(self):
+        while not self._parar.is_set():
+            try:
+                conexao = self._servidor.listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                # Conexão recusada na autenticação ou servidor encerrado
+                continue
+            threading.Thread(target=self._servidor.handle_request, args=(conexao,), daemon=True).start()
+
+    def _subir_locais(self):
+        for i, p in enumerate(self._locais):
+            if p is None or not p.is_alive():
+                p = self._contexto_mp.Process(target=executar_trabalhador, args=(self._endereco_local, self._chave),
+                                              name=f"ddv-trabalhador-{i}", daemon=True)
+                p.start()
+                self._locais[i] = p
+
+    def _vigiar(self):
+        while not self._parar.wait(INTERVALO_SINAL):
+            self._fila.recuperar()
+            with self._trava:
+                if not self._parar.is_set():
+                    self._subir_locais()
+
+    def executor(self):
+        return self._executor
+
+    def interromper(self):
+        """Esvazia a fila e encerra na hora os trabalhadores locais; os remotos terminam o lote atual e descartam o resultado."""
+        self._fila.cancelar_tudo()
+        with self._trava:
+            self._encerrar_locais()
+            self._subir_locais()
+
+    def _encerrar_locais(self):
+        for p in self._locais:
+            if p is not None:
+                p.terminate()
+        for p in self._locais:
+            if p is not None:
+                p.join(TEMPO_ENCERRAMENTO)
+
+    def encerrar(self):
+        self._parar.set()
+        self._fila.cancelar_tudo()
+        with self._trava:
+            self._encerrar_locais()
+        self._servidor.stop_event.set()
+        self._servidor.listener.close()
+
+def _conectar(endereco, chave):
+    cliente = _Cliente(address=endereco, authkey=chave)
+    cliente.connect()
+    return cliente.fila()
+
+def _enviar_sinais(fila, trabalhador, parar):
+    while not parar.wait(INTERVALO_SINAL):
+        try:
+            fila.registrar_sinal(trabalhador)
+        except (OSError, EOFError):
+            return
+
+class _ContextosLocais:
+    """Cópias locais dos contextos publicados no processo principal, pelo caminho de lá."""
+    def __init__(self, fila):
+        self._fila = fila
+        self.pasta = tempfile.mkdtemp(prefix="ddv_distribuido_")
+        self._caminhos = collections.OrderedDict()
+
+    def obter(self, caminho):
+        local = self._caminhos.get(caminho)
+        if local is None:
+            pacote = self._fila.pacote(caminho)
+            if pacote is None:
+                raise RuntimeError(f"Contexto não publicado na fila: {caminho}")
+            local = self._caminhos[caminho] = desempacotar_contexto(pacote, self.pasta)
+            while len(self._caminhos) > CONTEXTOS_EM_CACHE:
+                os.remove(self._caminhos.popitem(last=False)[1])
+        return local
+
+def _consumir(fila, trabalhador, contextos):
+    while True:
+        tarefa = fila.pegar(trabalhador, INTERVALO_SINAL)
+        if tarefa is None:
+            continue
+        id_tarefa, dados = tarefa
+        try:
+            fn, args, kwargs = pickle.loads(dados)
+            if fn is processar_lote:
+                args = (contextos.obter(args[0]),) + args[1:]
+            resposta = (True, fn(*args, **kwargs))
+        except Exception as e:
+            resposta = (False, e)
+        try:
+            dados_resposta = pickle.dumps(resposta, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            dados_resposta = pickle.dumps((False, RuntimeError(f"Resultado não serializável: {str(e)}")))
+        fila.concluir(trabalhador, id_tarefa, dados_resposta)
+
+def executar_trabalhador(endereco, chave, persistente=False):
+    """
+    Consome a fila em endereco até o servidor encerrar. persistente: volta a se conectar
+    quando o servidor cai ou ainda não subiu (trabalhador remoto à espera da próxima execução).
+    """
+    trabalhador = f"{socket.gethostname()}:{os.getpid()}"
+    # Encerrado com terminate (ex.: PoolDistribuido.interromper), ainda remove a cópia dos contextos
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    while True:
+        parar = threading.Event()
+        contextos = None
+        try:
+            fila = _conectar(endereco, chave)
+            fila.registrar_sinal(trabalhador)
+            threading.Thread(target=_enviar_sinais, args=(fila, trabalhador, parar), daemon=True).start()
+            contextos = _ContextosLocais(fila)
+            _consumir(fila, trabalhador, contextos)
+        except (OSError, EOFError):
+            # Servidor indisponível ou encerrado
+            if not persistente:
+                return
+        finally:
+            parar.set()
+            if contextos is not None:
+                shutil.rmtree(contextos.pasta, ignore_errors=True)
+        time.sleep(INTERVALO_CONEXAO)
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog="distribuido",
+        description="Trabalhador da geração distribuída das planilhas do DDV (ver ddv --distribuido). "
+                    f"A chave da fila vem de {VARIAVEL_CHAVE}."
+    )
+    parser.add_argument("--endereco", required=True, help="Endereço da fila no processo principal (host:porta).")
+    parser.add_argument("--processos", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Trabalhadores nesta máquina (padrão: núcleos - 1).")
+    return parser
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    try:
+        endereco = ler_endereco(args.endereco)
+        chave = chave_fila()
+    except (ValueError, RuntimeError) as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    # Encerrado pelo sistema (ex.: serviço parado), leva junto os trabalhadores
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    contexto_mp = multiprocessing.get_context("spawn")
+    processos = [contexto_mp.Process(target=executar_trabalhador, args=(endereco, chave, True),
+                                     name=f"ddv-trabalhador-{i}", daemon=True) for i in range(max(1, args.processos))]
+    for p in processos:
+        p.start()
+    print(f"{len(processos)} trabalhadores consumindo {args.endereco} (Ctrl+C para encerrar).", file=sys.stderr)
+    try:
+        for p in processos:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processos:
+            p.terminate()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
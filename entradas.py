@@ -0,0 +1,96 @@
+"""
+Entradas de uma execução: pares Header/Detail com os índices e a rotina de cada um.
+
+Um lote pode vir de uma pasta (pares PROCESSO_F.txt / PROCESSO_V.txt, com a mesma rotina
+e os mesmos índices para todos) ou de uma lista em texto, uma entrada por linha:
+
+    header;detail[;indices[;rotina]]
+
+Caminhos relativos da lista são resolvidos a partir da pasta da própria lista; linhas em
+branco e iniciadas por # são ignoradas.
+"""
+import os
+
+# Sufixos dos arquivos do Mainframe: Header (_F) e Detail (_V)
+SUFIXO_HEADER = "_F"
+SUFIXO_DETAIL = "_V"
+
+SEPARADOR_LISTA = ";"
+
+class Entrada:
+    """Um par Header/Detail da execução. As fontes podem ser caminhos ou buffers em memória."""
+    def __init__(self, fonte_header, fonte_detail, fonte_indices=None, rotina=None, nome=None):
+        self.fonte_header = fonte_header
+        self.fonte_detail = fonte_detail
+        self.fonte_indices = fonte_indices
+        self.rotina = rotina
+        # Nome usado no resumo e na pasta Parquet do par: o do Header sem o sufixo _F
+        if nome is None and isinstance(fonte_header, (str, os.PathLike)):
+            nome = _base_header(os.path.basename(fonte_header))
+        self.nome = nome or "entrada"
+
+    def __repr__(self):
+        return f"Entrada({self.nome!r}, rotina={self.rotina!r})"
+
+def _base_header(nome_arquivo):
+    """Nome do Header sem a extensão e sem o sufixo _F; None se não for um Header."""
+    raiz, _ = os.path.splitext(nome_arquivo)
+    if raiz.upper().endswith(SUFIXO_HEADER):
+        return raiz[:-len(SUFIXO_HEADER)]
+    return None
+
+def _pares_da_pasta(pasta, rotina, fonte_indices):
+    arquivos = {n.upper(): n for n in os.listdir(pasta) if os.path.isfile(os.path.join(pasta, n))}
+    entradas, sem_detail = [], []
+    for nome in sorted(arquivos.values()):
+        base = _base_header(nome)
+        if base is None:
+            continue
+        extensao = os.path.splitext(nome)[1]
+        detail = arquivos.get((base + SUFIXO_DETAIL + extensao).upper())
+        if detail is None:
+            sem_detail.append(nome)
+            continue
+        entradas.append(Entrada(os.path.join(pasta, nome), os.path.join(pasta, detail), fonte_indices, rotina, base))
+    if sem_detail:
+        raise ValueError(f"Detail (_V) não encontrado para: {', '.join(sem_detail)}")
+    return entradas
+
+def _pares_da_lista(caminho, rotina, fonte_indices):
+    pasta = os.path.dirname(os.path.abspath(caminho))
+
+    def resolver(valor):
+        return os.path.join(pasta, valor) if valor else None
+
+    entradas = []
+    with open(caminho, encoding="utf-8-sig") as f:
+        for n, linha in enumerate(f, 1):
+            linha = linha.strip()
+            if not linha or linha.startswith("#"):
+                continue
+            campos = [c.strip() for c in linha.split(SEPARADOR_LISTA)]
+            if len(campos) < 2 or not campos[0] or not campos[1]:
+                raise ValueError(f"{caminho}:{n}: informe ao menos header{SEPARADOR_LISTA}detail")
+            campos += [""] * (4 - len(campos))
+            entradas.append(Entrada(
+                resolver(campos[0]), resolver(campos[1]), resolver(campos[2]) or fonte_indices, campos[3] or rotina
+            ))
+    return entradas
+
+def descobrir_entradas(origem, rotina, fonte_indices=None):
+    """
+    Entradas de um lote a partir de uma pasta (pares _F/_V) ou de uma lista de pares.
+    rotina e fonte_indices valem para as entradas que não informam os seus.
+    """
+    if os.path.isdir(origem):
+        entradas = _pares_da_pasta(origem, rotina, fonte_indices)
+    else:
+        entradas = _pares_da_lista(origem, rotina, fonte_indices)
+    if not entradas:
+        raise ValueError(f"Nenhum par Header/Detail encontrado em: {origem}")
+
+    for e in entradas:
+        for caminho in (e.fonte_header, e.fonte_detail, e.fonte_indices):
+            if caminho and not os.path.isfile(caminho):
+                raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
+    return entradas
@@ -1,13 +1,34 @@
+import io
 import os
 import datetime
 import re
-from itertools import groupby
+import pickle
+import hashlib
+import tempfile
 import openpyxl
 from openpyxl.styles import PatternFill
 
-# Constantes globais - atualizadas para a lógica de 2019 (Sem o 7011 e 7012)
-CODIGOS_IPREM = frozenset({"5001", "6013", "6017", "PREV", "RPPS"})
-CODIGOS_HSPM = frozenset({"5101", "6015", "HSPM"})
+from medicao import cronometro
+
+# Primeira linha de dados da aba Receitas (linha modelo) e início do rodapé no template
+LINHA_MODELO = 17
+INICIO_FOOTER = 18
+
+# Colunas preenchidas ativamente pelo código não devem receber fórmula do template original
+COLUNAS_VALORES_TXT = {1, 2, 4, 5, 6, 7}
+LETRAS_SOMA = {3: 'C', 4: 'D', 5: 'E', 6: 'F', 7: 'G'}
+
+# Padrões das fórmulas do rodapé: soma a partir da linha modelo e referências de célula
+_RE_SOMA_MODELO = re.compile(r"([A-Z]+)17:([A-Z]+)(\d+)")
+_RE_REFERENCIA = re.compile(r"([A-Z]+)(\d+)")
+
+# Templates derivados, com os índices de correção já gravados no TOTINDICE, reaproveitados
+# entre execuções com os mesmos índices; os mais antigos são removidos além do limite
+PASTA_TEMPLATES = os.path.join(tempfile.gettempdir(), "ddv_templates")
+TEMPLATES_EM_CACHE = 8
+
+# Templates mantidos em memória por trabalhador (o original e os derivados das últimas execuções)
+SNAPSHOTS_EM_CACHE = 4
 
 class TemplateInfo:
     def __init__(self):
@@ -29,13 +50,13 @@ def extrair_info_template(wb):
     
     # 1. Linha Modelo (17)
     for col in range(1, ws.max_column + 1):
-        cell = ws.cell(row=17, column=col)
+        cell = ws.cell(row=LINHA_MODELO, column=col)
         # Copia apenas o ID numérico do estilo. Evita cópias pesadas de memória.
         info.estilos_linha_modelo[col] = cell._style
         info.formulas_linha_modelo[col] = cell.value if _eh_formula(cell.value) else None
 
     # 2. Footer - Otimizado
-    start_footer = 18
+    start_footer = INICIO_FOOTER
     for r in range(start_footer, ws.max_row + 20): 
         row_data = []
         for c in range(1, ws.max_column + 1):
@@ -53,98 +74,243 @@ def extrair_info_template(wb):
             
     return info
 
-def processar_arquivo_isolado(args):
-    (line_h, template_path, output_folder, rotina, indices, detalhes, dt_limite) = args
+def caminho_relativo(rotina, proc, rf):
+    """Caminho da planilha do RF dentro da saída: AAAA-MM-DD/Processo_X - CD 1/ROTINA_PROC-RF.xlsx"""
+    nome_arq = f"{rotina}_{proc}-{rf}.xlsx"
+    return os.path.join(datetime.datetime.now().strftime("%Y-%m-%d"), f"Processo_{proc} - CD 1", nome_arq)
+
+def caminho_saida(output_folder, rotina, proc, rf):
+    """
+    Nome e destino da planilha do RF: o caminho na saída, criando a pasta do processo, ou,
+    com output_folder None, um buffer em memória (saída em ZIP, ver arquivo_zip.py).
+    """
+    relativo = caminho_relativo(rotina, proc, rf)
+    if output_folder is None:
+        return os.path.basename(relativo), io.BytesIO()
+    path = os.path.join(output_folder, relativo)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return os.path.basename(path), path
+
+def resultado_saida(nome_arq, destino):
+    """Resultado da tarefa: o nome do arquivo ou, com o destino em memória, (nome, conteúdo)."""
+    if isinstance(destino, io.BytesIO):
+        return nome_arq, destino.getvalue()
+    return nome_arq
+
+def processar_formula_footer(val, linha_fim, offset_val):
+    """Atualiza as fórmulas do rodapé usando Cláusulas de Guarda."""
+    if not _eh_formula(val):
+        return val
+        
+    vu = val.upper()
+    
+    if ("SUM" in vu or "SOMA" in vu) and ":" in vu:
+        m = _RE_SOMA_MODELO.search(vu)
+        if m:
+            return f"=SUM({m.group(1)}17:{m.group(2)}{linha_fim})"
+
+    def deslocar_linha(m):
+        linha_atual = int(m.group(2))
+        return f"{m.group(1)}{linha_atual + offset_val}" if linha_atual >= 18 else m.group(0)
+        
+    nova_formula = _RE_REFERENCIA.sub(deslocar_linha, val)
+    
+    if "IFERROR" not in vu and "SEERRO" not in vu:
+        return f'=IFERROR({nova_formula[1:]}, "")'
+        
+    return nova_formula
+
+def eh_linha_totais(valores):
+    """Identifica a linha do rodapé escrita "Totais"."""
+    return any(str(v).strip().lower() == 'totais' for v in valores if v is not None)
+
+def valor_footer(val, col, is_totais, linha_fim_dados, offset):
+    """Valor final de uma célula do rodapé, deslocado para depois das linhas de dados."""
+    if is_totais:
+        # Coluna B: Não deve somar o total. Deixa em branco.
+        if col == 2:
+            return ""
+        # Colunas C, D, E, F e G: Aplica a fórmula de soma corrigida do topo até o fim dos dados
+        if col in LETRAS_SOMA:
+            letra = LETRAS_SOMA[col]
+            return f"=SUM({letra}17:{letra}{linha_fim_dados})"
+    return processar_formula_footer(val, linha_fim_dados, offset)
+
+def aplicar_indices(ws_idx, indices):
+    """Acrescenta ao TOTINDICE os índices (data, valor) cuja data ainda não está na coluna A."""
+    r_idx = ws_idx.max_row + 1 if ws_idx.max_row > 1 else 2
+    existing = {r[0] for r in ws_idx.iter_rows(min_col=1, max_col=1, values_only=True) if isinstance(r[0], datetime.datetime)}
+
+    for dt, val in indices:
+        if dt not in existing:
+            ws_idx.cell(r_idx, 1, dt).number_format = 'dd/mm/yyyy'
+            ws_idx.cell(r_idx, 2, val).number_format = '0.000000'
+            r_idx += 1
+
+def _remover_templates_antigos(pasta, manter):
     try:
-        proc = line_h[0:12].strip()
-        rf = line_h[12:21].strip()
-        autor = line_h[87:119].strip()
-        padrao = line_h[171:180].strip()
-
-        nome_arq = f"{rotina}_{proc}-{rf}.xlsx"
-        day_folder = os.path.join(output_folder, datetime.datetime.now().strftime("%Y-%m-%d"))
-        p_folder = os.path.join(day_folder, f"Processo_{proc} - CD 1")
-        os.makedirs(p_folder, exist_ok=True)
-        path = os.path.join(p_folder, nome_arq)
-
-        # O trabalhador (processo) abre o ficheiro uma única vez de forma independente
+        arquivos = [os.path.join(pasta, n) for n in os.listdir(pasta) if n.endswith(".xlsx")]
+        arquivos.sort(key=os.path.getmtime, reverse=True)
+        for caminho in arquivos[manter:]:
+            os.remove(caminho)
+    except OSError:
+        pass
+
+def template_com_indices(template_path, indices, pasta=PASTA_TEMPLATES):
+    """
+    Cópia do template com os índices já gravados no TOTINDICE, em cache no disco pelo hash
+    do template e dos índices. Retorna (caminho do template, None): os trabalhadores recebem
+    indices=None e não tocam mais no TOTINDICE.
+    """
+    if not indices:
+        return template_path, None
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(template_path, "rb") as f:
+        h.update(f.read())
+    h.update(pickle.dumps(list(indices), protocol=pickle.HIGHEST_PROTOCOL))
+    destino = os.path.join(pasta, f"XLS-{h.hexdigest()}.xlsx")
+
+    if os.path.exists(destino):
+        # Marca como usado: a limpeza remove os menos usados recentemente
+        os.utime(destino)
+        return destino, None
+
+    os.makedirs(pasta, exist_ok=True)
+    wb = openpyxl.load_workbook(template_path)
+    aplicar_indices(wb["TOTINDICE"], indices)
+    # Gravado à parte e renomeado: execuções simultâneas nunca leem um template pela metade
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    wb.save(temporario)
+    wb.close()
+    os.replace(temporario, destino)
+    _remover_templates_antigos(pasta, TEMPLATES_EM_CACHE)
+    return destino, None
+
+class PlanoTemplate:
+    """
+    Valores da aba Receitas que dependem só do template e da quantidade de linhas de dados:
+    as fórmulas de cada linha e o rodapé deslocado. Compilado uma vez por trabalhador; os
+    resultados são memorizados pela linha (os RFs costumam ter as mesmas quantidades de meses).
+    Os estilos não entram no plano: cada cópia do workbook usa os IDs de estilo do próprio tpl_info.
+    """
+    def __init__(self, tpl_info):
+        # Fórmulas da linha modelo separadas no "17", para a junção com o número da linha de destino
+        self._formulas = []
+        for col in sorted(tpl_info.estilos_linha_modelo):
+            fm = tpl_info.formulas_linha_modelo.get(col)
+            if col == 3:
+                # INJEÇÃO DA FÓRMULA NA COLUNA C (3) COM REFERÊNCIA FIXA EM $D$10/1
+                self._formulas.append((col, ("=B", "*$D$10/1")))
+            # Fórmula do template APENAS nas colunas que não recebem TXT
+            elif fm and col not in COLUNAS_VALORES_TXT:
+                self._formulas.append((col, tuple(fm.split("17"))))
+        self._footer = [
+            (eh_linha_totais(c['value'] for c in r_dat), [c['value'] for c in r_dat])
+            for r_dat in tpl_info.dados_footer
+        ]
+        self._linhas = {}
+        self._rodapes = {}
+
+    def formulas_linha(self, linha):
+        """[(coluna, fórmula)] da linha de dados."""
+        formulas = self._linhas.get(linha)
+        if formulas is None:
+            texto = str(linha)
+            formulas = self._linhas[linha] = [(col, texto.join(partes)) for col, partes in self._formulas]
+        return formulas
+
+    def rodape(self, inicio):
+        """[(é a linha Totais, valores das células)] do rodapé escrito a partir da linha inicio."""
+        rodape = self._rodapes.get(inicio)
+        if rodape is None:
+            linha_fim_dados = inicio - 1
+            offset = inicio - INICIO_FOOTER
+            rodape = self._rodapes[inicio] = [
+                (is_totais, [valor_footer(val, j + 1, is_totais, linha_fim_dados, offset) for j, val in enumerate(valores)])
+                for is_totais, valores in self._footer
+            ]
+        return rodape
+
+# Cache do template por processo trabalhador: caminho -> (snapshot serializado de (wb, tpl_info), PlanoTemplate)
+_CACHE_TEMPLATE = {}
+
+def inicializar_trabalhador(template_path):
+    """
+    Initializer do pool de processos.
+    Carrega e analisa o template uma única vez por trabalhador, antes da primeira tarefa.
+    """
+    _snapshot_template(template_path)
+
+def _snapshot_template(template_path):
+    entrada = _CACHE_TEMPLATE.pop(template_path, None)
+    if entrada is None:
         wb = openpyxl.load_workbook(template_path)
-        
-        # Lê a informação do template usando o ficheiro que acabou de abrir
         tpl_info = extrair_info_template(wb)
+        # wb e tpl_info são serializados juntos para que os IDs de estilo (_style) da cópia
+        # continuem compartilhados com as células do próprio workbook, como na leitura do disco
+        snapshot = pickle.dumps((wb, tpl_info), protocol=pickle.HIGHEST_PROTOCOL)
+        wb.close()
+        entrada = (snapshot, PlanoTemplate(tpl_info))
+        while len(_CACHE_TEMPLATE) >= SNAPSHOTS_EM_CACHE:
+            # Descarta o snapshot usado há mais tempo (dicionários preservam a ordem de inserção)
+            del _CACHE_TEMPLATE[next(iter(_CACHE_TEMPLATE))]
+    # Reinserido no fim: o primeiro do dicionário é sempre o usado há mais tempo
+    _CACHE_TEMPLATE[template_path] = entrada
+    return entrada
+
+def obter_template(template_path):
+    """
+    Retorna uma cópia nova do workbook do template e de suas informações, a partir da memória,
+    e o PlanoTemplate compartilhado pelos RFs do trabalhador.
+    """
+    snapshot, plano = _snapshot_template(template_path)
+    wb, tpl_info = pickle.loads(snapshot)
+    return wb, tpl_info, plano
+
+def processar_arquivo_isolado(args):
+    # rows_data chega pronto: a agregação mensal é feita uma única vez no processo principal;
+    # indices None: já gravados no template (ver template_com_indices)
+    (reg_h, template_path, output_folder, rotina, indices, rows_data, dt_limite) = args
+    crono = cronometro()
+    try:
+        proc = reg_h.processo.strip()
+        rf = reg_h.rf.strip()
+        autor = reg_h.autor.strip()
+
+        nome_arq, path = caminho_saida(output_folder, rotina, proc, rf)
+
+        # OTIMIZAÇÃO: o template é lido e analisado uma única vez por trabalhador;
+        # cada RF recebe uma cópia desserializada da memória
+        wb, tpl_info, plano = obter_template(template_path)
+        crono.marcar("template")
         
         ws = wb["Receitas"]
-        ws_idx = wb["TOTINDICE"]
 
         # Indices
-        r_idx = ws_idx.max_row + 1 if ws_idx.max_row > 1 else 2
-        existing = {r[0] for r in ws_idx.iter_rows(min_col=1, max_col=1, values_only=True) if isinstance(r[0], datetime.datetime)}
-        
-        for dt, val in indices:
-            if dt not in existing:
-                ws_idx.cell(r_idx, 1, dt).number_format = 'dd/mm/yyyy'
-                ws_idx.cell(r_idx, 2, val).number_format = '0.000000'
-                r_idx += 1
+        if indices is not None:
+            aplicar_indices(wb["TOTINDICE"], indices)
 
         ws["C7"] = proc
         ws["C8"] = f"{autor} - RF: {rf}"
+        crono.marcar("indices")
 
-        # Detalhes - Usa constantes congeladas
-        def sort_key(x): return x[23:27] + x[21:23]
-        detalhes.sort(key=sort_key)
-        
-        rows_data = []
-        last_dt = None
-
-        for key, group in groupby(detalhes, key=sort_key):
-            g = list(group)
-            t_venc = sum(float(l[86:96]) for l in g) / 100.0
-            t_desc = sum(float(l[116:126]) for l in g) / 100.0
-            
-            v_iprem = sum(float(l[116:126]) for l in g if l[27:31] in CODIGOS_IPREM or (l[27:31] == "7012" and l[23:27].isdigit() and int(l[23:27]) < 2019)) / 100.0
-            v_hspm = sum(float(l[116:126]) for l in g if l[27:31] in CODIGOS_HSPM or (l[27:31] == "7011" and l[23:27].isdigit() and int(l[23:27]) < 2019)) / 100.0
-            
-            v_funfin = sum(float(l[116:126]) for l in g if l[27:31] == "7011" and l[23:27].isdigit() and int(l[23:27]) >= 2019) / 100.0
-            v_funprev = sum(float(l[116:126]) for l in g if l[27:31] == "7012" and l[23:27].isdigit() and int(l[23:27]) >= 2019) / 100.0
-
-            val_q = (t_venc - t_desc) + v_iprem + v_hspm
-            
-            ano, mes = int(key[:4]), int(key[4:])
-            nxt = datetime.datetime(ano, mes, 28) + datetime.timedelta(days=4)
-            last_dt = nxt - datetime.timedelta(days=nxt.day)
-
-            # Adicionando na lista usando last_dt
-            rows_data.append({
-                'dt': last_dt,  
-                'q': val_q,
-                'iprem': v_iprem,
-                'hspm': v_hspm,
-                'funfin': v_funfin,
-                'funprev': v_funprev
-            })
+        last_dt = rows_data[-1]['dt'] if rows_data else None
 
-        curr = 17
-        
-        # Colunas preenchidas ativamente pelo código não devem receber fórmula do template original
-        colunas_valores_txt = {1, 2, 4, 5, 6, 7} 
+        curr = LINHA_MODELO
+        estilos = [(col, tpl_info.estilos_linha_modelo.get(col)) for col in range(1, ws.max_column + 1)]
         
         for d in rows_data:
             # 1. Aplica o estilo e fórmula primeiro
-            for col in range(1, ws.max_column + 1):
+            for col, st_id in estilos:
                 cell = ws.cell(curr, col)
-                st_id = tpl_info.estilos_linha_modelo.get(col)
-                fm = tpl_info.formulas_linha_modelo.get(col)
-                
                 # APLICAÇÃO DE ESTILO RELÂMPAGO
                 if st_id is not None:
                     cell._style = st_id
-                
-                # INJEÇÃO DA FÓRMULA NA COLUNA C (3) COM REFERÊNCIA FIXA EM $D$10/1
-                if col == 3:
-                    cell.value = f'=B{curr}*$D$10/1'
-                # Aplicar fórmula do template APENAS nas colunas que não recebem TXT
-                elif fm and col not in colunas_valores_txt:
-                    cell.value = fm.replace("17", str(curr))
+
+            # OTIMIZAÇÃO: fórmulas da linha vindas do plano compilado do template
+            for col, formula in plano.formulas_linha(curr):
+                ws.cell(curr, col).value = formula
 
             # 2. Insere os valores diretos do TXT nas novas colunas
             ws.cell(curr, 1, d['dt'])
@@ -158,59 +324,18 @@ def processar_arquivo_isolado(args):
             ws.cell(curr, 7, d.get('funprev', 0) if d.get('funprev', 0) > 0 else "")  # Coluna G
 
             curr += 1
+        crono.marcar("linhas")
+        crono.contar("linhas", len(rows_data))
 
         # Footer
-        linha_fim_dados = curr - 1
-        offset = curr - 18
-        
-        def processar_formula_footer(val, linha_fim, offset_val):
-            """Atualiza as fórmulas do rodapé usando Cláusulas de Guarda."""
-            if not _eh_formula(val):
-                return val
-                
-            vu = val.upper()
-            
-            if ("SUM" in vu or "SOMA" in vu) and ":" in vu:
-                m = re.search(r"([A-Z]+)17:([A-Z]+)(\d+)", vu)
-                if m:
-                    return f"=SUM({m.group(1)}17:{m.group(2)}{linha_fim})"
-
-            def deslocar_linha(m):
-                linha_atual = int(m.group(2))
-                return f"{m.group(1)}{linha_atual + offset_val}" if linha_atual >= 18 else m.group(0)
-                
-            nova_formula = re.sub(r"([A-Z]+)(\d+)", deslocar_linha, val)
-            
-            if "IFERROR" not in vu and "SEERRO" not in vu:
-                return f'=IFERROR({nova_formula[1:]}, "")'
-                
-            return nova_formula
-        
-        for i, r_dat in enumerate(tpl_info.dados_footer):
+        # OTIMIZAÇÃO: valores do rodapé (fórmulas deslocadas e a linha "Totais") memorizados
+        # no plano pela linha de início, em vez de reescritos célula a célula em cada RF
+        for i, (r_dat, (is_totais, valores)) in enumerate(zip(tpl_info.dados_footer, plano.rodape(curr))):
             r_w = curr + i
             
-            # Identifica se a linha atual do rodapé é a linha escrita "Totais"
-            is_totais = any(str(c['value']).strip().lower() == 'totais' for c in r_dat if c['value'] is not None)
-            
-            for j, c_dat in enumerate(r_dat):
+            for j, (c_dat, val) in enumerate(zip(r_dat, valores)):
                 col = j + 1
                 cell = ws.cell(r_w, col)
-                val = c_dat['value']
-                
-                if is_totais:
-                    # Coluna B: Não deve somar o total. Deixa em branco.
-                    if col == 2:
-                        val = ""
-                    # Colunas C, D, E, F e G: Aplica a fórmula de soma corrigida do topo até o fim dos dados
-                    elif col in {3, 4, 5, 6, 7}:
-                        letras_soma = {3:'C', 4:'D', 5:'E', 6:'F', 7:'G'}
-                        letra = letras_soma[col]
-                        val = f"=SUM({letra}17:{letra}{linha_fim_dados})"
-                    else:
-                        val = processar_formula_footer(val, linha_fim_dados, offset)
-                else:
-                    val = processar_formula_footer(val, linha_fim_dados, offset)
-                
                 cell.value = val
                 
                 # APLICAÇÃO DE ESTILO RELÂMPAGO NO FOOTER
@@ -223,9 +348,11 @@ def processar_arquivo_isolado(args):
 
         ws["C10"] = last_dt if last_dt else dt_limite
         ws["C10"].number_format = 'dd/mmm/yy'
+        crono.marcar("rodape")
         wb.save(path)
         wb.close()
-        return nome_arq
+        crono.marcar("salvar")
+        return resultado_saida(nome_arq, path)
         
     except Exception as e:
         return f"ERRO: {proc} - {str(e)}"
\ No newline at end of file
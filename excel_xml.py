@@ -0,0 +1,553 @@
+"""
+Motor XML das planilhas: gera o XLSX a partir do template sem o modelo de objetos do openpyxl.
+
+O XLS-MATRIZ.xlsx é tratado como um zip. O XML da aba Receitas é separado na linha
+modelo (17) e no rodapé uma única vez por trabalhador. Cada RF escreve apenas as
+linhas <row> geradas e as partes estáticas vão para o novo zip já compactadas.
+"""
+import re
+import time
+import zlib
+import struct
+import zipfile
+import datetime
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+from excel import (
+    LINHA_MODELO, INICIO_FOOTER, COLUNAS_VALORES_TXT, SNAPSHOTS_EM_CACHE, caminho_saida, resultado_saida, eh_linha_totais,
+    valor_footer
+)
+from medicao import cronometro
+
+NIVEL_COMPRESSAO = 6
+
+ABA_RECEITAS = "Receitas"
+ABA_INDICES = "TOTINDICE"
+
+# Formatos numéricos aplicados pelo processamento (os mesmos do motor openpyxl)
+FORMATO_DATA_INDICE = 'dd/mm/yyyy'
+FORMATO_VALOR_INDICE = '0.000000'
+FORMATO_DATA_LIMITE = 'dd/mmm/yy'
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Células da aba Receitas preenchidas por RF: (linha, coluna)
+CELULA_PROCESSO = (7, 3)
+CELULA_AUTOR = (8, 3)
+CELULA_DATA_LIMITE = (10, 3)
+
+# Datas do Excel (sistema 1900) contadas a partir de 30/12/1899
+_EPOCA_EXCEL = datetime.datetime(1899, 12, 30)
+
+_RE_LINHA = re.compile(r'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+_RE_CELULA = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_RE_ATRIBUTO = re.compile(r'\s([\w:]+)="([^"]*)"')
+_RE_REF = re.compile(r'([A-Z]+)(\d+)')
+_RE_XF = re.compile(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.S)
+
+def _serial_excel(dt):
+    delta = dt - _EPOCA_EXCEL
+    if delta.seconds or delta.microseconds:
+        return delta.days + (delta.seconds + delta.microseconds / 1e6) / 86400
+    return delta.days
+
+def _numero(valor):
+    # Mesma precisão com que o openpyxl grava os números
+    return "%.16g" % valor
+
+def _letra_coluna(col):
+    letras = ""
+    while col:
+        col, resto = divmod(col - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+def _numero_coluna(letras):
+    col = 0
+    for ch in letras:
+        col = col * 26 + ord(ch) - 64
+    return col
+
+def _atributos(texto):
+    return dict(_RE_ATRIBUTO.findall(texto))
+
+def _atributos_linha(abertura):
+    """Atributos de formatação da linha (altura, bordas), sem a posição e o spans."""
+    attrs = _atributos(abertura)
+    attrs.pop("r", None)
+    attrs.pop("spans", None)
+    return "".join(f' {k}="{v}"' for k, v in attrs.items())
+
+def _texto(valor):
+    """Escapa um texto para o XML; espaços nas pontas precisam de xml:space."""
+    texto = escape(valor)
+    if texto != texto.strip():
+        return f'<t xml:space="preserve">{texto}</t>'
+    return f'<t>{texto}</t>'
+
+def _xml_celula(ref, estilo, valor):
+    """Serializa uma célula com o mesmo tratamento de tipos do openpyxl."""
+    s = f' s="{estilo}"' if estilo else ""
+    if valor is None or valor == "":
+        return f'<c r="{ref}"{s}/>' if estilo else ""
+    if isinstance(valor, bool):
+        return f'<c r="{ref}"{s} t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, datetime.datetime):
+        return f'<c r="{ref}"{s}><v>{_numero(_serial_excel(valor))}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f'<c r="{ref}"{s}><v>{_numero(valor)}</v></c>'
+    if valor.startswith("="):
+        return f'<c r="{ref}"{s}><f>{escape(valor[1:])}</f></c>'
+    return f'<c r="{ref}"{s} t="inlineStr"><is>{_texto(valor)}</is></c>'
+
+def _valor_celula(el, textos):
+    """Valor da célula do template como o openpyxl o enxerga (fórmulas com '=')."""
+    f = el.find("f")
+    if f is not None and f.text:
+        return "=" + f.text
+    tipo = el.get("t", "n")
+    if tipo == "inlineStr":
+        return "".join(t.text or "" for t in el.iter("t"))
+    v = el.find("v")
+    if v is None or v.text is None:
+        return None
+    if tipo == "s":
+        return textos[int(v.text)]
+    if tipo == "n":
+        numero = float(v.text)
+        return int(numero) if numero.is_integer() and "." not in v.text else numero
+    if tipo == "b":
+        return v.text == "1"
+    return v.text
+
+def _comprimir(nome, dados):
+    """Entrada do zip pronta para gravação: (nome, crc, tamanho, dados em deflate cru)."""
+    c = zlib.compressobj(NIVEL_COMPRESSAO, zlib.DEFLATED, -15)
+    comprimido = c.compress(dados) + c.flush()
+    return nome.encode("utf-8"), zlib.crc32(dados), len(dados), comprimido
+
+def _gravar_zip(path, entradas):
+    """
+    Grava o zip com entradas já compactadas (cabeçalhos locais + diretório central).
+    path pode ser um caminho ou um arquivo aberto (ex.: io.BytesIO da saída em ZIP).
+    """
+    t = time.localtime()
+    hora = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    data = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    partes, central, offset = [], [], 0
+    for nome, crc, tamanho, comprimido in entradas:
+        local = struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, 0, 8, hora, data,
+                            crc, len(comprimido), tamanho, len(nome), 0)
+        central.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, 0, 8, hora, data,
+                                   crc, len(comprimido), tamanho, len(nome), 0, 0, 0, 0, 0, offset) + nome)
+        partes += (local, nome, comprimido)
+        offset += len(local) + len(nome) + len(comprimido)
+    diretorio = b"".join(central)
+    partes.append(diretorio)
+    partes.append(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(entradas), len(entradas),
+                              len(diretorio), offset, 0))
+    if not isinstance(path, str):
+        path.write(b"".join(partes))
+        return
+    with open(path, "wb") as f:
+        f.write(b"".join(partes))
+
+class _Estilos:
+    """Acrescenta ao styles.xml os formatos usados pelo processamento (uma vez por template)."""
+    def __init__(self, xml):
+        self.xml = xml
+        ini = xml.index("<cellXfs")
+        fim = xml.index("</cellXfs>")
+        self._xfs = _RE_XF.findall(xml[ini:fim])
+        self._novos_xfs = []
+        self._formatos = {m.group(2): int(m.group(1)) for m in
+                          re.finditer(r'<numFmt numFmtId="(\d+)" formatCode="([^"]*)"', xml)}
+        self._novos_formatos = []
+        self._derivados = {}
+
+    def formato(self, xf_id):
+        """Código do formato numérico de um estilo de célula."""
+        id_fmt = int(_atributos(self._xfs[xf_id].split(">", 1)[0]).get("numFmtId", 0))
+        for codigo, i in self._formatos.items():
+            if i == id_fmt:
+                return codigo.replace("&quot;", '"').replace("&amp;", "&")
+        return BUILTIN_FORMATS.get(id_fmt, "General")
+
+    def _id_formato(self, codigo):
+        for i, c in BUILTIN_FORMATS.items():
+            if c == codigo:
+                return i
+        codigo_xml = escape(codigo, {'"': "&quot;"})
+        if codigo_xml not in self._formatos:
+            self._formatos[codigo_xml] = max([163] + list(self._formatos.values())) + 1
+            self._novos_formatos.append(codigo_xml)
+        return self._formatos[codigo_xml]
+
+    def derivar(self, xf_id, **atributos):
+        """Id de um novo estilo igual a xf_id com os atributos trocados (ex.: numFmtId, fillId)."""
+        chave = (xf_id, tuple(sorted(atributos.items())))
+        if chave not in self._derivados:
+            base = self._xfs[xf_id] if xf_id is not None else '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            abertura, resto = re.match(r'(<xf\b[^>]*?)(/?>.*)', base, re.S).groups()
+            for nome, valor in atributos.items():
+                if f' {nome}="' in abertura:
+                    abertura = re.sub(rf' {nome}="[^"]*"', f' {nome}="{valor}"', abertura)
+                else:
+                    abertura += f' {nome}="{valor}"'
+            self._novos_xfs.append(abertura + resto)
+            self._derivados[chave] = len(self._xfs) + len(self._novos_xfs) - 1
+        return self._derivados[chave]
+
+    def com_formato(self, xf_id, codigo):
+        return self.derivar(xf_id, numFmtId=self._id_formato(codigo), applyNumberFormat="1")
+
+    def gerar(self):
+        xml = self.xml
+        if self._novos_formatos:
+            novos = "".join(f'<numFmt numFmtId="{self._formatos[c]}" formatCode="{c}"/>' for c in self._novos_formatos)
+            if "<numFmts" in xml:
+                xml = xml.replace("</numFmts>", novos + "</numFmts>", 1)
+                xml = re.sub(r'<numFmts count="\d+"', f'<numFmts count="{len(self._formatos)}"', xml, 1)
+            else:
+                xml = re.sub(r'(<styleSheet\b[^>]*>)', rf'\1<numFmts count="{len(self._novos_formatos)}">{novos}</numFmts>', xml, 1)
+        xml = xml.replace("</cellXfs>", "".join(self._novos_xfs) + "</cellXfs>", 1)
+        xml = re.sub(r'<cellXfs count="\d+"', f'<cellXfs count="{len(self._xfs) + len(self._novos_xfs)}"', xml, 1)
+        return xml
+
+class PlanoXml:
+    """Template analisado para o motor XML: partes estáticas já compactadas e a aba Receitas separada."""
+    def __init__(self, template_path):
+        with zipfile.ZipFile(template_path) as z:
+            partes = {n: z.read(n) for n in z.namelist()}
+
+        textos = self._textos_compartilhados(partes)
+        abas = self._caminhos_abas(partes)
+        self._nome_receitas = abas[ABA_RECEITAS]
+        self._nome_indices = abas[ABA_INDICES]
+        estilos = _Estilos(partes["xl/styles.xml"].decode("utf-8"))
+
+        self._analisar_receitas(partes[self._nome_receitas].decode("utf-8"), textos, estilos)
+        self._analisar_indices(partes[self._nome_indices].decode("utf-8"), estilos)
+
+        # Formatos gravados pelo processamento, como no motor openpyxl
+        self._s_data_indice = estilos.com_formato(None, FORMATO_DATA_INDICE)
+        self._s_valor_indice = estilos.com_formato(None, FORMATO_VALOR_INDICE)
+        self._s_data_limite = estilos.com_formato(self._estilo_cabecalho[CELULA_DATA_LIMITE], FORMATO_DATA_LIMITE)
+        self._s_totais_b = {r: estilos.derivar(s, fillId="0", applyFill="1") if s is not None else None
+                            for r, s in self._estilos_totais_b.items()}
+
+        partes["xl/styles.xml"] = estilos.gerar().encode("utf-8")
+        self._remover_calc_chain(partes)
+
+        # Partes que não mudam entre os RFs são compactadas uma única vez
+        self._entradas = []
+        for nome, dados in partes.items():
+            if nome == self._nome_receitas or nome == self._nome_indices:
+                self._entradas.append(nome)
+            else:
+                self._entradas.append(_comprimir(nome, dados))
+        self._cache_indices = (None, None)
+        # Rodapé já montado por linha de início (depende apenas da quantidade de linhas de dados)
+        self._cache_rodape = {}
+
+    @staticmethod
+    def _textos_compartilhados(partes):
+        dados = partes.get("xl/sharedStrings.xml")
+        if not dados:
+            return []
+        raiz = ET.fromstring(dados)
+        return ["".join(t.text or "" for t in si.iter(f"{{{_NS_MAIN}}}t")) for si in raiz.iter(f"{{{_NS_MAIN}}}si")]
+
+    @staticmethod
+    def _caminhos_abas(partes):
+        rels = ET.fromstring(partes["xl/_rels/workbook.xml.rels"])
+        alvos = {r.get("Id"): r.get("Target") for r in rels.iter(f"{{{_NS_PKG}}}Relationship")}
+        abas = {}
+        for aba in ET.fromstring(partes["xl/workbook.xml"]).iter(f"{{{_NS_MAIN}}}sheet"):
+            alvo = alvos[aba.get(f"{{{_NS_REL}}}id")]
+            abas[aba.get("name")] = alvo.lstrip("/") if alvo.startswith("/") else "xl/" + alvo
+        return abas
+
+    @staticmethod
+    def _remover_calc_chain(partes):
+        """
+        A cadeia de cálculo do template deixa de valer com as fórmulas deslocadas.
+        Ela é removida e o Excel recalcula tudo ao abrir (fullCalcOnLoad), como no openpyxl.
+        """
+        partes.pop("xl/calcChain.xml", None)
+        rels = partes["xl/_rels/workbook.xml.rels"].decode("utf-8")
+        partes["xl/_rels/workbook.xml.rels"] = re.sub(r'<Relationship\b[^>]*/calcChain"[^>]*/>', "", rels).encode("utf-8")
+        tipos = partes["[Content_Types].xml"].decode("utf-8")
+        partes["[Content_Types].xml"] = re.sub(r'<Override PartName="/xl/calcChain.xml"[^>]*/>', "", tipos).encode("utf-8")
+        wb = partes["xl/workbook.xml"].decode("utf-8")
+        if "<calcPr" in wb:
+            wb = re.sub(r'<calcPr\b((?:(?!fullCalcOnLoad)[^>])*?)\s*/>', r'<calcPr\1 fullCalcOnLoad="1"/>', wb, 1)
+        else:
+            fim = wb.index("<extLst") if "<extLst" in wb else wb.index("</workbook>")
+            wb = wb[:fim] + '<calcPr fullCalcOnLoad="1"/>' + wb[fim:]
+        partes["xl/workbook.xml"] = wb.encode("utf-8")
+
+    def _analisar_receitas(self, xml, textos, estilos):
+        ini = xml.index("<sheetData")
+        fim_abertura = xml.index(">", ini) + 1
+        fim = xml.rindex("</sheetData>")
+        self._prefixo, self._sufixo = xml[:fim_abertura], xml[fim:]
+        if xml[fim_abertura - 2] == "/":
+            self._prefixo, self._sufixo = xml[:ini] + "<sheetData>", "</sheetData>" + xml[fim_abertura:]
+            fim = fim_abertura
+        m = re.search(r'<dimension ref="([A-Z]+\d+:[A-Z]+)\d+"/>', self._prefixo)
+        self._dimensao = m.group(0) if m else None
+        self._dimensao_inicio = m.group(1) if m else None
+
+        # linha -> (abertura do <row>, atributos de formatação, [(coluna, xml da célula, elemento)])
+        linhas = {}
+        max_col = 0
+        for m in _RE_LINHA.finditer(xml, fim_abertura, fim):
+            r = int(_atributos(m.group(1))["r"])
+            celulas = []
+            for xml_c in _RE_CELULA.findall(m.group(2) or ""):
+                el = ET.fromstring(xml_c)
+                col = _numero_coluna(_RE_REF.match(el.get("r")).group(1))
+                celulas.append((col, xml_c, el))
+                max_col = max(max_col, col)
+            linhas[r] = (f"<row{m.group(1)}>", _atributos_linha(m.group(1)), celulas)
+        self._linhas = linhas
+        self._atributos = {r: a for r, (_, a, _) in linhas.items()}
+        self._max_col = max_col
+        max_row = max((r for r, (_, _, c) in linhas.items() if c), default=0)
+
+        def celula(r, col):
+            for c, xml_c, el in linhas.get(r, (None, None, ()))[2]:
+                if c == col:
+                    return el
+            return None
+
+        # 1. Linha modelo: estilo e fórmula de cada coluna
+        self._colunas_modelo = []
+        for col in range(1, max_col + 1):
+            el = celula(LINHA_MODELO, col)
+            estilo = el.get("s") if el is not None else None
+            fm = _valor_celula(el, textos) if el is not None else None
+            fm = fm if isinstance(fm, str) and "=" in fm else None
+            self._colunas_modelo.append((col, _letra_coluna(col), estilo, fm))
+
+        # 2. Footer: a mesma extensão lida por extrair_info_template (até max_row + 19)
+        self._footer = []
+        self._estilos_totais_b = {}
+        for r in range(INICIO_FOOTER, max_row + 20):
+            dados = []
+            for col in range(1, max_col + 1):
+                el = celula(r, col)
+                dados.append((el.get("s") if el is not None else None, _valor_celula(el, textos) if el is not None else None))
+            totais = eh_linha_totais(v for _, v in dados)
+            if totais:
+                s = dados[1][0] if max_col >= 2 else None
+                self._estilos_totais_b[len(self._footer)] = int(s) if s is not None else None
+            self._footer.append((totais, dados))
+
+        # Células do rodapé sem estilo no template mantêm o estilo que já existia na posição
+        self._estilos_posicao = {
+            (r, col): el.get("s") for r, (_, _, celulas) in linhas.items() if r >= LINHA_MODELO
+            for col, _, el in celulas
+        }
+
+        # 3. Células preenchidas por RF no cabeçalho da planilha
+        self._estilo_cabecalho = {}
+        for pos in (CELULA_PROCESSO, CELULA_AUTOR, CELULA_DATA_LIMITE):
+            el = celula(*pos)
+            self._estilo_cabecalho[pos] = int(el.get("s", 0)) if el is not None else None
+            linhas.setdefault(pos[0], (f'<row r="{pos[0]}">', "", []))
+        self._linhas_topo = sorted(r for r in linhas if r < LINHA_MODELO)
+
+    def _analisar_indices(self, xml, estilos):
+        fim = xml.rindex("</sheetData>") if "</sheetData>" in xml else None
+        if fim is None:
+            ini = xml.index("<sheetData")
+            fim_abertura = xml.index(">", ini) + 1
+            xml = xml[:ini] + "<sheetData></sheetData>" + xml[fim_abertura:]
+            fim = xml.rindex("</sheetData>")
+        self._indices_prefixo, self._indices_sufixo = xml[:fim], xml[fim:]
+
+        max_row = 0
+        existentes = set()
+        datas = {}
+        for m in _RE_LINHA.finditer(xml):
+            celulas = _RE_CELULA.findall(m.group(2) or "")
+            if not celulas:
+                continue
+            max_row = max(max_row, int(_atributos(m.group(1))["r"]))
+            el = ET.fromstring(celulas[0])
+            if _RE_REF.match(el.get("r")).group(1) != "A" or el.get("t", "n") != "n":
+                continue
+            v = el.find("v")
+            s = int(el.get("s", 0))
+            if s not in datas:
+                datas[s] = is_date_format(estilos.formato(s))
+            if v is not None and v.text and datas[s]:
+                existentes.add(_EPOCA_EXCEL + datetime.timedelta(days=float(v.text)))
+        self._indices_max_row = max_row
+        self._indices_existentes = existentes
+        m = re.search(r'<dimension ref="([A-Z]+\d+:[A-Z]+)(\d+)"/>', self._indices_prefixo)
+        self._indices_dimensao = m
+
+    def _entrada_indices(self, indices):
+        """TOTINDICE com os índices do RF; reaproveitado enquanto os índices forem os mesmos."""
+        chave, entrada = self._cache_indices
+        if entrada is not None and chave == indices:
+            return entrada
+        r_idx = self._indices_max_row + 1 if self._indices_max_row > 1 else 2
+        linhas = []
+        for dt, val in indices:
+            if dt not in self._indices_existentes:
+                linhas.append(
+                    f'<row r="{r_idx}"><c r="A{r_idx}" s="{self._s_data_indice}"><v>{_numero(_serial_excel(dt))}</v></c>'
+                    f'<c r="B{r_idx}" s="{self._s_valor_indice}"><v>{_numero(val)}</v></c></row>'
+                )
+                r_idx += 1
+        prefixo = self._indices_prefixo
+        m = self._indices_dimensao
+        if m and r_idx - 1 > int(m.group(2)):
+            prefixo = prefixo[:m.start()] + f'<dimension ref="{m.group(1)}{r_idx - 1}"/>' + prefixo[m.end():]
+        xml = prefixo + "".join(linhas) + self._indices_sufixo
+        entrada = _comprimir(self._nome_indices, xml.encode("utf-8"))
+        self._cache_indices = (list(indices), entrada)
+        return entrada
+
+    def _xml_receitas(self, proc, autor_rf, rows_data, data_limite):
+        crono = cronometro()
+        partes = []
+        trocas = {
+            CELULA_PROCESSO: (self._estilo_cabecalho[CELULA_PROCESSO], proc),
+            CELULA_AUTOR: (self._estilo_cabecalho[CELULA_AUTOR], autor_rf),
+            CELULA_DATA_LIMITE: (self._s_data_limite, data_limite),
+        }
+        for r in self._linhas_topo:
+            abertura, _, celulas = self._linhas[r]
+            cols = {c: xml_c for c, xml_c, _ in celulas}
+            for (r_troca, col), (estilo, valor) in trocas.items():
+                if r_troca == r:
+                    cols[col] = _xml_celula(f"{_letra_coluna(col)}{r}", estilo, valor)
+            partes.append(abertura + "".join(cols[c] for c in sorted(cols)) + "</row>")
+
+        atributos = self._atributos
+        curr = LINHA_MODELO
+        for d in rows_data:
+            celulas = []
+            for col, letra, estilo, fm in self._colunas_modelo:
+                if col == 1:
+                    valor = d['dt']
+                elif col == 2:
+                    valor = d['q']
+                elif col == 3:
+                    # INJEÇÃO DA FÓRMULA NA COLUNA C (3) COM REFERÊNCIA FIXA EM $D$10/1
+                    valor = f'=B{curr}*$D$10/1'
+                elif col in COLUNAS_VALORES_TXT:
+                    v = d.get(('iprem', 'hspm', 'funfin', 'funprev')[col - 4], 0)
+                    valor = v if v > 0 else ""
+                else:
+                    valor = fm.replace("17", str(curr)) if fm else None
+                celulas.append(_xml_celula(f"{letra}{curr}", estilo, valor))
+            partes.append(f'<row r="{curr}"{atributos.get(curr, "")}>{"".join(celulas)}</row>')
+            curr += 1
+        crono.marcar("linhas")
+        crono.contar("linhas", len(rows_data))
+
+        rodape, ultima = self._rodape(curr)
+        partes.append(rodape)
+
+        prefixo = self._prefixo
+        if self._dimensao:
+            prefixo = prefixo.replace(self._dimensao, f'<dimension ref="{self._dimensao_inicio}{ultima}"/>', 1)
+        xml = prefixo + "".join(partes) + self._sufixo
+        crono.marcar("rodape")
+        return xml
+
+    def _rodape(self, curr):
+        """XML das linhas do rodapé escrito a partir da linha curr e a última linha escrita."""
+        # OTIMIZAÇÃO: o rodapé só depende da linha de início; RFs com a mesma quantidade de meses
+        # reaproveitam o XML já montado, sem reescrever as fórmulas
+        em_cache = self._cache_rodape.get(curr)
+        if em_cache is not None:
+            return em_cache
+        atributos = self._atributos
+        partes = []
+        ultima = curr - 1
+        linha_fim_dados = curr - 1
+        offset = curr - INICIO_FOOTER
+        for i, (is_totais, dados) in enumerate(self._footer):
+            r_w = curr + i
+            celulas = []
+            for j, (estilo, val) in enumerate(dados):
+                col = j + 1
+                if is_totais and col == 2:
+                    estilo = self._s_totais_b[i]
+                elif estilo is None:
+                    estilo = self._estilos_posicao.get((r_w, col))
+                celulas.append(_xml_celula(f"{_letra_coluna(col)}{r_w}", estilo,
+                                           valor_footer(val, col, is_totais, linha_fim_dados, offset)))
+            celulas = "".join(celulas)
+            if celulas or r_w in atributos:
+                partes.append(f'<row r="{r_w}"{atributos.get(r_w, "")}>{celulas}</row>')
+                ultima = r_w
+        em_cache = self._cache_rodape[curr] = ("".join(partes), ultima)
+        return em_cache
+
+    def gravar(self, path, reg_h, indices, rows_data, dt_limite):
+        proc = reg_h.processo.strip()
+        autor_rf = f"{reg_h.autor.strip()} - RF: {reg_h.rf.strip()}"
+        last_dt = rows_data[-1]['dt'] if rows_data else None
+        xml = self._xml_receitas(proc, autor_rf, rows_data, last_dt if last_dt else dt_limite)
+
+        crono = cronometro()
+        entrada_indices = self._entrada_indices(indices)
+        crono.marcar("indices")
+
+        entradas = []
+        for entrada in self._entradas:
+            if entrada == self._nome_receitas:
+                entrada = _comprimir(entrada, xml.encode("utf-8"))
+            elif entrada == self._nome_indices:
+                entrada = entrada_indices
+            entradas.append(entrada)
+        _gravar_zip(path, entradas)
+        crono.marcar("salvar")
+
+# Cache do template por processo trabalhador: caminho do template -> PlanoXml. Este motor recebe
+# sempre o template original (os índices vão para o TOTINDICE de cada planilha), então localmente
+# há um único plano. Um trabalhador remoto persistente (ver distribuido.py) recebe uma cópia por
+# conteúdo do template de cada processo principal que atende: só os SNAPSHOTS_EM_CACHE usados mais
+# recentemente ficam em memória
+_CACHE_PLANO = {}
+
+def inicializar_trabalhador_xml(template_path):
+    """Initializer do pool de processos para o motor XML."""
+    obter_plano(template_path)
+
+def obter_plano(template_path):
+    plano = _CACHE_PLANO.pop(template_path, None)
+    if plano is None:
+        plano = PlanoXml(template_path)
+        while len(_CACHE_PLANO) >= SNAPSHOTS_EM_CACHE:
+            # Descarta o plano usado há mais tempo (dicionários preservam a ordem de inserção)
+            del _CACHE_PLANO[next(iter(_CACHE_PLANO))]
+    # Reinserido no fim: o primeiro do dicionário é sempre o usado há mais tempo
+    _CACHE_PLANO[template_path] = plano
+    return plano
+
+def processar_arquivo_xml(args):
+    """Mesmo contrato de processar_arquivo_isolado, gerando o XLSX direto do XML do template."""
+    (reg_h, template_path, output_folder, rotina, indices, rows_data, dt_limite) = args
+    proc = reg_h.processo.strip()
+    try:
+        nome_arq, path = caminho_saida(output_folder, rotina, proc, reg_h.rf.strip())
+        plano = obter_plano(template_path)
+        cronometro().marcar("template")
+        plano.gravar(path, reg_h, indices, rows_data, dt_limite)
+        return resultado_saida(nome_arq, path)
+    except Exception as e:
+        return f"ERRO: {proc} - {str(e)}"
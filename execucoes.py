@@ -0,0 +1,131 @@
+"""
+Execuções em segundo plano.
+
+A interface não roda mais o pipeline dentro do próprio script: cada execução roda em uma
+thread do GerenciadorExecucoes, identificada por um id, e publica o andamento em um estado
+compartilhado (Execucao). A interface consulta esse estado em intervalos fixos, de modo que
+as interações com a página não interrompem a execução e um refresh do navegador volta a
+acompanhá-la pelo id.
+"""
+import uuid
+import datetime
+import threading
+
+from cancelamento import Cancelamento, ExecucaoCancelada
+from medicao import Perfil
+
+# Estados de uma execução
+EXECUTANDO = "executando"
+CONCLUIDA = "concluida"
+CANCELADA = "cancelada"
+FALHOU = "falhou"
+
+# Execuções encerradas mantidas para consulta (ex.: refresh da página depois do término)
+EXECUCOES_MANTIDAS = 8
+
+class Execucao:
+    """Estado compartilhado de uma execução: atualizado pela thread da execução, lido pela interface."""
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.inicio = datetime.datetime.now()
+        self.estado = EXECUTANDO
+        self.resultado = None
+        self.erro = None
+        self.perfil = Perfil()
+        self.cancelamento = Cancelamento()
+        self._andamento = (0, "")
+        self._avisos = []
+        self._trava = threading.Lock()
+        self._thread = None
+
+    def progresso(self, percentual, mensagem):
+        # OTIMIZAÇÃO: o pipeline avisa a cada lote concluído; aqui só fica o último andamento,
+        # que a interface lê no próprio ritmo, sem uma mensagem para o navegador por lote
+        self._andamento = (percentual, mensagem)
+
+    def aviso(self, ok, mensagem):
+        with self._trava:
+            self._avisos.append((ok, mensagem))
+
+    def ativa(self):
+        return self.estado == EXECUTANDO
+
+    def cancelar(self):
+        self.cancelamento.cancelar()
+
+    def aguardar(self, timeout=None):
+        """Aguarda o fim da execução. Retorna False se ela ainda estiver em andamento."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def situacao(self):
+        """Cópia do estado para exibição, com o perfil parcial (etapas concluídas e planilhas já geradas)."""
+        percentual, mensagem = self._andamento
+        with self._trava:
+            avisos = list(self._avisos)
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'percentual': percentual,
+            'mensagem': mensagem,
+            'avisos': avisos,
+            'segundos': (datetime.datetime.now() - self.inicio).total_seconds(),
+            'perfil': self.perfil.resumo(),
+            'resultado': self.resultado,
+            'erro': self.erro,
+        }
+
+    def _executar(self, funcao, args, kwargs):
+        try:
+            resultado = funcao(*args, progresso=self.progresso, aviso=self.aviso,
+                               cancelamento=self.cancelamento, perfil=self.perfil, **kwargs)
+        except ExecucaoCancelada:
+            self.estado = CANCELADA
+        except Exception as e:
+            self.erro = str(e)
+            self.estado = FALHOU
+        else:
+            self.resultado = resultado
+            self.estado = CONCLUIDA
+        finally:
+            self.cancelamento.descartar()
+
+class GerenciadorExecucoes:
+    """Roda uma execução por vez em segundo plano; as execuções são consultadas pelo id."""
+    def __init__(self):
+        self._execucoes = {}
+        self._trava = threading.Lock()
+
+    def iniciar(self, funcao, *args, **kwargs):
+        """
+        Inicia funcao(*args, progresso=, aviso=, cancelamento=, perfil=, **kwargs) em uma thread
+        (ex.: pipeline.executar_lote). Retorna a Execucao.
+        Levanta RuntimeError se outra execução estiver em andamento: o pool de trabalhadores é único.
+        """
+        with self._trava:
+            ativa = self._em_andamento()
+            if ativa is not None:
+                raise RuntimeError(f"Já existe uma execução em andamento ({ativa.id}).")
+            encerradas = [i for i, e in self._execucoes.items() if not e.ativa()]
+            for i in encerradas[:max(0, len(encerradas) - EXECUCOES_MANTIDAS + 1)]:
+                del self._execucoes[i]
+
+            execucao = Execucao()
+            execucao._thread = threading.Thread(
+                target=execucao._executar, args=(funcao, args, kwargs), name=f"ddv-execucao-{execucao.id}", daemon=True
+            )
+            self._execucoes[execucao.id] = execucao
+            execucao._thread.start()
+            return execucao
+
+    def obter(self, id_execucao):
+        with self._trava:
+            return self._execucoes.get(id_execucao)
+
+    def em_andamento(self):
+        """A execução em andamento, ou None."""
+        with self._trava:
+            return self._em_andamento()
+
+    def _em_andamento(self):
+        return next((e for e in self._execucoes.values() if e.ativa()), None)
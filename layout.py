@@ -0,0 +1,102 @@
+from collections import namedtuple
+from operator import itemgetter
+
+# Tipos de campo do layout de largura fixa
+TEXTO = "texto"          # mantido como veio do Mainframe (sem strip), como gravado no Access
+CENTAVOS = "centavos"    # valor monetário em centavos, sem separador decimal
+
+# coluna: nome da coluna correspondente nas tabelas Header/Detail do banco
+Campo = namedtuple("Campo", "nome inicio fim tipo coluna")
+
+# Registro Header (arquivo _F): uma linha por Processo + RF
+CAMPOS_HEADER = (
+    Campo("processo", 0, 12, TEXTO, "Processo"),
+    Campo("rf", 12, 21, TEXTO, "RF"),
+    Campo("mes", 21, 23, TEXTO, "Data_Ref_Mes"),
+    Campo("ano", 23, 27, TEXTO, "Data_Ref_Ano"),
+    Campo("data_processamento", 27, 37, TEXTO, "Data_Processamento"),
+    Campo("observacao", 37, 87, TEXTO, "Observacao"),
+    Campo("autor", 87, 119, TEXTO, "Autor"),
+    Campo("cargo", 119, 171, TEXTO, "Cargo"),
+    Campo("padrao", 171, 180, TEXTO, "Padrao"),
+    Campo("qtde_dias", 180, 182, TEXTO, "Qtde_Dias"),
+    Campo("auto", 182, 203, TEXTO, "Auto"),
+)
+
+# Registro Detail (arquivo _V): uma linha por Processo + RF + competência + código
+CAMPOS_DETAIL = (
+    Campo("processo", 0, 12, TEXTO, "Processo"),
+    Campo("rf", 12, 21, TEXTO, "RF"),
+    Campo("mes", 21, 23, TEXTO, "Data_Ref_Mes"),
+    Campo("ano", 23, 27, TEXTO, "Data_Ref_Ano"),
+    Campo("codigo", 27, 31, TEXTO, "Codigo"),
+    Campo("significado", 31, 66, TEXTO, "Significado"),
+    Campo("recebido", 66, 76, CENTAVOS, "Recebido"),
+    Campo("a_receber", 76, 86, CENTAVOS, "A_Receber"),
+    Campo("dif_venc", 86, 96, CENTAVOS, "Dif_Venc"),
+    Campo("descontado", 96, 106, CENTAVOS, "Descontado"),
+    Campo("a_descontar", 106, 116, CENTAVOS, "A_Descontar"),
+    Campo("dif_desc", 116, 126, CENTAVOS, "Dif_Desc"),
+)
+
+def _centavos(valor):
+    """
+    Converte o campo numérico do Mainframe para centavos inteiros.
+    Campos inválidos viram None: o Access grava 0.0 e o Excel acusa erro no RF, como antes.
+    """
+    try:
+        return int(valor)
+    except ValueError:
+        return None
+
+def montar_chave(processo, rf):
+    """Chave Processo + RF usada para relacionar Header e Detail."""
+    return processo.strip() + rf.strip()
+
+class LayoutRegistro:
+    """
+    Layout de largura fixa compilado em um único decodificador.
+    Todas as fatias da linha são extraídas em uma só chamada (itemgetter) e
+    os campos numéricos são convertidos uma única vez.
+    """
+    def __init__(self, nome, campos, tamanho_minimo):
+        self.nome = nome
+        self.campos = campos
+        self.por_nome = {c.nome: c for c in campos}
+        self.tamanho_minimo = tamanho_minimo
+        # Campo derivado 'chave' (Processo + RF) usado para relacionar Header e Detail
+        self.registro = namedtuple(nome, [c.nome for c in campos] + ["chave"])
+        self._fatiar = itemgetter(*(slice(c.inicio, c.fim) for c in campos))
+        self._numericos = tuple(i for i, c in enumerate(campos) if c.tipo == CENTAVOS)
+
+    @property
+    def tamanho(self):
+        """Largura total do registro (fim do último campo)."""
+        return max(c.fim for c in self.campos)
+
+    def valida(self, linha):
+        return len(linha) >= self.tamanho_minimo
+
+    def decodificar(self, linha):
+        valores = list(self._fatiar(linha.rstrip("\r\n")))
+        try:
+            for i in self._numericos:
+                valores[i] = int(valores[i])
+        except ValueError:
+            # Caminho raro: ao menos um campo numérico inválido
+            for i in self._numericos:
+                valores[i] = _centavos(valores[i])
+        valores.append(montar_chave(valores[0], valores[1]))
+        return self.registro._make(valores)
+
+    def colunas(self, registro):
+        """Valores do registro na ordem do layout, sem os campos derivados."""
+        return registro[:len(self.campos)]
+
+# Tamanhos mínimos (com a quebra de linha) para que um registro seja considerado válido
+LAYOUT_HEADER = LayoutRegistro("RegistroHeader", CAMPOS_HEADER, 180)
+LAYOUT_DETAIL = LayoutRegistro("RegistroDetail", CAMPOS_DETAIL, 120)
+
+# Classes dos registros expostas no nível do módulo para permitir o pickling entre processos
+RegistroHeader = LAYOUT_HEADER.registro
+RegistroDetail = LAYOUT_DETAIL.registro
@@ -0,0 +1,301 @@
+import io
+import os
+import mmap
+import datetime
+
+import numpy as np
+
+from layout import LAYOUT_HEADER, LAYOUT_DETAIL, montar_chave
+
+# Codificação padrão dos arquivos extraídos do Mainframe
+ENCODING_MAINFRAME = "cp1252"
+
+class _LeitorBuffer(io.RawIOBase):
+    """Leitura sequencial sobre um buffer em memória (ex.: upload do Streamlit), sem copiá-lo."""
+    def __init__(self, buffer):
+        self._mv = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        n = min(len(destino), len(self._mv) - self._pos)
+        destino[:n] = self._mv[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+def _eh_caminho(fonte):
+    return isinstance(fonte, (str, os.PathLike))
+
+def abrir_texto(fonte):
+    """
+    Abre um caminho ou um buffer (bytes, memoryview, getbuffer() de upload) como texto cp1252.
+    A decodificação é feita sob demanda, com as mesmas regras de quebra de linha do open().
+    """
+    if _eh_caminho(fonte):
+        return open(fonte, 'r', encoding=ENCODING_MAINFRAME)
+    return io.TextIOWrapper(io.BufferedReader(_LeitorBuffer(fonte)), encoding=ENCODING_MAINFRAME)
+
+def ler_header(fonte):
+    """Lê o arquivo Header (_F) e decodifica as linhas com tamanho válido."""
+    with abrir_texto(fonte) as f:
+        return [LAYOUT_HEADER.decodificar(l) for l in f if LAYOUT_HEADER.valida(l)]
+
+def ler_indices(fonte):
+    """Lê o arquivo de índices de correção no formato AAAAMMDD + valor (vírgula decimal)."""
+    idx_list = []
+    if not fonte:
+        return idx_list
+    with abrir_texto(fonte) as f:
+        for linha in f:
+            if len(linha) >= 8:
+                try:
+                    dt = datetime.datetime.strptime(linha[:8], "%Y%m%d")
+                    val = float(linha[8:].replace(',', '.'))
+                    idx_list.append((dt, val))
+                except (ValueError, IndexError):
+                    pass
+    return idx_list
+
+# Tamanho dos blocos varridos por vez no Detail: limita o pico de memória da ingestão
+TAMANHO_BLOCO = 16 * 1024 * 1024
+
+_QUEBRA, _RETORNO = 0x0A, 0x0D
+_ZERO, _NOVE = 0x30, 0x39
+
+def _fatia_campo(campo):
+    return np.arange(campo.inicio, campo.fim)
+
+class ArquivoDetail:
+    """
+    Arquivo Detail (_V) indexado sobre um buffer (arquivo mapeado em memória ou upload).
+
+    O conteúdo nunca é mantido como uma lista de str: a varredura é feita em blocos,
+    os campos da agregação são extraídos diretamente dos bytes com NumPy e o índice
+    guarda apenas os intervalos de bytes de cada Processo + RF.
+    """
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._bytes = np.frombuffer(buffer, dtype=np.uint8) if len(buffer) else np.empty(0, dtype=np.uint8)
+        self._mv = memoryview(self._bytes)
+        self._ids = {}
+        self._chaves = []
+        self._faixas = None
+        self.total_linhas = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        # As visões NumPy precisam ser liberadas antes de fechar o mmap
+        self._mv.release()
+        self._bytes = None
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def _blocos_linhas(self):
+        """
+        Gera, bloco a bloco, os arrays (inícios, fins do conteúdo, tamanhos em modo texto)
+        das linhas completas do buffer.
+        """
+        dados = self._bytes
+        total = len(dados)
+        pos = 0
+        while pos < total:
+            tamanho = TAMANHO_BLOCO
+            while True:
+                fim = min(pos + tamanho, total)
+                quebras = np.flatnonzero(dados[pos:fim] == _QUEBRA) + pos
+                if len(quebras) or fim == total:
+                    break
+                tamanho *= 2
+
+            inicios = np.empty(len(quebras), dtype=np.int64)
+            if len(quebras):
+                inicios[0] = pos
+                inicios[1:] = quebras[:-1] + 1
+            fins = quebras.astype(np.int64)
+            com_quebra = np.ones(len(quebras), dtype=np.int64)
+            if fim == total and (not len(quebras) or quebras[-1] != total - 1):
+                # Última linha sem quebra no final do arquivo
+                inicios = np.append(inicios, quebras[-1] + 1 if len(quebras) else pos)
+                fins = np.append(fins, total)
+                com_quebra = np.append(com_quebra, 0)
+
+            # '\r\n' é lido como '\n' em modo texto: o '\r' não conta no tamanho da linha
+            tem_retorno = (fins > inicios) & (dados[np.maximum(fins - 1, 0)] == _RETORNO)
+            fins_conteudo = fins - tem_retorno
+            yield inicios, fins_conteudo, (fins_conteudo - inicios) + com_quebra
+            pos = int(fins[-1]) + 1
+
+    def _texto(self, inicio, fim):
+        return str(self._mv[inicio:fim], ENCODING_MAINFRAME)
+
+    def _id(self, chave):
+        id_chave = self._ids.get(chave)
+        if id_chave is None:
+            id_chave = self._ids[chave] = len(self._chaves)
+            self._chaves.append(chave)
+        return id_chave
+
+    def indexar(self, agregador=None):
+        """
+        Varre o arquivo uma única vez montando o índice por Processo + RF.
+        Se um AgregadorMensal for informado, ele é alimentado na mesma passada.
+        """
+        dados = self._bytes
+        c = LAYOUT_DETAIL.por_nome
+        pos_chave = np.arange(c["rf"].fim)
+        pos_ano, pos_mes, pos_cod = _fatia_campo(c["ano"]), _fatia_campo(c["mes"]), _fatia_campo(c["codigo"])
+        pos_venc, pos_desc = _fatia_campo(c["dif_venc"]), _fatia_campo(c["dif_desc"])
+        pesos = 10 ** np.arange(len(pos_venc) - 1, -1, -1, dtype=np.int64)
+
+        faixas_ids, faixas_ini, faixas_fim, faixas_qtd = [], [], [], []
+        for inicios, fins, tamanhos in self._blocos_linhas():
+            validas = tamanhos >= LAYOUT_DETAIL.tamanho_minimo
+            inicios, fins = inicios[validas], fins[validas]
+            if not len(inicios):
+                continue
+            self.total_linhas += len(inicios)
+
+            # Chave Processo + RF: cada combinação distinta de bytes é decodificada uma única vez
+            brutas = np.ascontiguousarray(dados[inicios[:, None] + pos_chave]).view(f"S{len(pos_chave)}").ravel()
+            unicas, inversos = np.unique(brutas, return_inverse=True)
+            chaves = [
+                montar_chave(t[c["processo"].inicio:c["processo"].fim], t[c["rf"].inicio:c["rf"].fim])
+                for t in (b.ljust(len(pos_chave), b"\0").decode(ENCODING_MAINFRAME) for b in unicas.tolist())
+            ]
+            ids = np.array([self._id(k) for k in chaves], dtype=np.int64)[inversos.ravel()]
+
+            # Faixas contíguas de linhas de um mesmo RF
+            cortes = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+            faixas_ids.append(ids[cortes])
+            faixas_ini.append(inicios[cortes])
+            faixas_fim.append(fins[np.r_[cortes[1:], len(ids)] - 1])
+            faixas_qtd.append(np.diff(np.r_[cortes, len(ids)]))
+
+            if agregador is not None:
+                self._agregar_bloco(agregador, inicios, fins, ids, pos_ano, pos_mes, pos_cod, pos_venc, pos_desc, pesos)
+
+        if faixas_ids:
+            ids = np.concatenate(faixas_ids)
+            ordem = np.argsort(ids, kind="stable")
+            self._faixas = (ids[ordem], np.concatenate(faixas_ini)[ordem],
+                            np.concatenate(faixas_fim)[ordem], np.concatenate(faixas_qtd)[ordem])
+        return self
+
+    def indice(self):
+        """Estado do índice montado por indexar(), para o cache de leitura (ver cache_leitura.py)."""
+        return list(self._chaves), self._faixas, self.total_linhas
+
+    def restaurar_indice(self, indice):
+        """Usa um índice já montado sobre este mesmo conteúdo no lugar de indexar()."""
+        chaves, self._faixas, self.total_linhas = indice
+        self._chaves = list(chaves)
+        self._ids = {chave: i for i, chave in enumerate(self._chaves)}
+        return self
+
+    def _agregar_bloco(self, agregador, inicios, fins, ids, pos_ano, pos_mes, pos_cod, pos_venc, pos_desc, pesos):
+        dados = self._bytes
+        completas = (fins - inicios) >= LAYOUT_DETAIL.tamanho
+        ini = inicios[completas]
+
+        def digitos(posicoes):
+            m = dados[ini[:, None] + posicoes]
+            return m, ((m >= _ZERO) & (m <= _NOVE)).all(axis=1)
+
+        ano, ok_ano = digitos(pos_ano)
+        mes, ok_mes = digitos(pos_mes)
+        venc, ok_venc = digitos(pos_venc)
+        desc, ok_desc = digitos(pos_desc)
+        cod = dados[ini[:, None] + pos_cod]
+        rapidas = ok_ano & ok_mes & ok_venc & ok_desc & (cod < 0x80).all(axis=1)
+
+        # Caminho vetorial: campos puramente numéricos convertidos direto dos bytes
+        if rapidas.any():
+            ids_rapidos = ids[completas][rapidas]
+            unicos, inversos = np.unique(ids_rapidos, return_inverse=True)
+            agregador.adicionar_colunas(
+                [self._chaves[i] for i in unicos.tolist()], inversos.ravel(),
+                (ano[rapidas] - _ZERO).astype(np.int64) @ pesos[-4:] * 100
+                + (mes[rapidas] - _ZERO).astype(np.int64) @ pesos[-2:],
+                np.ascontiguousarray(cod[rapidas]).view("S4").ravel().astype("U4"),
+                (venc[rapidas] - _ZERO).astype(np.int64) @ pesos,
+                (desc[rapidas] - _ZERO).astype(np.int64) @ pesos
+            )
+
+        # Demais linhas (campos curtos, espaços, sinais...) seguem pelo decodificador do layout
+        lentas = np.ones(len(inicios), dtype=bool)
+        lentas[np.flatnonzero(completas)[rapidas]] = False
+        if lentas.any():
+            agregador.adicionar(
+                LAYOUT_DETAIL.decodificar(self._texto(i, f))
+                for i, f in zip(inicios[lentas].tolist(), fins[lentas].tolist())
+            )
+
+    def chaves(self):
+        return list(self._chaves)
+
+    def _faixas_chave(self, chave):
+        id_chave = self._ids.get(chave)
+        if id_chave is None or self._faixas is None:
+            return []
+        ids, ini, fim, qtd = self._faixas
+        a, b = np.searchsorted(ids, [id_chave, id_chave + 1])
+        return list(zip(ini[a:b].tolist(), fim[a:b].tolist(), qtd[a:b].tolist()))
+
+    def quantidade(self, chave):
+        """Quantidade de linhas Detail do Processo + RF."""
+        return sum(q for _, _, q in self._faixas_chave(chave))
+
+    def quantidades(self):
+        """Processo + RF -> quantidade de linhas Detail."""
+        if self._faixas is None:
+            return {}
+        ids, _, _, qtd = self._faixas
+        totais = np.bincount(ids, weights=qtd, minlength=len(self._chaves)).astype(np.int64)
+        return dict(zip(self._chaves, totais.tolist()))
+
+    def trechos(self, chave):
+        """Trechos do buffer (bytes brutos) que contêm as linhas do Processo + RF, sem decodificar."""
+        for inicio, fim, _ in self._faixas_chave(chave):
+            yield self._mv[inicio:fim]
+
+    def linhas(self, chave):
+        """Linhas (str, sem quebra) do Processo + RF, lidas sob demanda do buffer."""
+        for inicio, fim, _ in self._faixas_chave(chave):
+            # A faixa pode conter linhas inválidas intercaladas, que são descartadas como na varredura
+            for linha in self._texto(inicio, fim).split("\n"):
+                if linha.endswith("\r"):
+                    linha = linha[:-1]
+                if LAYOUT_DETAIL.valida(linha + "\n") and montar_chave(linha[:12], linha[12:21]) == chave:
+                    yield linha
+
+    def registros(self, chave=None):
+        """Registros decodificados sob demanda: de um Processo + RF ou do arquivo inteiro, em ordem."""
+        if chave is not None:
+            for linha in self.linhas(chave):
+                yield LAYOUT_DETAIL.decodificar(linha)
+            return
+        # OTIMIZAÇÃO: cada bloco é decodificado de uma vez e dividido nas quebras de linha
+        for inicios, fins, tamanhos in self._blocos_linhas():
+            partes = self._texto(int(inicios[0]), int(fins[-1])).split("\n")
+            for linha, valida in zip(partes, (tamanhos >= LAYOUT_DETAIL.tamanho_minimo).tolist()):
+                if valida:
+                    yield LAYOUT_DETAIL.decodificar(linha)
+
+def abrir_detail(fonte):
+    """
+    Abre o Detail (_V) sem carregá-lo para o heap do Python.
+    Caminhos são mapeados em memória; buffers (ex.: upload) são usados diretamente.
+    """
+    if not _eh_caminho(fonte):
+        return ArquivoDetail(memoryview(fonte).cast("B"))
+    with open(fonte, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ArquivoDetail(b"")
+        return ArquivoDetail(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
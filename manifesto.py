@@ -0,0 +1,131 @@
+"""
+Manifesto das planilhas geradas, para execuções incrementais.
+
+Cada planilha da saída é registrada com a assinatura das entradas que a produziram:
+a linha Header do RF, as suas linhas Detail, os índices, o template e a rotina.
+Numa nova execução sobre a mesma saída, as planilhas cuja assinatura não mudou (e cujo
+arquivo continua intacto) são reaproveitadas; as demais são geradas de novo. O manifesto
+é regravado a cada lote concluído, então uma execução interrompida retoma de onde parou.
+
+As planilhas ficam em uma pasta com a data da execução (ver excel.caminho_relativo): o
+manifesto as registra sem essa pasta, e uma planilha reaproveitada em outro dia é trazida
+para a pasta do dia (link físico, ou cópia onde não houver), como se tivesse sido gerada nele.
+"""
+import os
+import json
+import pickle
+import shutil
+import hashlib
+
+from layout import LAYOUT_HEADER
+
+NOME_MANIFESTO = "ddv_manifesto.json"
+
+# Alterar quando a geração das planilhas mudar: invalida todas as entradas já registradas
+VERSAO_MANIFESTO = 2
+
+def _hash():
+    return hashlib.blake2b(digest_size=16)
+
+def assinatura_execucao(template_path, rotina, indices, dt_limite):
+    """
+    Parte da assinatura comum a todos os RFs da execução: template, rotina, índices e a data
+    limite gravada na planilha (sem índices, é o momento da execução: nada é reaproveitado).
+    """
+    h = _hash()
+    h.update(f"{VERSAO_MANIFESTO}\x1f{rotina}\x1f{dt_limite.isoformat()}\x1f".encode())
+    with open(template_path, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    h.update(pickle.dumps(indices, pickle.HIGHEST_PROTOCOL))
+    return h.digest()
+
+def assinatura_rf(base, reg_h, trechos_detail):
+    """Assinatura de um RF: a base da execução, os campos do Header e os bytes das linhas Detail."""
+    h = _hash()
+    h.update(base)
+    h.update("\x1f".join(LAYOUT_HEADER.colunas(reg_h)).encode("utf-8"))
+    for trecho in trechos_detail:
+        # Quebras de linha CRLF e LF produzem as mesmas linhas: não mudam a assinatura
+        h.update(bytes(trecho).replace(b"\r\n", b"\n"))
+    return h.hexdigest()
+
+def _separar_pasta_data(relativo):
+    """'AAAA-MM-DD/Processo_X - CD 1/arquivo.xlsx' -> ('AAAA-MM-DD', 'Processo_X - CD 1/arquivo.xlsx')."""
+    pasta, chave = os.path.normpath(relativo).split(os.sep, 1)
+    return pasta, chave.replace(os.sep, "/")
+
+class Manifesto:
+    """
+    Planilhas já geradas na saída: caminho sem a pasta da data -> assinatura, pasta da data,
+    tamanho e data do arquivo.
+    """
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.caminho = os.path.join(output_folder, NOME_MANIFESTO)
+        self._entradas = {}
+        try:
+            with open(self.caminho, encoding="utf-8") as f:
+                self._entradas = json.load(f)
+        except (OSError, ValueError):
+            # Manifesto ausente ou corrompido: tudo é gerado de novo
+            self._entradas = {}
+
+    def _arquivo(self, pasta, chave):
+        return os.path.join(self.output_folder, pasta, *chave.split("/"))
+
+    @staticmethod
+    def _estado(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def atual(self, relativo, assinatura):
+        """
+        True se a planilha existe, não foi alterada e foi gerada com as mesmas entradas.
+        Gerada em outro dia, ela é trazida para relativo.
+        """
+        pasta, chave = _separar_pasta_data(relativo)
+        entrada = self._entradas.get(chave)
+        if entrada is None or entrada["assinatura"] != assinatura or "pasta" not in entrada:
+            return False
+        anterior = self._arquivo(entrada["pasta"], chave)
+        if entrada["arquivo"] != self._estado(anterior):
+            return False
+        if entrada["pasta"] != pasta:
+            destino = self._arquivo(pasta, chave)
+            try:
+                _trazer(anterior, destino)
+            except OSError:
+                return False
+            entrada["pasta"] = pasta
+            entrada["arquivo"] = self._estado(destino)
+        return True
+
+    def registrar(self, relativo, assinatura):
+        pasta, chave = _separar_pasta_data(relativo)
+        estado = self._estado(self._arquivo(pasta, chave))
+        if estado is not None:
+            self._entradas[chave] = {"assinatura": assinatura, "pasta": pasta, "arquivo": estado}
+
+    def descartar(self, relativo):
+        self._entradas.pop(_separar_pasta_data(relativo)[1], None)
+
+    def gravar(self):
+        # Grava em um arquivo temporário e troca: o manifesto nunca fica pela metade
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self._entradas, f)
+        os.replace(temporario, self.caminho)
+
+def _trazer(origem, destino):
+    """Planilha de outra pasta de data na pasta do dia: link físico, ou cópia preservando a data do arquivo."""
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    try:
+        os.link(origem, temporario)
+    except OSError:
+        shutil.copy2(origem, temporario)
+    os.replace(temporario, destino)
@@ -0,0 +1,181 @@
+"""
+Medição das etapas da execução: tempos por etapa, por RF e por trabalhador.
+
+Nos trabalhadores, cada RF ganha um Cronometro; a geração da planilha marca o fim de
+cada etapa (template, índices, linhas, rodapé, gravação) com cronometro().marcar(),
+sem custo quando nenhuma medição está ativa. O lote devolve as medições junto com os
+resultados e o processo principal consolida p50/p95/máximo por etapa e por trabalhador
+no perfil da execução, gravado em NOME_PERFIL na saída.
+
+Uma amostra dos RFs pode ser perfilada com cProfile e tracemalloc: os arquivos .prof
+vão para PASTA_PERFIS e o pico de memória de cada um entra no perfil.
+"""
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+
+import numpy as np
+
+NOME_PERFIL = "ddv_perfil.json"
+PASTA_PERFIS = "ddv_perfis"
+
+# Percentis consolidados de cada etapa
+PERCENTIS = (50, 95)
+
+class Cronometro:
+    """Tempo (s) de cada etapa de uma unidade de trabalho, marcado em sequência, e contadores."""
+    def __init__(self):
+        self.tempos = {}
+        self.contadores = {}
+        self._inicio = self._ultimo = time.perf_counter()
+
+    def marcar(self, etapa):
+        """Atribui a etapa o tempo decorrido desde a marcação anterior."""
+        agora = time.perf_counter()
+        self.tempos[etapa] = self.tempos.get(etapa, 0.0) + agora - self._ultimo
+        self._ultimo = agora
+
+    def contar(self, nome, quantidade=1):
+        self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def total(self):
+        return time.perf_counter() - self._inicio
+
+class _CronometroInativo:
+    """Usado fora de uma medição (ex.: chamada direta de processar_arquivo_isolado)."""
+    def marcar(self, etapa):
+        pass
+
+    def contar(self, nome, quantidade=1):
+        pass
+
+_INATIVO = _CronometroInativo()
+
+# Cronômetro do RF em andamento neste processo
+_ATUAL = None
+
+def cronometro():
+    """Cronômetro do RF em andamento, ou um cronômetro que não mede nada."""
+    return _ATUAL or _INATIVO
+
+class MedicaoLote:
+    """Medições dos RFs de um lote, devolvidas pelo trabalhador ao processo principal."""
+    def __init__(self):
+        self.rfs = []
+        self.amostras = []
+
+    def executar(self, funcao, args, perfil=None):
+        """
+        Executa funcao(args) com um Cronometro ativo e guarda os tempos do RF.
+        perfil: caminho .prof; o RF é executado com cProfile e tracemalloc e, como a
+        instrumentação distorce os tempos, fica fora das estatísticas por etapa.
+        """
+        global _ATUAL
+        crono = _ATUAL = Cronometro()
+        try:
+            if perfil is None:
+                return funcao(args)
+            return self._perfilar(funcao, args, perfil)
+        finally:
+            _ATUAL = None
+            if perfil is None:
+                crono.tempos['total'] = crono.total()
+                self.rfs.append((crono.tempos, crono.contadores))
+
+    def _perfilar(self, funcao, args, perfil):
+        os.makedirs(os.path.dirname(perfil), exist_ok=True)
+        perfilador = cProfile.Profile()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        perfilador.enable()
+        try:
+            return funcao(args)
+        finally:
+            perfilador.disable()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            perfilador.dump_stats(perfil)
+            self.amostras.append({'arquivo': perfil, 'segundos': round(time.perf_counter() - inicio, 4),
+                                  'pico_memoria_kb': pico // 1024})
+
+    def dados(self):
+        return {'pid': os.getpid(), 'rfs': self.rfs, 'amostras': self.amostras}
+
+def _estatisticas(valores):
+    valores = np.asarray(valores, dtype=float)
+    if not len(valores):
+        return None
+    est = {f"p{p}": round(float(v), 4) for p, v in zip(PERCENTIS, np.percentile(valores, PERCENTIS))}
+    est['max'] = round(float(valores.max()), 4)
+    est['total'] = round(float(valores.sum()), 4)
+    return est
+
+class Perfil:
+    """
+    Consolida as etapas do processo principal e as medições devolvidas pelos lotes.
+    Pode ser lido durante a execução (ex.: pela interface, ver execucoes.py).
+    """
+    def __init__(self):
+        self.etapas = {}
+        self._por_etapa = {}
+        self._por_trabalhador = {}
+        self._contadores = {}
+        self._amostras = []
+        self._trava = threading.Lock()
+
+    def registrar_etapa(self, nome, segundos):
+        with self._trava:
+            self.etapas[nome] = round(self.etapas.get(nome, 0.0) + segundos, 4)
+
+    def adicionar_lote(self, medicao):
+        with self._trava:
+            tempos_pid = self._por_trabalhador.setdefault(medicao['pid'], [])
+            for tempos, contadores in medicao['rfs']:
+                for etapa, segundos in tempos.items():
+                    self._por_etapa.setdefault(etapa, []).append(segundos)
+                tempos_pid.append(tempos['total'])
+                for nome, quantidade in contadores.items():
+                    self._contadores[nome] = self._contadores.get(nome, 0) + quantidade
+            self._amostras.extend(medicao['amostras'])
+
+    def resumo(self):
+        """Perfil da execução: etapas (s), estatísticas por etapa da planilha e por trabalhador."""
+        with self._trava:
+            etapas = dict(self.etapas)
+            por_etapa = {e: list(v) for e, v in self._por_etapa.items()}
+            por_trabalhador = {pid: list(v) for pid, v in self._por_trabalhador.items()}
+            contadores = dict(self._contadores)
+            amostras = list(self._amostras)
+        trabalhadores = {}
+        for pid, tempos in por_trabalhador.items():
+            est = _estatisticas(tempos)
+            if est is not None:
+                trabalhadores[str(pid)] = dict(rfs=len(tempos), **est)
+        return {
+            'etapas': etapas,
+            'planilhas': {e: _estatisticas(v) for e, v in por_etapa.items()},
+            'trabalhadores': trabalhadores,
+            'contadores': contadores,
+            'amostras': amostras,
+        }
+
+    def gravar(self, output_folder):
+        """Grava o resumo em output_folder/NOME_PERFIL. Retorna o caminho."""
+        caminho = os.path.join(output_folder, NOME_PERFIL)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(self.resumo(), f, indent=2)
+        return caminho
+
+def caminho_amostra(output_folder, reg_h):
+    """Arquivo .prof de um RF da amostra perfilada."""
+    return os.path.join(output_folder, PASTA_PERFIS, f"{reg_h.processo.strip()}-{reg_h.rf.strip()}.prof")
+
+def escolher_amostra(regs_h, quantidade):
+    """Chaves de até quantidade RFs espalhados uniformemente pela lista."""
+    if quantidade <= 0 or not regs_h:
+        return frozenset()
+    passo = max(1, len(regs_h) // quantidade)
+    return frozenset(h.chave for h in regs_h[::passo][:quantidade])
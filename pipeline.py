@@ -0,0 +1,596 @@
+import os
+import sys
+import time
+import datetime
+import contextlib
+import concurrent.futures
+import multiprocessing
+
+from leitura import ler_header, ler_indices, abrir_detail
+from agregacao import AgregadorMensal
+from despacho import (
+    MOTOR_OPENPYXL, MOTORES_EXCEL, processar_lote, montar_lotes, publicar_contexto, remover_contexto
+)
+from trabalhadores import PoolTrabalhadores
+from banco import BANCO_ACCESS, BANCOS, gerar_banco
+from colunar import exportar_parquet
+from manifesto import Manifesto, assinatura_execucao, assinatura_rf
+from cancelamento import Cancelamento
+from medicao import Perfil, escolher_amostra
+from entradas import Entrada
+from arquivo_zip import SaidaZip
+from cache_leitura import HEADER, INDICES, DETAIL, CacheLeitura, hash_fonte, tamanho_header, tamanho_detail
+
+ROTINAS_DISPONIVEIS = ["SJ230133", "SJ071984"]
+
+# Etapas que podem ser geradas em uma execução
+FORMATO_MDB = "mdb"
+FORMATO_XLSX = "xlsx"
+FORMATOS_DISPONIVEIS = (FORMATO_MDB, FORMATO_XLSX)
+# Exportação colunar opcional (requer pyarrow): não faz parte das saídas padrão
+FORMATO_PARQUET = "parquet"
+# Planilha consolidada opcional com todos os RFs e competências (ver consolidado.py)
+FORMATO_CONSOLIDADO = "consolidado"
+
+# Lotes em voo por trabalhador: mantém o pool ocupado sem montar as linhas de todos os RFs de uma vez
+LOTES_POR_TRABALHADOR = 2
+
+# Intervalo (s) entre as atualizações de andamento enquanto apenas o banco de dados está em execução
+# e entre as verificações de cancelamento
+INTERVALO_ANDAMENTO = 0.5
+
+# Pares de um lote lidos e indexados ao mesmo tempo
+LEITURAS_SIMULTANEAS = 4
+
+# Leituras já feitas neste processo (Header, índices e Detail indexado), pelo hash do conteúdo
+CACHE_LEITURA = CacheLeitura()
+
+# Tempo máximo (s) para os trabalhadores pararem após o cancelamento antes de serem encerrados
+TEMPO_CANCELAMENTO = 5
+
+def resource_path(relative_path):
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        # Fora do executável: a pasta do projeto, e não a pasta de onde o ddv foi chamado
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, relative_path)
+
+def caminhos_templates():
+    """Retorna os caminhos padrão dos templates MDB e XLS."""
+    p_tpl_mdb = resource_path(os.path.join("Templates", "MDB-Matriz.mdb"))
+    p_tpl_xls = resource_path(os.path.join("Templates", "XLS-MATRIZ.xlsx"))
+    return p_tpl_mdb, p_tpl_xls
+
+def workers_padrao():
+    return max(1, multiprocessing.cpu_count() - 1)
+
+def _notificar(callback, *args):
+    if callback is not None:
+        callback(*args)
+
+def executar_pipeline(fonte_header, fonte_detail, fonte_indices, rotina, diretorio_saida,
+                      p_tpl_mdb, p_tpl_xls, max_workers=None, formatos=FORMATOS_DISPONIVEIS,
+                      progresso=None, aviso=None, motor_excel=MOTOR_OPENPYXL, pool=None, banco=BANCO_ACCESS,
+                      incremental=True, cancelamento=None, amostra_perfil=0, saida_zip=False):
+    """
+    Executa as etapas de banco de dados e Excel sobre os arquivos do Mainframe.
+    As fontes podem ser caminhos ou buffers em memória (ex.: getbuffer() do upload).
+
+    progresso(percentual, mensagem) recebe o andamento geral da execução.
+    aviso(ok, mensagem) recebe o resultado das etapas de banco de dados e Parquet.
+    motor_excel escolhe como as planilhas são escritas (ver MOTORES_EXCEL).
+    banco escolhe onde as tabelas Header/Detail são gravadas (ver BANCOS); o template MDB
+    só é usado pelo Access.
+    FORMATO_PARQUET em formatos exporta o Detail e as linhas mensais em Parquet.
+    FORMATO_CONSOLIDADO em formatos grava a planilha consolidada de todos os RFs.
+    incremental: reaproveita as planilhas da saída cujas entradas não mudaram (ver manifesto.py).
+    cancelamento: Cancelamento que interrompe a execução (levanta ExecucaoCancelada); os
+    trabalhadores ocupados são liberados e os arquivos parciais, removidos.
+    amostra_perfil: quantidade de RFs gerados com cProfile e tracemalloc (ver medicao.py).
+    saida_zip: as planilhas são gravadas em um único ZIP na saída (ver arquivo_zip.py), com a
+    mesma estrutura de pastas, devolvido em 'arquivo_zip'; nesse modo, nada é reaproveitado.
+    O perfil da execução (tempo das etapas, p50/p95/máximo por etapa da planilha e por
+    trabalhador) é devolvido em 'perfil' e gravado na saída.
+    pool: PoolTrabalhadores já aberto e reaproveitado entre execuções (ou um
+    distribuido.PoolDistribuido); sem ele, um pool de max_workers processos é criado e
+    encerrado nesta execução.
+    Retorna o resumo do processamento.
+    """
+    return executar_lote(
+        [Entrada(fonte_header, fonte_detail, fonte_indices, rotina)], diretorio_saida, p_tpl_mdb, p_tpl_xls,
+        max_workers=max_workers, formatos=formatos, progresso=progresso, aviso=aviso, motor_excel=motor_excel,
+        pool=pool, banco=banco, incremental=incremental, cancelamento=cancelamento, amostra_perfil=amostra_perfil,
+        saida_zip=saida_zip
+    )
+
+def executar_lote(entradas, diretorio_saida, p_tpl_mdb, p_tpl_xls, max_workers=None, formatos=FORMATOS_DISPONIVEIS,
+                  progresso=None, aviso=None, motor_excel=MOTOR_OPENPYXL, pool=None, banco=BANCO_ACCESS,
+                  incremental=True, cancelamento=None, amostra_perfil=0, perfil=None, cache_leitura=CACHE_LEITURA,
+                  saida_zip=False):
+    """
+    Executa vários pares Header/Detail (ver entradas.Entrada) em uma única execução: os pares
+    são lidos em paralelo e os RFs de todos eles vão para a mesma fila do pool, dos maiores para
+    os menores. Os demais parâmetros são os de executar_pipeline; o resumo é consolidado e traz
+    o resultado de cada par em 'entradas'. Com mais de um par, o Parquet de cada um é gravado
+    em uma subpasta com o nome do par.
+    perfil: Perfil preenchido durante a execução, para quem acompanha o andamento de outra
+    thread (ver execucoes.py); sem ele, um novo é criado.
+    cache_leitura: CacheLeitura das entradas já lidas (padrão: o cache em memória deste processo,
+    que sobrevive aos reruns do Streamlit); None lê tudo de novo.
+    """
+    if not entradas:
+        raise ValueError("Nenhuma entrada para processar.")
+    if motor_excel not in MOTORES_EXCEL:
+        raise ValueError(f"Motor Excel desconhecido: {motor_excel}")
+    if banco not in BANCOS:
+        raise ValueError(f"Banco de dados desconhecido: {banco}")
+    if FORMATO_MDB in formatos and banco == BANCO_ACCESS and not os.path.exists(p_tpl_mdb):
+        raise FileNotFoundError(f"Template MDB ausente: {p_tpl_mdb}")
+    if FORMATO_XLSX in formatos and not os.path.exists(p_tpl_xls):
+        raise FileNotFoundError(f"Template XLS ausente: {p_tpl_xls}")
+
+    sinal_local = cancelamento is None
+    if sinal_local:
+        # Mesmo sem cancelamento externo, uma interrupção (ex.: Ctrl+C) libera as etapas em andamento
+        cancelamento = Cancelamento()
+
+    pool_local = pool is None and FORMATO_XLSX in formatos
+    if pool_local:
+        # OTIMIZAÇÃO: os trabalhadores sobem e carregam o template enquanto os arquivos são lidos
+        pool = PoolTrabalhadores(max_workers or workers_padrao(), p_tpl_xls, (motor_excel,))
+    try:
+        return _executar(entradas, diretorio_saida, p_tpl_mdb, p_tpl_xls, formatos, progresso, aviso,
+                         motor_excel, pool, banco, incremental, cancelamento, amostra_perfil,
+                         Perfil() if perfil is None else perfil, cache_leitura, saida_zip)
+    finally:
+        if pool_local:
+            pool.encerrar()
+        if sinal_local:
+            cancelamento.descartar()
+
+class _Trabalho:
+    """Estado de uma Entrada durante a execução: dados lidos e resultados do par."""
+    def __init__(self, entrada):
+        self.entrada = entrada
+        self.rotina = entrada.rotina
+        self.regs_h = []
+        self.indices = []
+        self.dt_limite = None
+        self.detail = None
+        self.mensal = None
+        self.linhas_por_rf = {}
+        self.erros = []
+        self.resultados = []
+        self.reaproveitados = 0
+        self.ok_mdb, self.msg_mdb = None, None
+        self.em_cache = False
+
+    def ler(self, pilha, agregar, cache=None):
+        """
+        Lê o Header e os índices e indexa o Detail, reaproveitando as leituras do cache
+        (ver cache_leitura.py). Retorna os tempos (leitura, indexação, agregação).
+        """
+        inicio = time.perf_counter()
+        self.regs_h = self._ler_em_cache(cache, HEADER, self.entrada.fonte_header, ler_header, tamanho_header)
+        self.indices = self._ler_em_cache(cache, INDICES, self.entrada.fonte_indices, ler_indices,
+                                          lambda indices: 100 * len(indices))
+        self.dt_limite = self.indices[-1][0] if self.indices else datetime.datetime.now()
+        leitura = time.perf_counter() - inicio
+
+        # OTIMIZAÇÃO: o Detail é mapeado em memória e indexado por Processo + RF em uma única
+        # varredura; a agregação mensal colunar é alimentada na mesma passada
+        self.detail = pilha.enter_context(abrir_detail(self.entrada.fonte_detail))
+        inicio = time.perf_counter()
+        chave = hash_fonte(self.entrada.fonte_detail) if cache is not None else None
+        em_cache = cache.obter(DETAIL, chave) if cache is not None else None
+        if em_cache is not None and (em_cache[1] is not None or not agregar):
+            # OTIMIZAÇÃO: mesmo conteúdo já indexado e agregado: a varredura do Detail é pulada
+            indice, self.mensal = em_cache
+            self.detail.restaurar_indice(indice)
+            self.linhas_por_rf = self.detail.quantidades()
+            self.em_cache = True
+            return leitura, time.perf_counter() - inicio, 0.0
+
+        agregador = AgregadorMensal() if agregar else None
+        self.detail.indexar(agregador)
+        self.linhas_por_rf = self.detail.quantidades()
+        indexacao = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        self.mensal = agregador.resultado() if agregador is not None else None
+        if cache is not None:
+            indice = self.detail.indice()
+            cache.guardar(DETAIL, chave, (indice, self.mensal), tamanho_detail(indice, self.mensal))
+        return leitura, indexacao, time.perf_counter() - inicio
+
+    @staticmethod
+    def _ler_em_cache(cache, tipo, fonte, ler, tamanho):
+        if cache is None or fonte is None:
+            return ler(fonte)
+        chave = hash_fonte(fonte)
+        valor = cache.obter(tipo, chave)
+        if valor is None:
+            valor = ler(fonte)
+            cache.guardar(tipo, chave, valor, tamanho(valor))
+        return valor
+
+    def resumo(self):
+        return {
+            'nome': self.entrada.nome,
+            'rotina': self.rotina,
+            'rfs': len(self.regs_h),
+            'sucesso': len(self.resultados),
+            'erros': len(self.erros),
+            'reaproveitados': self.reaproveitados,
+            'leitura_em_cache': self.em_cache,
+            'mdb_ok': self.ok_mdb,
+            'mdb_msg': self.msg_mdb,
+        }
+
+def _etapa_banco(banco, trabalhos, diretorio_saida, p_tpl_mdb, andamento, cancelamento):
+    """
+    Etapa de banco de dados, executada em thread própria: um banco por par, em sequência.
+    Retorna [(ok, mensagem, segundos)] na ordem dos pares.
+    """
+    resultados = []
+    gravadas = 0
+    for t in trabalhos:
+        if cancelamento.cancelado():
+            break
+        inicio = time.perf_counter()
+        ok, msg = gerar_banco(banco, t.regs_h, t.detail.registros(), diretorio_saida, t.rotina, p_tpl_mdb,
+                              andamento=lambda linhas, base=gravadas: andamento(base + linhas),
+                              cancelamento=cancelamento)
+        resultados.append((ok, msg, time.perf_counter() - inicio))
+        gravadas += t.detail.total_linhas
+    return resultados
+
+def _gravar_planilha(diretorio_saida, relativo, conteudo):
+    """Grava na saída a planilha devolvida em memória por um trabalhador."""
+    path = os.path.join(diretorio_saida, relativo)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(conteudo)
+
+def _remover_parciais(diretorio_saida, rotina, regs_h, desde):
+    """Remove as planilhas dos RFs interrompidos que chegaram a ser escritas nesta execução."""
+    from excel import caminho_relativo
+    desde = desde.timestamp()
+    for h in regs_h:
+        path = os.path.join(diretorio_saida, caminho_relativo(rotina, h.processo.strip(), h.rf.strip()))
+        try:
+            if os.path.getmtime(path) >= desde:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _tarefas_por_par(lotes):
+    """Divide cada lote [(par, reg_h)] em tarefas de um único par: (par, [reg_h])."""
+    for lote in lotes:
+        grupos = {}
+        for i, h in lote:
+            grupos.setdefault(i, []).append(h)
+        yield from grupos.items()
+
+def _executar(entradas, diretorio_saida, p_tpl_mdb, p_tpl_xls, formatos, progresso, aviso,
+              motor_excel, pool, banco, incremental, cancelamento, amostra_perfil, perfil, cache_leitura, saida_zip):
+    tempo_inicio = datetime.datetime.now()
+    os.makedirs(diretorio_saida, exist_ok=True)
+    trabalhos = [_Trabalho(e) for e in entradas]
+
+    ok_mdb, msg_mdb = None, None
+    arquivo_zip = None
+    etapas = {}
+    tot = 0
+    reaproveitados = 0
+
+    with contextlib.ExitStack() as pilha:
+        _notificar(progresso, 0, "📂 Lendo e processando dados em memória...")
+        # OTIMIZAÇÃO: os pares do lote são lidos e indexados em paralelo (a varredura NumPy do
+        # Detail libera o GIL); um par sozinho é lido na própria thread
+        agregar = any(f in formatos for f in (FORMATO_XLSX, FORMATO_PARQUET, FORMATO_CONSOLIDADO))
+        if len(trabalhos) == 1:
+            tempos = [trabalhos[0].ler(pilha, agregar, cache_leitura)]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(trabalhos), LEITURAS_SIMULTANEAS),
+                                                       thread_name_prefix="ddv-leitura") as exe_leitura:
+                tempos = list(exe_leitura.map(lambda t: t.ler(pilha, agregar, cache_leitura), trabalhos))
+        for nome, segundos in zip(('leitura', 'indexacao', 'agregacao'), zip(*tempos)):
+            perfil.registrar_etapa(nome, sum(segundos))
+        total_linhas = sum(t.detail.total_linhas for t in trabalhos)
+
+        etapa_mdb = None
+        try:
+            cancelamento.verificar()
+            # OTIMIZAÇÃO: a carga do banco roda em uma thread própria, em paralelo às planilhas,
+            # lendo o mesmo Detail mapeado em memória; a execução dura o tempo da etapa mais lenta
+            nome_banco = BANCOS[banco].nome
+            andamento_mdb = {'linhas': 0}
+
+            def andamento(linhas):
+                andamento_mdb['linhas'] = linhas
+
+            if FORMATO_MDB in formatos:
+                _notificar(progresso, 10, f"🗄️ Gerando Banco de Dados ({nome_banco})...")
+                exe_mdb = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ddv-banco")
+                etapa_mdb = exe_mdb.submit(
+                    _etapa_banco, banco, trabalhos, diretorio_saida, p_tpl_mdb, andamento, cancelamento
+                )
+                exe_mdb.shutdown(wait=False)
+
+            def situacao_mdb():
+                if etapa_mdb is None or 'mdb' in etapas:
+                    return ""
+                return f" | 🗄️ {nome_banco}: {andamento_mdb['linhas']}/{total_linhas} linhas"
+
+            def concluir_mdb():
+                # Os avisos são emitidos na thread principal (o Streamlit não aceita outras threads)
+                nonlocal ok_mdb, msg_mdb
+                try:
+                    resultados_mdb = etapa_mdb.result()
+                except Exception as e:
+                    resultados_mdb = [(False, f"Erro {nome_banco}: {str(e)}", None)]
+                segundos = 0.0
+                for t, (ok, msg, seg) in zip(trabalhos, resultados_mdb):
+                    t.ok_mdb, t.msg_mdb = ok, msg
+                    segundos += seg or 0.0
+                    _notificar(aviso, ok, msg)
+                ok_mdb = all(ok for ok, _, _ in resultados_mdb) and len(resultados_mdb) == len(trabalhos)
+                msg_mdb = " | ".join(msg for _, msg, _ in resultados_mdb)
+                etapas['mdb'] = {'ok': ok_mdb, 'msg': msg_mdb, 'linhas': andamento_mdb['linhas'], 'segundos': segundos}
+                perfil.registrar_etapa('mdb', segundos)
+
+            if FORMATO_XLSX in formatos:
+                # OTIMIZAÇÃO: o openpyxl é importado só na etapa das planilhas, e não na partida da interface
+                from excel import caminho_relativo
+                cancelamento.verificar()
+                inicio_xlsx = time.perf_counter()
+                _notificar(progresso, 30, "📊 Processando planilhas Excel em paralelo..." + situacao_mdb())
+
+                # Os trabalhadores recebem as linhas mensais prontas e apenas escrevem as planilhas
+                for t in trabalhos:
+                    t.erros = [f"ERRO: {h.processo.strip()} - {t.mensal.erros[h.chave]}"
+                               for h in t.regs_h if h.chave in t.mensal.erros]
+
+                # OTIMIZAÇÃO: planilhas cujas entradas (Header, linhas Detail, índices, template e rotina)
+                # não mudaram desde a última execução sobre esta saída são reaproveitadas sem reprocessamento
+                # No ZIP, cada execução grava um arquivo novo e completo: não há o que reaproveitar
+                manifesto = Manifesto(diretorio_saida) if incremental and not saida_zip else None
+                assinaturas = {}
+                validos = []
+                inicio = time.perf_counter()
+                for i, t in enumerate(trabalhos):
+                    base = assinatura_execucao(p_tpl_xls, t.rotina, t.indices, t.dt_limite) if manifesto is not None else None
+                    for h in t.regs_h:
+                        if h.chave in t.mensal.erros:
+                            continue
+                        if manifesto is not None:
+                            relativo = caminho_relativo(t.rotina, h.processo.strip(), h.rf.strip())
+                            assinatura = assinatura_rf(base, h, t.detail.trechos(h.chave))
+                            if manifesto.atual(relativo, assinatura):
+                                t.resultados.append(os.path.basename(relativo))
+                                t.reaproveitados += 1
+                                continue
+                            # A entrada só volta ao manifesto quando a planilha for gerada de novo
+                            manifesto.descartar(relativo)
+                            assinaturas[i, h.chave] = (relativo, assinatura)
+                        validos.append((i, h))
+                perfil.registrar_etapa('manifesto', time.perf_counter() - inicio)
+
+                tot = sum(len(t.regs_h) for t in trabalhos)
+                reaproveitados = sum(t.reaproveitados for t in trabalhos)
+                done = sum(len(t.erros) for t in trabalhos) + reaproveitados
+                n_workers = pool.n_workers
+
+                # OTIMIZAÇÃO: RFs de todos os pares agrupados em lotes pelo volume de linhas do Detail, dos
+                # maiores para os menores, em uma única fila: a cauda da execução não fica presa em um único
+                # RF grande e o pool não esvazia entre um par e outro
+                pesos = [trabalhos[i].linhas_por_rf.get(h.chave, 0) for i, h in validos]
+                tarefas = _tarefas_por_par(montar_lotes(validos, pesos, n_workers))
+
+                # OTIMIZAÇÃO: ProcessPoolExecutor contorna o GIL para uso máximo de múltiplos núcleos da CPU
+                # OTIMIZAÇÃO: template, índices e demais constantes de cada par são lidos uma única vez por
+                # trabalhador a partir do arquivo de contexto; as tarefas levam só o Header e as linhas mensais
+                amostra = escolher_amostra([h for _, h in validos], amostra_perfil)
+                contextos = {}
+                pendentes = {}
+                # OTIMIZAÇÃO: na saída em ZIP, os trabalhadores devolvem o conteúdo das planilhas e o processo
+                # principal grava tudo em um único arquivo, sem milhares de pastas e arquivos pequenos
+                zip_saida = SaidaZip(diretorio_saida) if saida_zip else None
+                # Trabalhadores em outras máquinas também devolvem o conteúdo: a gravação é feita aqui
+                em_memoria = saida_zip or pool.em_memoria
+
+                def contexto(i):
+                    if i not in contextos:
+                        t = trabalhos[i]
+                        contextos[i] = publicar_contexto(motor_excel, p_tpl_xls, diretorio_saida, t.rotina, t.indices,
+                                                         t.dt_limite, cancelamento.caminho, amostra, em_memoria)
+                    return contextos[i]
+
+                def submeter():
+                    # As linhas mensais de cada lote são montadas apenas no envio
+                    while len(pendentes) < n_workers * LOTES_POR_TRABALHADOR:
+                        i, lote = next(tarefas, (None, None))
+                        if lote is None:
+                            return
+                        mensal = trabalhos[i].mensal
+                        f = exe.submit(processar_lote, contexto(i), [(h, mensal.linhas(h.chave)) for h in lote])
+                        pendentes[f] = (i, lote)
+
+                def recolher(f):
+                    """Registra o resultado de um lote concluído. Retorna o par e os RFs do lote que não foram gerados."""
+                    i, lote = pendentes.pop(f)
+                    t = trabalhos[i]
+                    try:
+                        respostas, medicao = f.result()
+                    except Exception as e:
+                        t.erros.extend([f"Falha na alocação do processo: {str(e)}"] * len(lote))
+                        return i, lote
+                    perfil.adicionar_lote(medicao)
+                    for h, res in zip(lote, respostas):
+                        if isinstance(res, tuple):
+                            res, conteudo = res
+                            relativo = caminho_relativo(t.rotina, h.processo.strip(), h.rf.strip())
+                            if zip_saida is not None:
+                                zip_saida.adicionar(relativo, conteudo)
+                            else:
+                                _gravar_planilha(diretorio_saida, relativo, conteudo)
+                        if "ERRO" in res: t.erros.append(res)
+                        else:
+                            t.resultados.append(res)
+                            if manifesto is not None:
+                                manifesto.registrar(*assinaturas[i, h.chave])
+                    return i, lote[len(respostas):]
+
+                try:
+                    exe = pool.executor()
+                    submeter()
+                    while pendentes:
+                        aguardando = set(pendentes)
+                        if etapa_mdb is not None and 'mdb' not in etapas:
+                            aguardando.add(etapa_mdb)
+                        concluidos, _ = concurrent.futures.wait(
+                            aguardando, timeout=INTERVALO_ANDAMENTO, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        cancelamento.verificar()
+                        for f in concluidos:
+                            if f is etapa_mdb:
+                                concluir_mdb()
+                                continue
+                            done += len(pendentes[f][1])
+                            recolher(f)
+                        if concluidos and manifesto is not None:
+                            manifesto.gravar()
+
+                        # O andamento também é reenviado nas esperas sem conclusão: é nele que a interface
+                        # pode interromper a execução (ex.: rerun do Streamlit ao clicar em CANCELAR)
+                        progress = 30 + (int((done / tot) * 60))
+                        _notificar(progresso, progress, f"📊 Planilhas Excel: {done}/{tot} ({int((done/tot)*100)}%) processadas" + situacao_mdb())
+                        submeter()
+                    if zip_saida is not None:
+                        arquivo_zip = zip_saida.concluir()
+                finally:
+                    if pendentes:
+                        # Execução interrompida: a fila é esvaziada e os trabalhadores param entre um RF e outro;
+                        # os que não pararem a tempo são encerrados e o pool é recriado
+                        cancelamento.cancelar()
+                        for f in pendentes: f.cancel()
+                        concluidos, restantes = concurrent.futures.wait(
+                            [f for f in pendentes if not f.cancelled()], timeout=TEMPO_CANCELAMENTO
+                        )
+                        if restantes:
+                            pool.interromper()
+                        interrompidos = {}
+                        for f in list(pendentes):
+                            if f in concluidos:
+                                i, hs = recolher(f)
+                            elif f in restantes:
+                                i, hs = pendentes.pop(f)
+                            else:
+                                continue
+                            interrompidos.setdefault(i, []).extend(hs)
+                        for i, hs in interrompidos.items():
+                            _remover_parciais(diretorio_saida, trabalhos[i].rotina, hs, tempo_inicio)
+                    if zip_saida is not None and arquivo_zip is None:
+                        zip_saida.descartar()
+                    for caminho in contextos.values():
+                        remover_contexto(caminho)
+                    if manifesto is not None:
+                        manifesto.gravar()
+                n_erros = sum(len(t.erros) for t in trabalhos)
+                etapas['xlsx'] = {'sucesso': tot - n_erros, 'erros': n_erros, 'reaproveitados': reaproveitados,
+                                  'zip': arquivo_zip, 'segundos': time.perf_counter() - inicio_xlsx}
+                perfil.registrar_etapa('xlsx', etapas['xlsx']['segundos'])
+
+            if FORMATO_PARQUET in formatos:
+                cancelamento.verificar()
+                inicio_parquet = time.perf_counter()
+                andamento_parquet = {'linhas': 0}
+                resultados_pq = []
+
+                for t in trabalhos:
+                    gravadas = andamento_parquet['linhas']
+
+                    def andamento_pq(linhas, base=gravadas):
+                        andamento_parquet['linhas'] = base + linhas
+                        _notificar(progresso, 90, f"📦 Exportando Parquet: {base + linhas}/{total_linhas} linhas" + situacao_mdb())
+
+                    _notificar(progresso, 90, "📦 Exportando Parquet..." + situacao_mdb())
+                    # Um par sozinho grava direto na saída; em lote, cada par tem a sua subpasta
+                    saida_pq = diretorio_saida if len(trabalhos) == 1 else os.path.join(diretorio_saida, t.entrada.nome)
+                    ok_pq, msg_pq = exportar_parquet(t.regs_h, t.detail.registros(), t.mensal, saida_pq, andamento_pq,
+                                                     cancelamento)
+                    andamento_parquet['linhas'] = gravadas + t.detail.total_linhas
+                    resultados_pq.append((ok_pq, msg_pq))
+                    _notificar(aviso, ok_pq, msg_pq)
+                etapas['parquet'] = {'ok': all(ok for ok, _ in resultados_pq),
+                                     'msg': " | ".join(msg for _, msg in resultados_pq),
+                                     'linhas': andamento_parquet['linhas'],
+                                     'segundos': time.perf_counter() - inicio_parquet}
+                perfil.registrar_etapa('parquet', etapas['parquet']['segundos'])
+
+            if FORMATO_CONSOLIDADO in formatos:
+                from consolidado import gerar_consolidado
+                cancelamento.verificar()
+                inicio_consolidado = time.perf_counter()
+                _notificar(progresso, 95, "📑 Gerando planilha consolidada..." + situacao_mdb())
+                # OTIMIZAÇÃO: montada das linhas mensais já agregadas, sem reabrir as planilhas geradas
+                ok_cons, msg_cons = gerar_consolidado([(t.rotina, t.regs_h, t.mensal) for t in trabalhos],
+                                                      diretorio_saida, cancelamento)
+                etapas['consolidado'] = {'ok': ok_cons, 'msg': msg_cons,
+                                         'segundos': time.perf_counter() - inicio_consolidado}
+                perfil.registrar_etapa('consolidado', etapas['consolidado']['segundos'])
+                _notificar(aviso, ok_cons, msg_cons)
+
+            # O Detail só é liberado quando a carga do banco termina
+            while etapa_mdb is not None and 'mdb' not in etapas:
+                try:
+                    etapa_mdb.result(timeout=INTERVALO_ANDAMENTO)
+                except concurrent.futures.TimeoutError:
+                    cancelamento.verificar()
+                    perc = 10 + int(80 * andamento_mdb['linhas'] / max(total_linhas, 1))
+                    _notificar(progresso, min(perc, 90),
+                               f"🗄️ Gerando Banco de Dados ({nome_banco}): {andamento_mdb['linhas']}/{total_linhas} linhas")
+                    continue
+                except Exception:
+                    pass
+                concluir_mdb()
+        except BaseException:
+            # Cancelamento (botão, Ctrl+C, rerun do Streamlit) ou falha: as demais etapas param no próximo lote
+            cancelamento.cancelar()
+            raise
+        finally:
+            # O Detail só pode ser fechado depois que a thread do banco deixar de lê-lo
+            if etapa_mdb is not None:
+                concurrent.futures.wait([etapa_mdb])
+
+    tempo_fim = datetime.datetime.now()
+    tempo_total = tempo_fim - tempo_inicio
+    perfil.registrar_etapa('total', tempo_total.total_seconds())
+    try:
+        arquivo_perfil = perfil.gravar(diretorio_saida)
+    except OSError:
+        # O perfil é auxiliar: uma falha ao gravá-lo não invalida a execução
+        arquivo_perfil = None
+    _notificar(progresso, 100, "✅ Processamento concluído com sucesso!")
+
+    errs = [e for t in trabalhos for e in t.erros]
+    return {
+        'hora_inicio': tempo_inicio.strftime("%H:%M:%S"),
+        'hora_fim': tempo_fim.strftime("%H:%M:%S"),
+        'tempo_total': str(tempo_total).split('.')[0],
+        'segundos': tempo_total.total_seconds(),
+        'sucesso': tot - len(errs),
+        'erros': len(errs),
+        'reaproveitados': reaproveitados,
+        'detalhes_erros': errs,
+        'arquivos': [r for t in trabalhos for r in t.resultados],
+        'arquivo_zip': arquivo_zip,
+        'mdb_ok': ok_mdb,
+        'mdb_msg': msg_mdb,
+        'etapas': etapas,
+        'entradas': [t.resumo() for t in trabalhos],
+        'perfil': perfil.resumo(),
+        'arquivo_perfil': arquivo_perfil,
+        'output_dir': diretorio_saida
+    }
@@ -1,8 +1,15 @@
 import os
 import sys
-import streamlit.web.cli as stcli
+import multiprocessing
 
 if __name__ == "__main__":
+    # Os trabalhadores do pool são novas instâncias do .exe: aqui eles assumem o papel de
+    # trabalhador e nunca chegam ao Streamlit
+    multiprocessing.freeze_support()
+
+    # OTIMIZAÇÃO: o Streamlit só é importado pelo processo da interface
+    import streamlit.web.cli as stcli
+
     # Descobre a pasta onde o .exe está rodando
     if getattr(sys, 'frozen', False):
         pasta_base = sys._MEIPASS
@@ -0,0 +1,158 @@
+"""
+Gerador de arquivos sintéticos do Mainframe (Header _F, Detail _V e índices de correção).
+
+As linhas são montadas a partir dos campos de layout.py, com as mesmas posições lidas pelo
+pipeline. Serve para testes de carga e para o benchmark sem expor extrações reais.
+
+Uso:
+    python -m sintetico --saida /tmp/dados --processos 2 --rfs 1000 --meses 36
+    python -m sintetico --saida /tmp/dados --codigos 7011:3,7012:3,0001:10
+"""
+import os
+import sys
+import random
+import argparse
+import calendar
+
+from layout import LAYOUT_HEADER, LAYOUT_DETAIL, CENTAVOS
+from leitura import ENCODING_MAINFRAME
+from agregacao import CODIGOS_IPREM, CODIGOS_HSPM, CODIGO_FUNFIN, CODIGO_FUNPREV
+
+NOME_HEADER = "DDV_F.txt"
+NOME_DETAIL = "DDV_V.txt"
+NOME_INDICES = "DDV_INDICES.txt"
+
+# Quebra de linha das extrações baixadas do Mainframe
+QUEBRA = "\r\n"
+
+# Pesos dos códigos sorteados nas linhas Detail: os códigos das regras de agregação
+# (inclusive 7011/7012, que mudam de coluna a partir de 2019) e códigos sem regra
+CODIGOS_PADRAO = dict(
+    [(c, 3) for c in sorted(CODIGOS_IPREM)] + [(c, 3) for c in sorted(CODIGOS_HSPM)]
+    + [(CODIGO_FUNFIN, 4), (CODIGO_FUNPREV, 4), ("0001", 10), ("0100", 10), ("0250", 5)]
+)
+
+# Linhas Detail (códigos) por competência de cada RF: sorteio entre os limites
+LINHAS_POR_MES = (1, 6)
+
+# Maior valor monetário sorteado, em centavos
+VALOR_MAXIMO = 1_000_000
+
+def _linha(layout, valores):
+    """Monta a linha de largura fixa: texto alinhado à esquerda, centavos com zeros à esquerda."""
+    partes = []
+    for campo in layout.campos:
+        largura = campo.fim - campo.inicio
+        valor = valores[campo.nome]
+        if campo.tipo == CENTAVOS:
+            partes.append(f"{valor:0{largura}d}")
+        else:
+            partes.append(str(valor)[:largura].ljust(largura))
+    return "".join(partes)
+
+def _competencias(ano_inicial, meses):
+    for i in range(meses):
+        yield ano_inicial + i // 12, i % 12 + 1
+
+def linhas_header(processos, rfs, semente=0):
+    """Gera (processo, rf, linha Header) de todos os RFs."""
+    sorteio = random.Random(semente)
+    for p in range(processos):
+        processo = f"{p + 1:012d}"
+        for r in sorteio.sample(range(1, 10 ** 9), rfs):
+            rf = f"{r:09d}"
+            yield processo, rf, _linha(LAYOUT_HEADER, {
+                "processo": processo, "rf": rf, "mes": "01", "ano": "2020",
+                "data_processamento": "15/07/2020", "observacao": "DADOS SINTÉTICOS",
+                "autor": f"AUTOR {p + 1}-{r}", "cargo": "CARGO SINTÉTICO", "padrao": "PADRAO",
+                "qtde_dias": "30", "auto": "AUTO",
+            })
+
+def linhas_detail(rf_processos, meses, ano_inicial=2017, codigos=None, semente=0):
+    """Gera as linhas Detail de cada (processo, rf), agrupadas por RF como nas extrações."""
+    sorteio = random.Random(semente + 1)
+    codigos = codigos or CODIGOS_PADRAO
+    lista_codigos, pesos = list(codigos), list(codigos.values())
+    for processo, rf in rf_processos:
+        for ano, mes in _competencias(ano_inicial, meses):
+            for codigo in sorteio.choices(lista_codigos, pesos, k=sorteio.randint(*LINHAS_POR_MES)):
+                recebido, a_receber, descontado, a_descontar = (sorteio.randrange(VALOR_MAXIMO) for _ in range(4))
+                yield _linha(LAYOUT_DETAIL, {
+                    "processo": processo, "rf": rf, "mes": f"{mes:02d}", "ano": f"{ano:04d}",
+                    "codigo": codigo, "significado": f"CODIGO {codigo}",
+                    "recebido": recebido, "a_receber": a_receber, "dif_venc": abs(a_receber - recebido),
+                    "descontado": descontado, "a_descontar": a_descontar, "dif_desc": abs(a_descontar - descontado),
+                })
+
+def linhas_indices(ano_inicial, meses, semente=0):
+    """Um índice por competência (último dia do mês), no formato AAAAMMDD + valor com vírgula."""
+    sorteio = random.Random(semente + 2)
+    for ano, mes in _competencias(ano_inicial, meses):
+        valor = f"{1 + sorteio.random():.6f}".replace(".", ",")
+        yield f"{ano:04d}{mes:02d}{calendar.monthrange(ano, mes)[1]:02d}{valor}"
+
+def _gravar(caminho, linhas):
+    with open(caminho, "w", encoding=ENCODING_MAINFRAME, newline="") as f:
+        for linha in linhas:
+            f.write(linha + QUEBRA)
+
+def caminhos_dados(pasta):
+    """Caminhos (header, detail, indices) dos arquivos gerados em pasta."""
+    return tuple(os.path.join(pasta, n) for n in (NOME_HEADER, NOME_DETAIL, NOME_INDICES))
+
+def gerar_dados(pasta, processos=1, rfs=1000, meses=36, ano_inicial=2017, codigos=None, semente=0):
+    """
+    Grava os arquivos Header, Detail e índices em pasta. Retorna os caminhos (header, detail, indices).
+    rfs: quantidade de RFs por processo; meses: competências de cada RF a partir de janeiro de ano_inicial.
+    codigos: {código: peso} sorteados nas linhas Detail (padrão: CODIGOS_PADRAO).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    caminhos = caminhos_dados(pasta)
+
+    rf_processos = []
+    with open(caminhos[0], "w", encoding=ENCODING_MAINFRAME, newline="") as f:
+        for processo, rf, linha in linhas_header(processos, rfs, semente):
+            rf_processos.append((processo, rf))
+            f.write(linha + QUEBRA)
+    _gravar(caminhos[1], linhas_detail(rf_processos, meses, ano_inicial, codigos, semente))
+    # Um mês a mais de índices: a data limite fica depois da última competência
+    _gravar(caminhos[2], linhas_indices(ano_inicial, meses + 1, semente))
+    return caminhos
+
+def _codigos(texto):
+    """'7011:3,0001:10' -> {'7011': 3, '0001': 10}."""
+    codigos = {}
+    for item in texto.split(","):
+        codigo, _, peso = item.strip().partition(":")
+        try:
+            codigos[codigo] = int(peso) if peso else 1
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Peso inválido para o código {codigo}: '{peso}'")
+        if not codigo or len(codigo) > 4 or codigos[codigo] < 0:
+            raise argparse.ArgumentTypeError(f"Código inválido: '{item}' (use CODIGO:PESO, ex.: 7011:3,0001:10)")
+    if not any(codigos.values()):
+        raise argparse.ArgumentTypeError("Ao menos um código precisa de peso maior que zero.")
+    return codigos
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog="sintetico", description="Gera arquivos sintéticos do Mainframe para o DDV.")
+    parser.add_argument("--saida", required=True, help="Pasta onde os arquivos serão gravados.")
+    parser.add_argument("--processos", type=int, default=1)
+    parser.add_argument("--rfs", type=int, default=1000, help="RFs por processo.")
+    parser.add_argument("--meses", type=int, default=36, help="Competências por RF.")
+    parser.add_argument("--ano-inicial", type=int, default=2017,
+                        help="Ano da primeira competência (padrão 2017: 7011/7012 antes e depois de 2019).")
+    parser.add_argument("--codigos", type=_codigos, default=None, metavar="CODIGO:PESO,...",
+                        help="Códigos sorteados nas linhas Detail e seus pesos (padrão: todos os das regras e alguns sem regra).")
+    parser.add_argument("--semente", type=int, default=0)
+    return parser
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    for caminho in gerar_dados(args.saida, args.processos, args.rfs, args.meses, args.ano_inicial,
+                               args.codigos, args.semente):
+        print(caminho)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Testes do DDV (pytest): python -m pytest -q test_ddv.py
+
+Os dados de entrada são gerados por sintetico.py; as planilhas usam os templates
+padrão (pipeline.caminhos_templates).
+"""
+import os
+import shutil
+import warnings
+import collections
+
+import openpyxl
+import pytest
+
+import agregacao
+import banco
+import sintetico
+from agregacao import AgregadorMensal, agregar_mensal, CODIGO_FUNFIN, CODIGO_FUNPREV, ANO_REFORMA
+from despacho import MOTOR_OPENPYXL, MOTOR_XML
+from entradas import Entrada
+from layout import LAYOUT_DETAIL
+from leitura import abrir_detail, abrir_texto
+from manifesto import Manifesto
+from pipeline import executar_lote, caminhos_templates, FORMATO_XLSX
+
+ROTINA = "SJ230133"
+
+@pytest.fixture(scope="module")
+def dados(tmp_path_factory):
+    """Algumas centenas de RFs entre 2017 e 2019: 7011/7012 antes e depois da reforma."""
+    return sintetico.gerar_dados(str(tmp_path_factory.mktemp("dados")), processos=2, rfs=150, meses=36)
+
+@pytest.fixture(scope="module")
+def dados_planilhas(tmp_path_factory):
+    return sintetico.gerar_dados(str(tmp_path_factory.mktemp("dados_planilhas")), processos=2, rfs=6, meses=30)
+
+def _referencia(caminho_detail):
+    """Totais por (Processo + RF, AAAAMM) em centavos, somados linha a linha pelas regras de negócio."""
+    totais = collections.defaultdict(lambda: [0] * 6)
+    with abrir_texto(caminho_detail) as f:
+        for linha in f:
+            if not LAYOUT_DETAIL.valida(linha):
+                continue
+            r = LAYOUT_DETAIL.decodificar(linha)
+            if r.dif_venc is None or r.dif_desc is None:
+                continue
+            ano = int(r.ano)
+            t = totais[r.chave, ano * 100 + int(r.mes)]
+            t[0] += r.dif_venc
+            t[1] += r.dif_desc
+            if r.codigo in agregacao.CODIGOS_IPREM:
+                t[2] += r.dif_desc
+            elif r.codigo in agregacao.CODIGOS_HSPM:
+                t[3] += r.dif_desc
+            elif r.codigo == CODIGO_FUNPREV:
+                t[2 if ano < ANO_REFORMA else 5] += r.dif_desc
+            elif r.codigo == CODIGO_FUNFIN:
+                t[3 if ano < ANO_REFORMA else 4] += r.dif_desc
+    return dict(totais)
+
+def _trocar_campo(linha, nome, valor):
+    campo = LAYOUT_DETAIL.por_nome[nome]
+    return linha[:campo.inicio] + valor.rjust(campo.fim - campo.inicio) + linha[campo.fim:]
+
+def _totais(mensal):
+    chaves, ids, competencias, totais = mensal.colunas()
+    return {(chaves[i], c): t for i, c, t in zip(ids.tolist(), competencias.tolist(), totais.tolist())}
+
+def test_dados_cobrem_a_reforma(dados):
+    with abrir_texto(dados[1]) as f:
+        vistos = {(l[27:31], int(l[23:27]) < ANO_REFORMA) for l in f}
+    for codigo in (CODIGO_FUNFIN, CODIGO_FUNPREV):
+        assert (codigo, True) in vistos and (codigo, False) in vistos
+
+def test_agregacao_por_registros(dados, monkeypatch):
+    # Lotes pequenos e compactação frequente: os totais parciais também são fundidos
+    monkeypatch.setattr(agregacao, "LOTES_ANTES_DE_COMPACTAR", 2)
+    referencia = _referencia(dados[1])
+    with abrir_detail(dados[1]) as detail:
+        registros = list(detail.registros())
+    agregador = AgregadorMensal()
+    for i in range(0, len(registros), 1000):
+        agregador.adicionar(registros[i:i + 1000])
+    assert _totais(agregador.resultado()) == referencia
+    assert _totais(agregar_mensal(registros)) == referencia
+
+def test_agregacao_na_indexacao(dados):
+    agregador = AgregadorMensal()
+    with abrir_detail(dados[1]) as detail:
+        detail.indexar(agregador)
+    mensal = agregador.resultado()
+    assert _totais(mensal) == _referencia(dados[1])
+    assert not mensal.erros
+
+def test_agregacao_linhas_invalidas(tmp_path):
+    # Linhas com espaços nos valores seguem pelo decodificador do layout; valor inválido invalida o RF
+    with abrir_texto(sintetico.gerar_dados(str(tmp_path), rfs=3, meses=24)[1]) as f:
+        linhas = [l.rstrip("\r\n") for l in f]
+    linhas[0] = _trocar_campo(linhas[0], "dif_venc", str(LAYOUT_DETAIL.decodificar(linhas[0]).dif_venc))
+    linhas[-1] = _trocar_campo(linhas[-1], "dif_venc", "XXX")
+    caminho = str(tmp_path / "detail.txt")
+    with open(caminho, "w", encoding="cp1252", newline="") as f:
+        f.write("".join(l + "\r\n" for l in linhas))
+
+    agregador = AgregadorMensal()
+    with abrir_detail(caminho) as detail:
+        detail.indexar(agregador)
+    mensal = agregador.resultado()
+    invalido = LAYOUT_DETAIL.decodificar(linhas[-1]).chave
+    assert list(mensal.erros) == [invalido]
+    referencia = {k: v for k, v in _referencia(caminho).items() if k[0] != invalido}
+    assert _totais(mensal) == referencia
+
+def _executar(dados, saida, motor=MOTOR_OPENPYXL, incremental=False):
+    # Os caminhos padrão dos templates, como na interface e no ddv
+    p_tpl_mdb, p_tpl_xls = caminhos_templates()
+    return executar_lote([Entrada(*dados, rotina=ROTINA)], str(saida), p_tpl_mdb, p_tpl_xls, max_workers=1,
+                         formatos=(FORMATO_XLSX,), motor_excel=motor, incremental=incremental, cache_leitura=None)
+
+def _planilhas(saida):
+    encontradas = {}
+    for pasta, _, arquivos in os.walk(saida):
+        for nome in arquivos:
+            if nome.endswith(".xlsx"):
+                caminho = os.path.join(pasta, nome)
+                encontradas[os.path.relpath(caminho, saida)] = caminho
+    return encontradas
+
+def _celulas(caminho):
+    """Valor e estilo de todas as células preenchidas ou formatadas, por aba."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        wb = openpyxl.load_workbook(caminho)
+    celulas = {}
+    for ws in wb:
+        celulas[ws.title, "dimensao"] = (ws.max_row, ws.max_column)
+        for linha in ws.iter_rows():
+            for c in linha:
+                if c.value is not None or c.has_style:
+                    # Os estilos do openpyxl são comparados pela representação (os proxies não implementam ==)
+                    celulas[ws.title, c.coordinate] = (c.value, c.number_format) + tuple(
+                        repr(e) for e in (c.font, c.fill, c.border, c.alignment, c.protection))
+    return celulas
+
+def test_motores_geram_planilhas_identicas(dados_planilhas, tmp_path):
+    for motor in (MOTOR_OPENPYXL, MOTOR_XML):
+        resumo = _executar(dados_planilhas, tmp_path / motor, motor)
+        assert resumo["erros"] == 0 and resumo["sucesso"] == 12
+    a, b = _planilhas(tmp_path / MOTOR_OPENPYXL), _planilhas(tmp_path / MOTOR_XML)
+    assert sorted(a) == sorted(b) and len(a) == 12
+    for relativo in a:
+        assert _celulas(a[relativo]) == _celulas(b[relativo]), relativo
+
+def test_manifesto_reaproveita_e_invalida(dados_planilhas, tmp_path):
+    saida = tmp_path / "saida"
+    assert _executar(dados_planilhas, saida, incremental=True)["reaproveitados"] == 0
+    assert _executar(dados_planilhas, saida, incremental=True)["reaproveitados"] == 12
+
+    # Planilha apagada e RF com uma linha Detail alterada: só esses dois são gerados de novo
+    planilhas = _planilhas(saida)
+    os.remove(planilhas[sorted(planilhas)[0]])
+    entradas = str(tmp_path / "entradas")
+    shutil.copytree(os.path.dirname(dados_planilhas[0]), entradas)
+    copia = sintetico.caminhos_dados(entradas)
+    with open(copia[1], encoding="cp1252", newline="") as f:
+        linhas = f.read().split("\r\n")
+    linhas[-2] = _trocar_campo(linhas[-2], "dif_desc", "1")
+    with open(copia[1], "w", encoding="cp1252", newline="") as f:
+        f.write("\r\n".join(linhas))
+    resumo = _executar(copia, saida, incremental=True)
+    assert resumo["sucesso"] == 12 and resumo["reaproveitados"] == 10
+    assert len(_planilhas(saida)) == 12
+
+    # Outros índices mudam todas as planilhas
+    with open(copia[2], "a", encoding="cp1252", newline="") as f:
+        f.write("20991231" + "1,500000" + "\r\n")
+    assert _executar(copia, saida, incremental=True)["reaproveitados"] == 0
+
+@pytest.mark.parametrize("modulo, cache, carregar", [
+    ("excel", "_CACHE_TEMPLATE", "_snapshot_template"),
+    ("excel_xml", "_CACHE_PLANO", "obter_plano"),
+])
+def test_cache_de_templates_lru(modulo, cache, carregar, tmp_path, monkeypatch):
+    # O template usado a cada RF continua em memória enquanto outros entram e saem
+    modulo = __import__(modulo)
+    monkeypatch.setattr(modulo, "SNAPSHOTS_EM_CACHE", 2)
+    monkeypatch.setattr(modulo, cache, {})
+    caminhos = []
+    for nome in ("a", "b", "c"):
+        caminhos.append(str(tmp_path / f"{nome}.xlsx"))
+        shutil.copy(caminhos_templates()[1], caminhos[-1])
+    quente = getattr(modulo, carregar)(caminhos[0])
+    for outro in caminhos[1:]:
+        getattr(modulo, carregar)(outro)
+        assert getattr(modulo, carregar)(caminhos[0]) is quente
+    assert list(getattr(modulo, cache)) == [caminhos[2], caminhos[0]]
+
+def _gravar(path, conteudo=b"planilha"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(conteudo)
+
+def test_manifesto_reaproveita_em_outro_dia(tmp_path):
+    saida = str(tmp_path)
+    ontem = os.path.join("2000-01-01", "Processo_1 - CD 1", "R_1-2.xlsx")
+    hoje = os.path.join("2000-01-02", "Processo_1 - CD 1", "R_1-2.xlsx")
+    _gravar(os.path.join(saida, ontem))
+    m = Manifesto(saida)
+    m.registrar(ontem, "a")
+    m.gravar()
+
+    m = Manifesto(saida)
+    assert not m.atual(hoje, "b")
+    assert m.atual(hoje, "a")
+    with open(os.path.join(saida, hoje), "rb") as f:
+        assert f.read() == b"planilha"
+    m.gravar()
+
+    # Já na pasta do dia, a planilha continua valendo; alterada, não
+    assert Manifesto(saida).atual(hoje, "a")
+    _gravar(os.path.join(saida, hoje), b"planilha alterada")
+    assert not Manifesto(saida).atual(hoje, "a")
+
+def test_sintetico_codigos(tmp_path):
+    args = sintetico.criar_parser().parse_args(["--saida", str(tmp_path), "--codigos", "7011:3,0001:10"])
+    assert args.codigos == {"7011": 3, "0001": 10}
+    with pytest.raises(SystemExit):
+        sintetico.criar_parser().parse_args(["--saida", str(tmp_path), "--codigos", "7011:x"])
+
+def test_banco_sem_header(tmp_path):
+    ok, msg = banco.gerar_banco(banco.BANCO_SQLITE, [], [], str(tmp_path), ROTINA, None)
+    assert not ok and "Header" in msg
+    assert not os.listdir(tmp_path)
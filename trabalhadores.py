@@ -0,0 +1,88 @@
+"""
+Pool de processos persistente para a geração das planilhas.
+
+O pool sobrevive entre as execuções (e entre os reruns do Streamlit): quando uma nova
+execução começa, os trabalhadores já estão de pé, com os módulos importados e o template
+carregado. Antes de cada execução o pool é verificado e recriado se não responder.
+"""
+import sys
+import threading
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+from despacho import MOTOR_OPENPYXL, aquecer_trabalhador, verificar_trabalhador
+
+# Lotes processados por um trabalhador antes de ser substituído por um processo novo
+LOTES_POR_PROCESSO = 200
+
+# Tempo máximo (s) para o pool responder à verificação antes de ser recriado: a verificação é
+# feita no início de cada execução, com o pool ocioso, e segura a trava do pool enquanto espera
+TEMPO_VERIFICACAO = 5
+
+# Enquanto o pool ainda sobe (processos, importações e carga do template, mais lentos no spawn do
+# Windows e no executável), a verificação espera até este tempo (s): o aquecimento não é descartado
+TEMPO_PARTIDA = 120
+
+# Tempo máximo (s) de espera pelo término de cada trabalhador interrompido
+TEMPO_ENCERRAMENTO = 5
+
+class PoolTrabalhadores:
+    """ProcessPoolExecutor pré-aquecido, verificado e recriado sob demanda."""
+    # Os trabalhadores gravam as planilhas direto na saída (ver distribuido.PoolDistribuido)
+    em_memoria = False
+
+    def __init__(self, n_workers, template_path, motores=(MOTOR_OPENPYXL,)):
+        self.n_workers = n_workers
+        self._template_path = template_path
+        self._motores = tuple(motores)
+        self._trava = threading.Lock()
+        self._exe = None
+        self._aquecimento = []
+        self._iniciar()
+
+    def _iniciar(self):
+        opcoes = {}
+        # Reciclagem dos trabalhadores: disponível a partir do Python 3.11
+        if sys.version_info >= (3, 11):
+            opcoes['max_tasks_per_child'] = LOTES_POR_PROCESSO
+        self._exe = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.n_workers, initializer=aquecer_trabalhador,
+            initargs=(self._motores, self._template_path), **opcoes
+        )
+        # OTIMIZAÇÃO: sobe todos os trabalhadores agora, e não no primeiro clique do usuário
+        self._aquecimento = [self._exe.submit(verificar_trabalhador) for _ in range(self.n_workers)]
+
+    def saudavel(self):
+        # Pool ainda subindo: a verificação fica na fila atrás do aquecimento
+        subindo = not all(f.done() for f in self._aquecimento)
+        try:
+            self._exe.submit(verificar_trabalhador).result(timeout=TEMPO_PARTIDA if subindo else TEMPO_VERIFICACAO)
+            return True
+        except (BrokenProcessPool, concurrent.futures.TimeoutError, RuntimeError):
+            return False
+
+    def executor(self):
+        """Retorna o executor pronto para uso, recriando o pool se ele não responder."""
+        with self._trava:
+            if not self.saudavel():
+                self._exe.shutdown(wait=False, cancel_futures=True)
+                self._iniciar()
+            return self._exe
+
+    def interromper(self):
+        """Encerra na hora todos os trabalhadores, inclusive os ocupados, e sobe um pool novo."""
+        with self._trava:
+            # Os processos do pool só são acessíveis pelo atributo interno _processes do
+            # ProcessPoolExecutor (CPython 3.8+). Se ele deixar de existir, os trabalhadores
+            # ocupados não são mortos: terminam o lote atual, parando no sinal de cancelamento
+            processos = list((getattr(self._exe, "_processes", None) or {}).values())
+            self._exe.shutdown(wait=False, cancel_futures=True)
+            for p in processos:
+                p.terminate()
+            for p in processos:
+                p.join(TEMPO_ENCERRAMENTO)
+            self._iniciar()
+
+    def encerrar(self):
+        with self._trava:
+            self._exe.shutdown(wait=False, cancel_futures=True)